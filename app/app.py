@@ -1,17 +1,26 @@
 from flask import Flask, request, send_from_directory, jsonify
 from datetime import datetime, timezone, timedelta
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
 import logging
 import os
 import json
 import re
 import glob
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
 from logging.handlers import RotatingFileHandler
 
-import app.level_store as level_store
+import app.dedup_index as dedup_index
+import app.file_lock as file_lock
 import app.order_builder as order_builder
+import app.resident_stages as resident_stages
+import app.payload_cache as payload_cache
+import app.stage_pipeline as stage_pipeline
+import app.storage as storage
 import app.stage_tracker as stage_tracker
-import app.user_state as user_state
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 STATIC_DIR = os.path.join(BASE_DIR, "static")
@@ -70,6 +79,11 @@ def subject_runtime_dir(subject: str) -> str:
     return os.path.join(RUNTIME_DATA_DIR, normalize_subject(subject))
 
 
+def subject_storage(subject: str) -> storage.Storage:
+    """教科の実行時データ（結果・ステージ・履歴・レベル）の保存先。"""
+    return storage.get_storage(subject_runtime_dir(subject))
+
+
 def _questions_file_path(subject: str) -> str:
     return os.path.join(subject_static_dir(subject), "questions.json")
 
@@ -117,10 +131,20 @@ def _merge_question_data(
                 bucket.extend([item for item in value if isinstance(item, dict)])
 
 
-def _load_questions_from_directory(subject: str) -> Optional[Dict[str, Any]]:
+def _load_questions_from_directory(
+    subject: str, file_hashes: Optional[Dict[str, str]] = None
+) -> Optional[Dict[str, Any]]:
+    """Merge ``questions/*/*.json`` into one aggregate.
+
+    When ``file_hashes`` is given it is filled with relpath -> sha256 of every
+    source file that was read.
+    """
+
     questions_dir = _questions_dir_path(subject)
     if not os.path.isdir(questions_dir):
         return None
+    if file_hashes is None:
+        file_hashes = {}
 
     aggregate: Dict[str, Any] = {
         "questions": [],
@@ -131,95 +155,360 @@ def _load_questions_from_directory(subject: str) -> Optional[Dict[str, Any]]:
 
     meta_path = os.path.join(questions_dir, "meta.json")
     if os.path.exists(meta_path):
-        try:
-            with open(meta_path, encoding="utf-8") as fp:
-                meta_payload = json.load(fp)
-            if isinstance(meta_payload, dict):
-                aggregate["meta"] = meta_payload
-        except Exception:
-            pass
+        meta_payload, digest = _read_question_file(meta_path)
+        if digest is not None:
+            file_hashes["meta.json"] = digest
+        if isinstance(meta_payload, dict):
+            aggregate["meta"] = meta_payload
 
+    jobs: List[Tuple[str, str]] = []
     pattern = os.path.join(questions_dir, "*", "*.json")
     for path in sorted(glob.glob(pattern)):
         parent_name = os.path.basename(os.path.dirname(path))
         group_key = _question_group_from_dir_name(parent_name)
-        if not group_key:
-            continue
-        try:
-            with open(path, encoding="utf-8") as fp:
-                payload = json.load(fp)
-        except Exception:
-            continue
-        _merge_question_data(aggregate, payload, group_key)
+        if group_key:
+            jobs.append((path, group_key))
+
+    paths = [path for path, _ in jobs]
+    workers = min(_question_load_workers(), len(paths))
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            payloads = list(pool.map(_read_question_file, paths))
+    else:
+        payloads = [_read_question_file(path) for path in paths]
+
+    # map() は入力順を保つので、マージ順はソート済みパス順のまま。
+    for (path, group_key), (payload, digest) in zip(jobs, payloads):
+        if digest is not None:
+            file_hashes[_source_relpath(questions_dir, path)] = digest
+        if payload is not _MISSING:
+            _merge_question_data(aggregate, payload, group_key)
 
     return aggregate
 
 
-def _load_questions_file(subject: str) -> Optional[Dict[str, Any]]:
-    path = _questions_file_path(subject)
-    if not os.path.exists(path):
-        return _load_questions_from_directory(subject)
+def _question_load_workers() -> int:
+    # JSON の解析は GIL を握るため、既定は直列。I/O が遅いストレージ
+    # （ネットワークディスクなど）でだけ QUESTION_LOAD_WORKERS で並列にする。
+    raw = os.getenv("QUESTION_LOAD_WORKERS")
+    if raw:
+        try:
+            return max(1, int(raw))
+        except ValueError:
+            pass
+    return 1
+
+
+def _read_question_file(path: str) -> Tuple[Any, Optional[str]]:
+    """Return (parsed payload or _MISSING, sha256 of the bytes or None)."""
+
     try:
-        with open(path, encoding="utf-8") as fp:
-            data = json.load(fp)
+        with open(path, "rb") as fp:
+            raw = fp.read()
+    except OSError:
+        return _MISSING, None
+    digest = hashlib.sha256(raw).hexdigest()
+    try:
+        return json.loads(raw.decode("utf-8")), digest
     except Exception:
-        return {}
+        return _MISSING, digest
+
+
+def _file_signature(path: str) -> Optional[Tuple[str, int, int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (path, st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _compiled_questions_path(subject: str) -> str:
+    return os.path.join(subject_static_dir(subject), "questions.compiled.json")
+
+
+COMPILED_QUESTIONS_FORMAT = 2
+
+
+def _questions_source_signature(subject: str) -> Tuple[Any, ...]:
+    """Describe the on-disk sources of a subject's bank without reading them."""
+
+    file_sig = _file_signature(_questions_file_path(subject))
+    if file_sig is not None:
+        return ("file", file_sig)
+    questions_dir = _questions_dir_path(subject)
+    if not os.path.isdir(questions_dir):
+        return ("missing", questions_dir)
+    paths = [os.path.join(questions_dir, "meta.json")]
+    paths.extend(sorted(glob.glob(os.path.join(questions_dir, "*", "*.json"))))
+    signatures = [sig for sig in (_file_signature(p) for p in paths) if sig]
+    compiled_sig = _file_signature(_compiled_questions_path(subject))
+    return ("dir", questions_dir, tuple(signatures), compiled_sig)
+
+
+def _source_relpath(questions_dir: str, path: str) -> str:
+    return os.path.relpath(path, questions_dir).replace(os.sep, "/")
+
+
+def _source_relpaths(questions_dir: str, signatures: Tuple[Any, ...]) -> List[str]:
+    return [_source_relpath(questions_dir, sig[0]) for sig in signatures]
+
+
+def _content_version(file_hashes: Dict[str, str]) -> str:
+    """Derive the bank's content version token from per-file hashes."""
+
+    digest = hashlib.sha256()
+    for relpath in sorted(file_hashes):
+        digest.update(f"{relpath}:{file_hashes[relpath]}\n".encode())
+    return digest.hexdigest()[:20]
+
+
+def _load_compiled_questions(
+    subject: str, signature: Tuple[Any, ...]
+) -> Optional[Tuple[Dict[str, Any], Dict[str, str]]]:
+    """Return (bank, source hashes) when the artifact is newer than every source."""
+
+    _, questions_dir, sources, compiled_sig = signature
+    if compiled_sig is None:
+        return None
+    newest_source = max((sig[2] for sig in sources), default=0)
+    if compiled_sig[2] < newest_source:
+        return None
+    try:
+        with open(compiled_sig[0], encoding="utf-8") as fp:
+            artifact = json.load(fp)
+    except Exception:
+        return None
+    if not isinstance(artifact, dict):
+        return None
+    if artifact.get("format") != COMPILED_QUESTIONS_FORMAT:
+        return None
+    relpaths = _source_relpaths(questions_dir, sources)
+    if artifact.get("sources") != relpaths:
+        return None
+    data = artifact.get("data")
+    source_hashes = artifact.get("sourceHashes")
+    if not isinstance(data, dict) or not isinstance(source_hashes, dict):
+        return None
+    if sorted(source_hashes) != sorted(relpaths):
+        return None
+    return data, source_hashes
+
+
+def build_compiled_questions(subject: str) -> Optional[Dict[str, Any]]:
+    """Merge a subject's question directory into a single compiled artifact."""
+
+    signature = _questions_source_signature(subject)
+    if signature[0] != "dir":
+        return None
+    file_hashes: Dict[str, str] = {}
+    data = _load_questions_from_directory(subject, file_hashes)
+    if data is None:
+        return None
+    canonical = json.dumps(data, ensure_ascii=False, sort_keys=True)
+    return {
+        "format": COMPILED_QUESTIONS_FORMAT,
+        "contentHash": hashlib.sha256(canonical.encode("utf-8")).hexdigest(),
+        "sources": _source_relpaths(signature[1], signature[2]),
+        "sourceHashes": file_hashes,
+        "data": data,
+    }
+
+
+def write_compiled_questions(subject: str) -> Optional[Dict[str, Any]]:
+    """Build and atomically write the compiled artifact for ``subject``."""
+
+    artifact = build_compiled_questions(subject)
+    if artifact is None:
+        return None
+    path = _compiled_questions_path(subject)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fp:
+        json.dump(artifact, fp, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, path)
+    return artifact
+
+
+def _read_questions_source(
+    subject: str, signature: Tuple[Any, ...]
+) -> Tuple[Optional[Dict[str, Any]], Dict[str, str]]:
+    """Return (bank, relpath -> sha256 of each source file)."""
+
+    if signature[0] == "dir":
+        compiled = _load_compiled_questions(subject, signature)
+        if compiled is not None:
+            return compiled
+    file_hashes: Dict[str, str] = {}
+    path = _questions_file_path(subject)
+    if not os.path.exists(path):
+        return _load_questions_from_directory(subject, file_hashes), file_hashes
+    data, digest = _read_question_file(path)
+    if digest is not None:
+        file_hashes["questions.json"] = digest
     if not isinstance(data, dict):
-        return {}
-    return data
+        return {}, file_hashes
+    return data, file_hashes
+
+
+_QUESTION_RECORD_KEYS: Tuple[str, ...] = (
+    "questions",
+    "reorder",
+    "vocabChoice",
+    "vocab",
+    "rewrite",
+)
+
 
+def _build_question_index(
+    data: Optional[Dict[str, Any]],
+) -> Dict[str, List[Tuple[str, int]]]:
+    """Map normalized question id -> (group key, position) of each record."""
 
-def _iter_question_records(data: Dict[str, Any]):
-    keys = ("questions", "reorder", "vocabChoice", "vocab", "rewrite")
-    for key in keys:
+    index: Dict[str, List[Tuple[str, int]]] = {}
+    if not isinstance(data, dict):
+        return index
+    for key in _QUESTION_RECORD_KEYS:
         items = data.get(key)
         if not isinstance(items, list):
             continue
-        for item in items:
-            if isinstance(item, dict):
-                yield item
+        for pos, item in enumerate(items):
+            if not isinstance(item, dict):
+                continue
+            qid_norm = stage_tracker._normalize_qid(item.get("id"))  # type: ignore[attr-defined]
+            if qid_norm is not None:
+                index.setdefault(qid_norm, []).append((key, pos))
+    return index
+
+
+@dataclass(frozen=True)
+class _QuestionCacheEntry:
+    signature: Tuple[Any, ...]
+    data: Optional[Dict[str, Any]]
+    index: Dict[str, List[Tuple[str, int]]]
+    file_hashes: Dict[str, str] = field(default_factory=dict)
+    version: str = ""
+
+
+_QUESTION_CACHE: Dict[str, _QuestionCacheEntry] = {}
+_QUESTION_CACHE_LOCK = threading.Lock()
+
+
+def _load_questions_entry(subject: str) -> _QuestionCacheEntry:
+    key = normalize_subject(subject)
+    signature = _questions_source_signature(key)
+    entry = _QUESTION_CACHE.get(key)
+    if entry is not None and entry.signature == signature:
+        return entry
+    with _QUESTION_CACHE_LOCK:
+        entry = _QUESTION_CACHE.get(key)
+        if entry is not None and entry.signature == signature:
+            return entry
+        # シグネチャは読み込み前に取得する（読込中の更新は次回に再読込）。
+        data, file_hashes = _read_questions_source(key, signature)
+        entry = _QuestionCacheEntry(
+            signature,
+            data,
+            _build_question_index(data),
+            file_hashes=file_hashes,
+            version=_content_version(file_hashes),
+        )
+        _QUESTION_CACHE[key] = entry
+        return entry
 
 
-def _apply_level_overrides(
-    data: Dict[str, Any], overrides: Dict[str, str]
-) -> Dict[str, Any]:
-    if not overrides:
-        return data
-    for item in _iter_question_records(data):
-        qid_norm = stage_tracker._normalize_qid(item.get("id"))  # type: ignore[attr-defined]
-        if qid_norm and qid_norm in overrides:
-            item["level"] = overrides[qid_norm]
-    return data
+def _load_questions_file(subject: str) -> Optional[Dict[str, Any]]:
+    """Return the parsed bank for ``subject``.
 
+    The result is cached per subject and reloaded only when a source file's
+    mtime/size changes or files are added or removed. The returned structure is
+    shared between requests and must be treated as read-only.
+    """
 
-def _find_question_record(data: Dict[str, Any], qid: str) -> Optional[Dict[str, Any]]:
-    normalized_qid = stage_tracker._normalize_qid(qid)  # type: ignore[attr-defined]
-    if normalized_qid is None:
-        return None
-    for item in _iter_question_records(data):
-        qid_norm = stage_tracker._normalize_qid(item.get("id"))  # type: ignore[attr-defined]
-        if qid_norm == normalized_qid:
+    return _load_questions_entry(subject).data
+
+
+def _iter_valid_entries(items: Any) -> List[Dict[str, Any]]:
+    if not isinstance(items, list):
+        return []
+    return [item for item in items if isinstance(item, dict)]
+
+
+def _dump_json(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+class QuestionBankView:
+    """Read-only view of a cached bank with level overrides layered on top.
+
+    Base records are shared between requests and threads and are never
+    modified; the effective level is resolved through ``overrides`` when a
+    record is accessed via :meth:`level_of` or serialized via :meth:`to_json`.
+    """
+
+    __slots__ = ("entry", "overrides")
+
+    def __init__(self, entry: _QuestionCacheEntry, overrides: Dict[str, str]):
+        self.entry = entry
+        self.overrides = overrides
+
+    @property
+    def data(self) -> Dict[str, Any]:
+        return self.entry.data or {}
+
+    def level_of(self, item: Dict[str, Any]) -> Any:
+        if self.overrides:
+            qid_norm = stage_tracker._normalize_qid(item.get("id"))  # type: ignore[attr-defined]
+            if qid_norm is not None and qid_norm in self.overrides:
+                return self.overrides[qid_norm]
+        return item.get("level")
+
+    def find(self, qid: Any) -> Optional[Dict[str, Any]]:
+        normalized_qid = stage_tracker._normalize_qid(qid)  # type: ignore[attr-defined]
+        if normalized_qid is None:
+            return None
+        locations = self.entry.index.get(normalized_qid)
+        if not locations:
+            return None
+        key, pos = locations[0]
+        return self.data[key][pos]
+
+    def _overridden_groups(self) -> Set[str]:
+        groups: Set[str] = set()
+        for qid in self.overrides:
+            groups.update(key for key, _ in self.entry.index.get(qid, ()))
+        return groups
+
+    def effective_record(self, item: Any) -> Any:
+        if not isinstance(item, dict):
             return item
-    return None
+        level = self.level_of(item)
+        if level == item.get("level"):
+            return item
+        return {**item, "level": level}
 
+    def to_json(self) -> str:
+        data = self.data
+        groups = self._overridden_groups()
+        if not groups:
+            return _dump_json(data)
+        parts = []
+        for key, value in data.items():
+            if key in groups:
+                items = ",".join(
+                    _dump_json(self.effective_record(item)) for item in value
+                )
+                parts.append(f"{_dump_json(key)}:[{items}]")
+            else:
+                parts.append(f"{_dump_json(key)}:{_dump_json(value)}")
+        return "{" + ",".join(parts) + "}"
 
-def _build_questions_response(subject: str):
-    data = _load_questions_file(subject)
-    if data is None:
-        return jsonify({"error": "subject not found"}), 404
-    runtime_dir = subject_runtime_dir(subject)
-    overrides = level_store.load_levels(runtime_dir)
-    payload = _apply_level_overrides(dict(data), overrides) if overrides else data
-    return jsonify(payload)
 
+def _parse_level(value: Any) -> Optional[str]:
+    """Return the canonical level for ``value``, or ``None`` if unrecognized."""
 
-def _normalize_level(value: Any) -> str:
     try:
         text = str(value).strip()
     except Exception:
-        return order_builder.DEFAULT_LEVEL
-    if not text:
-        return order_builder.DEFAULT_LEVEL
+        return None
     if text in order_builder.LEVEL_ORDER:
         return text
     m = re.search(r"(\d+)", text)
@@ -227,65 +516,218 @@ def _normalize_level(value: Any) -> str:
         candidate = f"Lv{int(m.group(1))}"
         if candidate in order_builder.LEVEL_ORDER:
             return candidate
-    return order_builder.DEFAULT_LEVEL
+    return None
 
 
-def _build_question_entry(item: Dict[str, Any], qtype: str) -> Dict[str, Any]:
-    return {
-        "id": item.get("id"),
-        "type": qtype,
-        "level": _normalize_level(item.get("level")),
-        "unit": item.get("unit"),
-        "en": item.get("en"),
-        "jp": item.get("jp"),
-    }
+def _normalize_level(value: Any) -> str:
+    return _parse_level(value) or order_builder.DEFAULT_LEVEL
+
+
+def _build_question(
+    item: Dict[str, Any], qtype: str, level: Any
+) -> order_builder.Question:
+    normalized_level = _normalize_level(level)
+    return order_builder.Question(
+        id=stage_tracker._normalize_qid(item.get("id")),  # type: ignore[attr-defined]
+        type=qtype,
+        level=normalized_level,
+        level_index=order_builder.LEVEL_ORDER.index(normalized_level),
+        unit=order_builder.normalize_unit(item.get("unit")),
+        en=item.get("en"),
+        jp=item.get("jp"),
+        prompt=item.get("prompt"),
+        difficulty=_normalize_math_difficulty(item.get("difficulty")),
+    )
 
 
-def load_question_bank(subject: str) -> Optional[Dict[str, List[Dict[str, Any]]]]:
-    data = _load_questions_file(subject)
-    if data is None:
+QUESTION_TYPES: Tuple[str, ...] = ("reorder", "vocab-choice", "rewrite")
+
+
+def _deck_source_records(data: Dict[str, Any], qtype: str) -> List[Dict[str, Any]]:
+    if qtype == "reorder":
+        items = data.get("questions") or data.get("reorder") or []
+        return [item for item in items if isinstance(item, dict)]
+    if qtype == "vocab-choice":
+        vocab_choice = _iter_valid_entries(data.get("vocabChoice"))
+        vocab_choice.extend(
+            item
+            for item in _iter_valid_entries(data.get("vocab"))
+            if isinstance(item.get("choices"), list)
+        )
+        return vocab_choice
+    if qtype == "rewrite":
+        return _iter_valid_entries(data.get("rewrite"))
+    return []
+
+
+@dataclass
+class _BankCacheEntry:
+    key: Tuple[Any, ...]
+    view: QuestionBankView
+    decks: Dict[str, List[order_builder.Question]]
+    payload: Optional[payload_cache.SerializedPayload] = None
+    question_map: Optional[Dict[str, order_builder.Question]] = None
+    # qType -> 元レコード（decks と同じ並び）と (unit, level) -> 位置 の索引
+    deck_records: Dict[str, List[Dict[str, Any]]] = field(default_factory=dict)
+    slices: Dict[str, Dict[Tuple[str, str], List[int]]] = field(default_factory=dict)
+    token: str = ""
+
+
+_BANK_CACHE: Dict[str, _BankCacheEntry] = {}
+
+
+def _load_bank_entry(subject: str) -> Optional[_BankCacheEntry]:
+    """Return the per-subject bank view and its derived caches.
+
+    The entry is keyed on the question-bank signature plus the levels.json
+    version, so decks and serialized payloads are rebuilt only when either
+    changes.
+    """
+
+    key_subject = normalize_subject(subject)
+    source = _load_questions_entry(key_subject)
+    if source.data is None:
         return None
+    store = subject_storage(key_subject)
+    key = (source.signature, store.levels_version())
+    entry = _BANK_CACHE.get(key_subject)
+    if entry is None or entry.key != key:
+        view = QuestionBankView(source, store.load_levels())
+        entry = _BankCacheEntry(key=key, view=view, decks={}, token=_bank_token(view))
+        _BANK_CACHE[key_subject] = entry
+    return entry
 
-    runtime_dir = subject_runtime_dir(subject)
-    overrides = level_store.load_levels(runtime_dir)
-    if overrides:
-        data = _apply_level_overrides(dict(data), overrides)
 
-    vocab_choice: List[Dict[str, Any]] = []
-    vocab_choice.extend(
-        [item for item in data.get("vocabChoice", []) if isinstance(item, dict)]
-    )
-    if isinstance(data.get("vocab"), list):
-        for item in data.get("vocab", []):
-            if isinstance(item, dict) and isinstance(item.get("choices"), list):
-                vocab_choice.append(item)
+def _bank_token(view: QuestionBankView) -> str:
+    """Version token covering both the bank content and the level overrides."""
 
-    return {
-        "reorder": [
-            _build_question_entry(item, "reorder")
-            for item in data.get("questions") or data.get("reorder") or []
-            if isinstance(item, dict)
-        ],
-        "vocab-choice": [
-            _build_question_entry(item, "vocab-choice") for item in vocab_choice
-        ],
-        "rewrite": [
-            _build_question_entry(item, "rewrite")
-            for item in data.get("rewrite", [])
-            if isinstance(item, dict)
-        ],
-    }
+    overrides = view.overrides
+    if not overrides:
+        return f"{view.entry.version}.0"
+    canonical = json.dumps(overrides, sort_keys=True).encode("utf-8")
+    return f"{view.entry.version}.{hashlib.sha256(canonical).hexdigest()[:8]}"
+
+
+def _load_question_view(subject: str) -> Optional[QuestionBankView]:
+    entry = _load_bank_entry(subject)
+    return entry.view if entry is not None else None
+
+
+def _build_questions_response(subject: str):
+    entry = _load_bank_entry(subject)
+    if entry is None:
+        return jsonify({"error": "subject not found"}), 404
+    payload = entry.payload
+    if payload is None:
+        payload = payload_cache.SerializedPayload.from_text(entry.view.to_json())
+        entry.payload = payload
+    _register_delta_snapshot(normalize_subject(subject), entry)
+    response = _payload_response(payload, "application/json")
+    response.headers["X-Question-Version"] = entry.token
+    return response
+
+
+def _payload_response(payload: payload_cache.SerializedPayload, mimetype: str):
+    encoding = payload.select(request.headers.get("Accept-Encoding"))
+    if encoding:
+        response = app.response_class(payload.variants[encoding], mimetype=mimetype)
+        response.headers["Content-Encoding"] = encoding
+        response.set_etag(f"{payload.etag}-{encoding}")
+    else:
+        response = app.response_class(payload.body, mimetype=mimetype)
+        response.set_etag(payload.etag)
+    response.headers["Cache-Control"] = "no-cache"
+    response.vary.add("Accept-Encoding")
+    return response.make_conditional(request)
+
+
+_STATIC_PAGE_CACHE: Dict[str, Tuple[Any, payload_cache.SerializedPayload]] = {}
+
+
+def _static_page_response(name: str):
+    """Serve a static HTML page from precompressed, per-version cached bytes."""
+
+    path = os.path.join(app.static_folder or STATIC_DIR, name)
+    signature = _file_signature(path)
+    if signature is None:
+        return send_from_directory("static", name)
+    cached = _STATIC_PAGE_CACHE.get(name)
+    if cached is None or cached[0] != signature:
+        with open(path, "rb") as fp:
+            payload = payload_cache.SerializedPayload.from_bytes(fp.read())
+        cached = (signature, payload)
+        _STATIC_PAGE_CACHE[name] = cached
+    return _payload_response(cached[1], "text/html")
+
+
+def load_question_deck(
+    subject: str, qtype: str
+) -> Optional[List[order_builder.Question]]:
+    """Return the normalized deck for one qType, building it on first use.
+
+    Decks are cached per subject and rebuilt only when the question bank or
+    levels.json changes. The returned list is shared and must not be mutated.
+    """
+
+    entry = _load_bank_entry(subject)
+    if entry is None:
+        return None
+    return _ensure_deck(entry, qtype)
+
+
+def _ensure_deck(entry: _BankCacheEntry, qtype: str) -> List[order_builder.Question]:
+    deck = entry.decks.get(qtype)
+    if deck is None:
+        view = entry.view
+        records = _deck_source_records(view.data, qtype)
+        deck = [_build_question(item, qtype, view.level_of(item)) for item in records]
+        if qtype in QUESTION_TYPES:
+            entry.deck_records[qtype] = records
+            entry.slices[qtype] = _build_slice_index(deck)
+            entry.decks[qtype] = deck
+    return deck
+
+
+def _build_slice_index(
+    deck: List[order_builder.Question],
+) -> Dict[Tuple[str, str], List[int]]:
+    """Index deck positions by (unit, level); "" in either slot means any."""
+
+    index: Dict[Tuple[str, str], List[int]] = {}
+    for pos, question in enumerate(deck):
+        keys = {
+            ("", ""),
+            (question.unit, ""),
+            ("", question.level),
+            (question.unit, question.level),
+        }
+        for key in keys:
+            index.setdefault(key, []).append(pos)
+    return index
+
+
+def load_question_bank(
+    subject: str,
+) -> Optional[Dict[str, List[order_builder.Question]]]:
+    if _load_bank_entry(subject) is None:
+        return None
+    return {qtype: load_question_deck(subject, qtype) or [] for qtype in QUESTION_TYPES}
 
 
 # ===== 静的ページ =====
 @app.get("/")
 def index():
-    return send_from_directory("static", "index.html")
+    return _static_page_response("index.html")
 
 
 @app.get("/admin")
 def admin_page():
-    return send_from_directory("static", "admin.html")
+    return _static_page_response("admin.html")
+
+
+@app.get("/math.html")
+def math_page():
+    return _static_page_response("math.html")
 
 
 # 出題ファイル（フロントは /data/<subject>/questions.json を参照）
@@ -300,6 +742,171 @@ def get_questions():
     return _build_questions_response(DEFAULT_SUBJECT)
 
 
+# ===== 差分配信 =====
+QUESTION_DELTA_HISTORY = 16
+
+# 教科 -> {version token -> {(group, qid): record fingerprint}}（古いものから破棄）
+_DELTA_HISTORY: Dict[str, "OrderedDict[str, Optional[Dict[Tuple[str, str], str]]]"] = {}
+_DELTA_LOCK = threading.Lock()
+
+
+def _record_fingerprints(
+    view: QuestionBankView,
+) -> Optional[Dict[Tuple[str, str], str]]:
+    """Fingerprint every effective record keyed by (group, qid).
+
+    Returns ``None`` when records cannot be addressed individually (missing or
+    duplicate ids), in which case clients must fall back to a full download.
+    """
+
+    data = view.data
+    out: Dict[Tuple[str, str], str] = {}
+    for key in _QUESTION_RECORD_KEYS:
+        items = data.get(key)
+        if not isinstance(items, list):
+            continue
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            qid = stage_tracker._normalize_qid(item.get("id"))  # type: ignore[attr-defined]
+            if qid is None or (key, qid) in out:
+                return None
+            body = _dump_json(view.effective_record(item)).encode("utf-8")
+            out[(key, qid)] = hashlib.sha1(body).hexdigest()
+    meta = _dump_json(data.get("meta")).encode("utf-8")
+    out[("meta", "")] = hashlib.sha1(meta).hexdigest()
+    return out
+
+
+def _register_delta_snapshot(
+    subject: str, entry: _BankCacheEntry
+) -> Optional[Dict[Tuple[str, str], str]]:
+    with _DELTA_LOCK:
+        history = _DELTA_HISTORY.setdefault(subject, OrderedDict())
+        if entry.token in history:
+            history.move_to_end(entry.token)
+            return history[entry.token]
+    fingerprints = _record_fingerprints(entry.view)
+    with _DELTA_LOCK:
+        history[entry.token] = fingerprints
+        while len(history) > QUESTION_DELTA_HISTORY:
+            history.popitem(last=False)
+    return fingerprints
+
+
+@app.get("/api/questions/delta")
+def get_question_delta():
+    """Return records added, changed or removed since the client's version token.
+
+    ``full`` is true when the token is unknown (too old, or issued by another
+    process) and the client has to reload questions.json instead.
+    """
+
+    subject = normalize_subject(request.args.get("subject"))
+    since = (request.args.get("since") or "").strip()
+    entry = _load_bank_entry(subject)
+    if entry is None:
+        return jsonify({"error": "subject not found"}), 404
+
+    current = _register_delta_snapshot(subject, entry)
+    with _DELTA_LOCK:
+        previous = _DELTA_HISTORY.get(subject, {}).get(since)
+    payload: Dict[str, Any] = {
+        "subject": subject,
+        "since": since or None,
+        "version": entry.token,
+        "full": previous is None or current is None,
+        "added": {},
+        "changed": {},
+        "removed": {},
+    }
+    if payload["full"] or since == entry.token:
+        return jsonify(payload)
+
+    data = entry.view.data
+    positions: Dict[Tuple[str, str], int] = {}
+    for qid, locations in entry.view.entry.index.items():
+        for group, pos in locations:
+            positions[(group, qid)] = pos
+
+    for record_key, fingerprint in current.items():
+        old = previous.get(record_key)
+        if old == fingerprint:
+            continue
+        group, qid = record_key
+        if group == "meta":
+            payload["meta"] = data.get("meta")
+            continue
+        bucket = "added" if old is None else "changed"
+        record = entry.view.effective_record(data[group][positions[record_key]])
+        payload[bucket].setdefault(group, []).append(record)
+    for group, qid in previous:
+        if (group, qid) not in current and group != "meta":
+            payload["removed"].setdefault(group, []).append(qid)
+    return jsonify(payload)
+
+
+QUESTION_SLICE_DEFAULT_LIMIT = 100
+QUESTION_SLICE_MAX_LIMIT = 500
+
+
+@app.get("/api/questions")
+def get_question_slice():
+    """Return one qType/unit/level slice of the bank with cursor pagination."""
+
+    subject = normalize_subject(request.args.get("subject"))
+    qtype = (request.args.get("qType") or "reorder").strip()
+    if qtype not in QUESTION_TYPES:
+        return jsonify({"error": "unknown qType"}), 400
+    unit = order_builder.normalize_unit(request.args.get("unit"))
+    raw_level = (request.args.get("level") or "").strip()
+    level = _parse_level(raw_level) if raw_level else ""
+    if level is None:
+        return jsonify({"error": "unknown level"}), 400
+
+    # カーソルは "<版>:<オフセット>"。版が変わると並びがずれるので拒否する。
+    raw_cursor = (request.args.get("cursor") or "").strip()
+    cursor_version, _, raw_offset = raw_cursor.rpartition(":")
+    try:
+        offset = max(0, int(raw_offset or 0))
+        limit = int(request.args.get("limit") or QUESTION_SLICE_DEFAULT_LIMIT)
+    except ValueError:
+        return jsonify({"error": "invalid cursor or limit"}), 400
+    if raw_cursor and not cursor_version:
+        return jsonify({"error": "invalid cursor or limit"}), 400
+    limit = min(max(limit, 1), QUESTION_SLICE_MAX_LIMIT)
+
+    entry = _load_bank_entry(subject)
+    if entry is None:
+        return jsonify({"error": "subject not found"}), 404
+    if raw_cursor and cursor_version != entry.token:
+        response = jsonify({"error": "stale cursor", "version": entry.token})
+        response.headers["X-Question-Version"] = entry.token
+        return response, 409
+    _ensure_deck(entry, qtype)
+
+    positions = entry.slices[qtype].get((unit, level), [])
+    records = entry.deck_records[qtype]
+    page = positions[offset : offset + limit]
+    next_offset = offset + len(page)
+    response = jsonify(
+        {
+            "subject": subject,
+            "qType": qtype,
+            "unit": unit,
+            "level": level,
+            "version": entry.token,
+            "total": len(positions),
+            "items": [entry.view.effective_record(records[pos]) for pos in page],
+            "nextCursor": (
+                f"{entry.token}:{next_offset}" if next_offset < len(positions) else None
+            ),
+        }
+    )
+    response.headers["X-Question-Version"] = entry.token
+    return response
+
+
 # ===== 受信（結果保存） =====
 @app.post("/api/results")
 def save_results():
@@ -308,27 +915,109 @@ def save_results():
     rec["subject"] = subject
     rec["receivedAt"] = datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
 
-    target_dir = subject_runtime_dir(subject)
-    os.makedirs(target_dir, exist_ok=True)
-    path = os.path.join(target_dir, "results.ndjson")
-    with open(path, "a", encoding="utf-8") as f:
-        f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+    store = subject_storage(subject)
+    dedup = dedup_index.get_index(store)
+    if not dedup.reserve(rec):
+        # 再送された同じセッションは保存も反映もせず、成功として返す。
+        return jsonify({"ok": True, "duplicate": True}), 200
+    # file 保存では同時に届いた結果をまとめて書き込む（コミット後に 201）。
+    try:
+        store.append_result(rec)
+    except Exception:
+        dedup.release(rec)
+        raise
+
+    if stage_pipeline.mode_from_env() == "async":
+        # ステージ更新はバックグラウンドでまとめて適用する。
+        stage_pipeline.get_pipeline(store).submit(rec)
+        return jsonify({"ok": True}), 201
 
     try:
-        stage_tracker.update_store_from_session(target_dir, rec)
+        store.update_stages(rec)
     except Exception:
         app.logger.exception("failed to update stage cache for subject=%s", subject)
 
     return jsonify({"ok": True}), 201
 
 
+@app.post("/api/results/bulk")
+def save_results_bulk():
+    """オフライン中に溜めたセッションをまとめて保存する。
+
+    ``{"sessions": [...]}`` または配列をそのまま受け付け、科目ごとに1回の
+    書き込みで結果ログへ追記し、ステージは終了時刻順に1回のロード/保存で適用する。
+    """
+    payload = request.get_json(force=True, silent=True)
+    default_subject = request.args.get("subject")
+    if isinstance(payload, dict):
+        default_subject = payload.get("subject") or default_subject
+        payload = payload.get("sessions")
+    if not isinstance(payload, list):
+        return jsonify({"ok": False, "error": "sessions array required"}), 400
+
+    received_at = datetime.now(timezone.utc)
+    received_iso = received_at.isoformat().replace("+00:00", "Z")
+    results: List[Dict[str, Any]] = []
+    grouped: Dict[str, List[Tuple[int, Dict[str, Any]]]] = {}
+    for index, rec in enumerate(payload):
+        if not isinstance(rec, dict):
+            results.append({"index": index, "ok": False, "error": "invalid session"})
+            continue
+        rec = dict(rec)
+        subject = normalize_subject(rec.get("subject") or default_subject)
+        rec["subject"] = subject
+        rec["receivedAt"] = received_iso
+        grouped.setdefault(subject, []).append((index, rec))
+        results.append({"index": index, "ok": True, "subject": subject})
+
+    for subject, items in grouped.items():
+        store = subject_storage(subject)
+        dedup = dedup_index.get_index(store)
+        fresh = []
+        for index, rec in items:
+            if dedup.reserve(rec):
+                fresh.append((index, rec))
+            else:
+                results[index]["duplicate"] = True
+        if not fresh:
+            continue
+        records = [rec for _, rec in fresh]
+        try:
+            store.append_results(records)
+        except Exception:
+            app.logger.exception("failed to store bulk results for subject=%s", subject)
+            for index, rec in fresh:
+                dedup.release(rec)
+                results[index] = {"index": index, "ok": False, "error": "store failed"}
+            continue
+
+        # 端末で記録された順に適用する（時刻が無いものは受信時刻扱い）。
+        ordered = sorted(
+            records,
+            key=lambda r: _parse_timestamp(r.get("endedAt")) or received_at,
+        )
+        if stage_pipeline.mode_from_env() == "async":
+            pipeline = stage_pipeline.get_pipeline(store)
+            for rec in ordered:
+                pipeline.submit(rec)
+            continue
+        try:
+            store.update_stages_batch(ordered)
+        except Exception:
+            app.logger.exception("failed to update stage cache for subject=%s", subject)
+
+    accepted = sum(1 for item in results if item["ok"])
+    stored = sum(1 for item in results if item["ok"] and not item.get("duplicate"))
+    status = 201 if stored else (200 if accepted else 400)
+    return jsonify({"ok": accepted > 0, "stored": stored, "results": results}), status
+
+
 @app.get("/api/history")
 def get_history():
     user = (request.args.get("user") or "").strip()
     subject = normalize_subject(request.args.get("subject"))
-    runtime_dir = subject_runtime_dir(subject)
 
-    history = user_state.get_history(runtime_dir, user)
+    history = subject_storage(subject).get_history(user)
     return jsonify({"history": history})
 
 
@@ -337,7 +1026,6 @@ def append_history():
     payload = request.get_json(silent=True) or {}
     user = (payload.get("user") or request.args.get("user") or "").strip()
     subject = normalize_subject(payload.get("subject") or request.args.get("subject"))
-    runtime_dir = subject_runtime_dir(subject)
 
     session = payload.get("session")
     if not isinstance(session, dict):
@@ -352,113 +1040,59 @@ def append_history():
     session.setdefault("user", normalized_user)
     session.setdefault("subject", subject)
 
-    user_state.append_history(runtime_dir, normalized_user, session)
+    subject_storage(subject).append_history(normalized_user, session)
     return jsonify({"ok": True})
 
 
 # ====== 管理ダッシュボード用ユーティリティ ======
-def _add_question_summary(
-    mapping: Dict[str, Dict[str, Any]],
-    qid: Any,
-    *,
-    jp: Any,
-    en: Any,
-    unit: Any,
-    level: Any,
-    qtype: str,
-) -> None:
-    if not qid:
-        return
-    key = str(qid)
-    mapping[key] = {
-        "id": key,
-        "jp": jp,
-        "en": en,
-        "unit": unit,
-        "level": _normalize_level(level),
-        "type": qtype,
-    }
-
-
-def _iter_valid_entries(items: Any) -> List[Dict[str, Any]]:
-    if not isinstance(items, list):
-        return []
-    return [item for item in items if isinstance(item, dict)]
-
-
 def load_questions_map(subject: str = DEFAULT_SUBJECT):
     """
-    static/data/questions.json を読み、id -> {jp,en,unit,type} にまとめる。
-    並べ替え（questions）と単語選択（vocabChoice）をサポート。
+    問題バンクを読み、id -> Question（jp,en,unit,level,type）にまとめる。
+    並べ替え・単語選択・書き換えをサポートし、結果は問題バンクと共にキャッシュされる。
     """
 
-    data = _load_questions_file(subject) or {}
-    runtime_dir = subject_runtime_dir(subject)
-    overrides = level_store.load_levels(runtime_dir)
-    if overrides:
-        data = _apply_level_overrides(dict(data), overrides)
-    qmap: Dict[str, Dict[str, Any]] = {}
-
-    for record in _iter_valid_entries(data.get("questions")):
-        _add_question_summary(
-            qmap,
-            record.get("id"),
-            jp=record.get("jp"),
-            en=record.get("en"),
-            unit=record.get("unit"),
-            level=record.get("level"),
-            qtype="reorder",
-        )
+    entry = _load_bank_entry(subject)
+    if entry is None:
+        return {}
+    qmap = entry.question_map
+    if qmap is None:
+        qmap = {}
+        for qtype in QUESTION_TYPES:
+            for question in load_question_deck(subject, qtype) or []:
+                if question.id is not None:
+                    qmap[question.id] = question
+        entry.question_map = qmap
+    return qmap
 
-    vocab_choice: List[Dict[str, Any]] = []
-    vocab_choice.extend(_iter_valid_entries(data.get("vocabChoice")))
-
-    for entry in _iter_valid_entries(data.get("vocab")):
-        choices = entry.get("choices")
-        if isinstance(choices, list) and choices:
-            vocab_choice.append(entry)
-
-    for record in vocab_choice:
-        _add_question_summary(
-            qmap,
-            record.get("id"),
-            jp=record.get("jp"),
-            en=record.get("en"),
-            unit=record.get("unit"),
-            level=record.get("level"),
-            qtype="vocab-choice",
-        )
 
-    for record in _iter_valid_entries(data.get("rewrite")):
-        _add_question_summary(
-            qmap,
-            record.get("id"),
-            jp=record.get("jp"),
-            en=record.get("en"),
-            unit=record.get("unit"),
-            level=record.get("level"),
-            qtype="rewrite",
-        )
+def stream_results(
+    subject: str = DEFAULT_SUBJECT,
+    users: Optional[Set[str]] = None,
+    modes: Optional[Set[str]] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> Iterator[Dict[str, Any]]:
+    """保存済みの結果ログを1セッションずつ遅延して返す。
 
-    return qmap
+    封印済みセグメント（results.d/）→ results.ndjson の順に読む。絞り込みを渡すと、
+    一致し得ないセグメントは索引だけで飛ばし、行も json.loads の前に部分文字列で弾く。
+    """
 
+    yield from subject_storage(subject).iter_results(
+        users=users, modes=modes, since=since, until=until
+    )
 
-def iter_results(subject: str = DEFAULT_SUBJECT):
-    """保存済みの results.ndjson を配列で返す（1行=1セッション）。"""
-    path = os.path.join(subject_runtime_dir(subject), "results.ndjson")
-    if not os.path.exists(path):
-        return []
-    out = []
-    with open(path, encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                out.append(json.loads(line))
-            except Exception:
-                continue
-    return out
+
+def iter_results(
+    subject: str = DEFAULT_SUBJECT,
+    users: Optional[Set[str]] = None,
+    modes: Optional[Set[str]] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> List[Dict[str, Any]]:
+    """stream_results の配列版（同じ記録を何度も走査する集計向け）。"""
+
+    return list(stream_results(subject, users, modes, since, until))
 
 
 def _accuracy_pct(correct: int, answered: int) -> float:
@@ -505,26 +1139,11 @@ def _normalize_math_difficulty(value: str) -> str:
     return "hard" if text == "hard" else "normal"
 
 
-def load_math_questions_map(subject: str) -> Dict[str, Dict[str, Any]]:
-    """Return a mapping of math question id -> metadata for the dashboard."""
+def load_math_questions_map(subject: str) -> Dict[str, order_builder.Question]:
+    """Return a mapping of math question id -> Question for the dashboard."""
 
-    data = _load_questions_file(subject) or {}
-    questions = _iter_valid_entries(data.get("questions"))
-    if not questions:
-        return {}
-
-    out: Dict[str, Dict[str, Any]] = {}
-    for item in questions:
-        qid = item.get("id")
-        if not qid:
-            continue
-        qid_str = str(qid)
-        out[qid_str] = {
-            "id": qid_str,
-            "prompt": item.get("prompt"),
-            "difficulty": _normalize_math_difficulty(item.get("difficulty")),
-        }
-    return out
+    deck = load_question_deck(subject, "reorder") or []
+    return {question.id: question for question in deck if question.id}
 
 
 def _first_math_answer(record: dict) -> Dict[str, Any]:
@@ -587,7 +1206,9 @@ def math_accuracy():
     raw_user_filter = (request.args.get("user") or "").strip()
     user_filter = _normalize_math_user(raw_user_filter) if raw_user_filter else ""
 
-    results = iter_results(subject)
+    # guest は "math" 名義の記録も含むため、セグメントの絞り込みには使わない。
+    user_scope = {user_filter} if user_filter and user_filter != "guest" else None
+    results = stream_results(subject, users=user_scope, modes={"math-drill"})
 
     totals_answered = 0
     totals_correct = 0
@@ -671,7 +1292,7 @@ def math_accuracy():
 @app.get("/api/math/results")
 def math_results():
     subject = normalize_subject(request.args.get("subject") or "math")
-    results = iter_results(subject)
+    results = stream_results(subject, modes={"math-drill"})
 
     items = []
     for record in results:
@@ -715,7 +1336,7 @@ def math_dashboard():
     query = (request.args.get("q") or "").strip()
     query_lower = query.lower()
 
-    results = iter_results(subject)
+    results = stream_results(subject, modes={"math-drill"})
 
     attempts: List[Dict[str, Any]] = []
     user_totals: Dict[str, Dict[str, Any]] = {}
@@ -874,24 +1495,10 @@ def math_dashboard():
     stage_states: Dict[str, Dict[str, Any]] = {}
 
     if user_filter:
-        runtime_dir = subject_runtime_dir(subject)
-        stage_store = stage_tracker.load_store(runtime_dir)
-
         normalized_user = (user_filter or "").strip() or "guest"
-        if isinstance(stage_store, dict):
-            try:
-                stage_states = stage_tracker.get_question_states(
-                    stage_store,
-                    normalized_user,
-                    [item.get("id") for item in question_stats if item.get("id")],
-                )
-            except Exception:
-                stage_states = {}
-            user_bucket = stage_store.get(normalized_user)
-            if not isinstance(user_bucket, dict):
-                user_bucket = {}
-        else:
-            user_bucket = {}
+        user_bucket = subject_storage(subject).load_user_stages(normalized_user)
+        qids = {str(item.get("id")) for item in question_stats if item.get("id")}
+        stage_states = {qid: state for qid, state in user_bucket.items() if qid in qids}
 
         for item in question_stats:
             qid = item.get("id")
@@ -1028,14 +1635,12 @@ def build_order_api():
         subject,
     )
 
-    bank = load_question_bank(subject)
-    if bank is None:
-        app.logger.info("[order] subject not found: %s", subject)
-        return jsonify({"error": "subject not found"}), 404
-
     raw_qtype = body.get("qType") or request.args.get("qType") or body.get("type") or ""
     qtype = (raw_qtype or "reorder").strip()
-    deck = bank.get(qtype) or []
+    deck = load_question_deck(subject, qtype)
+    if deck is None:
+        app.logger.info("[order] subject not found: %s", subject)
+        return jsonify({"error": "subject not found"}), 404
 
     app.logger.info(
         "[order] deck resolved qType=%s size=%s mode=%s unitFilter=%s",
@@ -1056,10 +1661,8 @@ def build_order_api():
         body.get("unitFilter") or request.args.get("unitFilter") or ""
     ).strip()
 
-    runtime_dir = subject_runtime_dir(subject)
-    store = stage_tracker.load_store(runtime_dir)
     ids = [str(q.get("id")) for q in deck if q.get("id") not in (None, "")]
-    state_map = stage_tracker.get_question_states(store, user, ids)
+    state_map = subject_storage(subject).get_order_stats(user, ids)
     default_stage = stage_tracker.get_stage_config(subject).default_stage
     stats_lookup: Dict[str, Dict[str, Any]] = {}
     for qid in ids:
@@ -1131,9 +1734,7 @@ def question_stats_bulk():
     if not normalized_ids:
         return jsonify({"results": []})
 
-    runtime_dir = subject_runtime_dir(subject)
-    store = stage_tracker.load_store(runtime_dir)
-    state_map = stage_tracker.get_question_states(store, user, normalized_ids)
+    state_map = subject_storage(subject).get_question_states(user, normalized_ids)
 
     results = [
         _state_to_payload(qid, state_map.get(qid), subject) for qid in normalized_ids
@@ -1152,20 +1753,15 @@ def question_stat():
             {"answered": 0, "correct": 0, "streak": 0, "stage": default_stage}
         )
 
-    runtime_dir = subject_runtime_dir(subject)
-    store = stage_tracker.load_store(runtime_dir)
-    state = stage_tracker.get_question_state(store, user, qid)
-    cached_results = None
-
-    if state is None:
-        cached_results = iter_results(subject)
+    store = subject_storage(subject)
+    state = store.get_question_state(user, qid)
 
     if state is not None:
         payload = _state_to_payload(str(qid), state, subject)
         payload.pop("id", None)
         return jsonify(payload)
 
-    results = cached_results if cached_results is not None else iter_results(subject)
+    attempts = store.question_attempts(user, qid)
 
     def parse_iso(dt_str):
         if not dt_str:
@@ -1178,36 +1774,24 @@ def question_stat():
             dt = dt.replace(tzinfo=timezone.utc)
         return dt
 
-    attempts = []
     last_wrong_at = None
     last_wrong_dt = None
     last_correct_at = None
     last_correct_dt = None
 
-    for r in results:
-        if r.get("user") != user:
+    for attempt in attempts:
+        at = attempt["at"]
+        at_dt = parse_iso(at)
+        if not at_dt:
             continue
-        ans = r.get("answered") or []
-        for a in ans:
-            if (a.get("mode") or r.get("mode") or "normal") == "review":
-                continue
-            if str(a.get("id") or "") != qid:
-                continue
-            at = a.get("at") or r.get("endedAt") or r.get("receivedAt") or ""
-            is_correct = bool(a.get("correct"))
-            attempts.append({"correct": is_correct, "at": at})
-
-            at_dt = parse_iso(at)
-            if not at_dt:
-                continue
-            if is_correct:
-                if not last_correct_dt or at_dt > last_correct_dt:
-                    last_correct_dt = at_dt
-                    last_correct_at = at
-            else:
-                if not last_wrong_dt or at_dt > last_wrong_dt:
-                    last_wrong_dt = at_dt
-                    last_wrong_at = at
+        if attempt["correct"]:
+            if not last_correct_dt or at_dt > last_correct_dt:
+                last_correct_dt = at_dt
+                last_correct_at = at
+        else:
+            if not last_wrong_dt or at_dt > last_wrong_dt:
+                last_wrong_dt = at_dt
+                last_wrong_at = at
 
     attempts.sort(key=lambda x: x["at"] or "")
     total = len(attempts)
@@ -1234,12 +1818,35 @@ def question_stat():
 
 
 # ====== /admin 用 API ======
+@app.get("/api/admin/metrics")
+def admin_metrics():
+    """運用監視用の指標（ステージ更新キューの深さ・遅延など）。"""
+
+    subject = normalize_subject(request.args.get("subject"))
+    store = subject_storage(subject)
+    stage_updates = {"mode": stage_pipeline.mode_from_env()}
+    stage_updates.update(stage_pipeline.get_pipeline(store).metrics())
+    stage_store = {"mode": resident_stages.mode_from_env()}
+    if store.name == "file" and stage_store["mode"] == "resident":
+        stage_store.update(resident_stages.get_store(store.runtime_dir).metrics())
+    return jsonify(
+        {
+            "subject": subject,
+            "storage": store.name,
+            "stageUpdates": stage_updates,
+            "stageStore": stage_store,
+            "dedup": dedup_index.get_index(store).metrics(),
+            "locks": file_lock.metrics(),
+        }
+    )
+
+
 @app.get("/api/admin/users")
 def admin_users():
     subject = normalize_subject(request.args.get("subject"))
-    res = iter_results(subject)
-    users = {}
     cutoff = datetime.now(timezone.utc) - timedelta(days=60)
+    res = stream_results(subject, since=cutoff)
+    users = {}
     for r in res:
         mode = r.get("mode") or "normal"
         session_at = r.get("endedAt") or r.get("receivedAt")
@@ -1323,14 +1930,7 @@ def admin_reset_progress():
     if normalized_qid is None:
         return jsonify({"ok": False, "error": "invalid question id"}), 400
 
-    runtime_dir = subject_runtime_dir(subject)
-    store = stage_tracker.load_store(runtime_dir)
-
-    stage_removed = False
-    if store:
-        stage_removed = stage_tracker.remove_question_state(store, user, raw_qid)
-        if stage_removed:
-            stage_tracker.save_store(runtime_dir, store)
+    stage_removed = subject_storage(subject).remove_stage(user, raw_qid)
     return jsonify(
         {
             "ok": True,
@@ -1374,16 +1974,15 @@ def admin_set_question_level():
         if normalized_level is None:
             return jsonify({"ok": False, "error": "invalid level"}), 400
 
-    data = _load_questions_file(subject)
-    if data is None:
+    view = _load_question_view(subject)
+    if view is None:
         return jsonify({"ok": False, "error": "subject not found"}), 404
 
-    record = _find_question_record(data, normalized_qid)
+    record = view.find(normalized_qid)
     if record is None:
         return jsonify({"ok": False, "error": "question not found"}), 404
 
-    runtime_dir = subject_runtime_dir(subject)
-    changed = level_store.set_level(runtime_dir, normalized_qid, normalized_level)
+    changed = subject_storage(subject).set_level(normalized_qid, normalized_level)
 
     effective_level = normalized_level or record.get("level")
 
@@ -1410,10 +2009,11 @@ def admin_summary():
     subject = normalize_subject(request.args.get("subject"))
 
     qmap = load_questions_map(subject)
-    res = iter_results(subject)
+    # 複数回走査するので配列で受け取るが、ユーザー指定時はその人の記録だけ読む。
+    user_scope = None if user in (None, "", "__all__") else {user}
+    res = iter_results(subject, users=user_scope)
 
-    runtime_dir = subject_runtime_dir(subject)
-    stage_store = stage_tracker.load_store(runtime_dir)
+    stage_store = subject_storage(subject).load_stages()
     if not isinstance(stage_store, dict):
         stage_store = {}
 
@@ -1759,8 +2359,6 @@ def admin_summary():
     recent = sorted(answered_all, key=lambda x: x.get("at") or "", reverse=True)[:100]
 
     for qid_key, meta in qmap.items():
-        if not isinstance(meta, dict):
-            continue
         qid_value = str(meta.get("id") or qid_key or "")
         if not qid_value:
             continue
@@ -0,0 +1,190 @@
+"""Duplicate detection for result sessions that clients retry.
+
+A session is identified by ``(user, sessionId or setIndex, endedAt)``. Each
+subject keeps the fingerprints (8-byte BLAKE2b digests) of its last
+``RESULTS_DEDUP_CAPACITY`` sessions in memory.
+
+The fingerprints are shared between worker processes through
+``dedup.keys`` in the subject's runtime directory: an append-only file of
+9-byte entries (``+`` or ``-`` followed by the digest). Every check runs
+under a ``file_lock`` on that file, first reads what other workers appended
+since the last check, then appends its own entry, so a retry that lands on
+another worker is still recognized. When the file grows past twice the
+capacity it is rewritten with the live keys. If the file does not exist yet
+it is seeded from the tail of the stored results.
+
+Sessions missing any key field are always accepted.
+``RESULTS_DEDUP_CAPACITY=0`` disables the check.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from . import file_lock
+from .stage_tracker import _normalize_user
+from .storage import Storage
+
+DEFAULT_CAPACITY = 100_000
+KEYS_FILE_NAME = "dedup.keys"
+
+_ADD = b"+"
+_REMOVE = b"-"
+_ENTRY_SIZE = 9
+
+
+def capacity_from_env() -> int:
+    try:
+        value = int(os.environ.get("RESULTS_DEDUP_CAPACITY") or DEFAULT_CAPACITY)
+    except ValueError:
+        value = DEFAULT_CAPACITY
+    return max(0, value)
+
+
+def session_key(record: Dict[str, Any]) -> Optional[bytes]:
+    ended_at = record.get("endedAt")
+    ident = record.get("sessionId")
+    if ident is None or ident == "":
+        ident = record.get("setIndex")
+    if not ended_at or ident is None or ident == "":
+        return None
+    user = record.get("user")
+    user = _normalize_user(user if isinstance(user, str) else str(user or ""))
+    raw = json.dumps([user, str(ident), str(ended_at)], ensure_ascii=False)
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=8).digest()
+
+
+class DedupIndex:
+    """Bounded, insertion-ordered set of recently stored session keys."""
+
+    def __init__(self, storage: Storage, capacity: int) -> None:
+        self.storage = storage
+        self.capacity = capacity
+        self.path = os.path.join(storage.runtime_dir, KEYS_FILE_NAME)
+        self._lock = threading.Lock()
+        self._keys: OrderedDict[bytes, None] = OrderedDict()
+        # dedup.keys のどこまで読んだか（ファイルが置き換わったら読み直す）。
+        self._file_id: Optional[Tuple[int, int]] = None
+        self._offset = 0
+        self._loaded = False
+        self.duplicates = 0
+
+    def _remember(self, key: bytes) -> None:
+        self._keys[key] = None
+        self._keys.move_to_end(key)
+        while len(self._keys) > self.capacity:
+            self._keys.popitem(last=False)
+
+    def _write_keys_locked(self) -> None:
+        data = b"".join(_ADD + key for key in self._keys)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as fp:
+            fp.write(data)
+        os.replace(tmp_path, self.path)
+        st = os.stat(self.path)
+        self._file_id = (st.st_dev, st.st_ino)
+        self._offset = len(data)
+
+    def _seed_locked(self) -> None:
+        self._keys.clear()
+        for record in self.storage.recent_results(self.capacity):
+            key = session_key(record)
+            if key is not None:
+                self._remember(key)
+        self._write_keys_locked()
+
+    def _sync_locked(self) -> None:
+        """Catch up with the entries other workers appended to ``dedup.keys``."""
+
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self._seed_locked()
+            self._loaded = True
+            return
+        if (st.st_dev, st.st_ino) != self._file_id or st.st_size < self._offset:
+            # 圧縮などで置き換わった。最初から読み直す。
+            self._keys.clear()
+            self._file_id = (st.st_dev, st.st_ino)
+            self._offset = 0
+        end = st.st_size - (st.st_size - self._offset) % _ENTRY_SIZE
+        if end < st.st_size:
+            # 書きかけの末尾は捨てる（残すと以後の追記がずれる）。
+            os.truncate(self.path, end)
+        if end > self._offset:
+            with open(self.path, "rb") as fp:
+                fp.seek(self._offset)
+                data = fp.read(end - self._offset)
+            for pos in range(0, len(data) - _ENTRY_SIZE + 1, _ENTRY_SIZE):
+                op, key = data[pos : pos + 1], data[pos + 1 : pos + _ENTRY_SIZE]
+                if op == _ADD:
+                    self._remember(key)
+                elif op == _REMOVE:
+                    self._keys.pop(key, None)
+            self._offset += len(data)
+        self._loaded = True
+
+    def _append_locked(self, op: bytes, key: bytes) -> None:
+        if self._offset >= 2 * self.capacity * _ENTRY_SIZE:
+            self._write_keys_locked()
+            return
+        with open(self.path, "ab") as fp:
+            fp.write(op + key)
+        self._offset += _ENTRY_SIZE
+
+    def reserve(self, record: Dict[str, Any]) -> bool:
+        """Remember ``record`` and return ``False`` if it was already stored.
+
+        The key is taken before the record is written so that a concurrent
+        retry is rejected too; call :meth:`release` if the write fails.
+        """
+
+        key = session_key(record)
+        if key is None or self.capacity <= 0:
+            return True
+        with file_lock.locked(self.path, KEYS_FILE_NAME), self._lock:
+            self._sync_locked()
+            if key in self._keys:
+                self._keys.move_to_end(key)
+                self.duplicates += 1
+                return False
+            self._remember(key)
+            self._append_locked(_ADD, key)
+            return True
+
+    def release(self, record: Dict[str, Any]) -> None:
+        key = session_key(record)
+        if key is None or self.capacity <= 0:
+            return
+        with file_lock.locked(self.path, KEYS_FILE_NAME), self._lock:
+            self._sync_locked()
+            self._keys.pop(key, None)
+            self._append_locked(_REMOVE, key)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "capacity": self.capacity,
+                "size": len(self._keys),
+                "loaded": self._loaded,
+                "duplicates": self.duplicates,
+            }
+
+
+_INDEXES: Dict[Tuple[str, str], DedupIndex] = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def get_index(storage: Storage) -> DedupIndex:
+    key = (storage.name, os.path.abspath(storage.runtime_dir))
+    with _INDEXES_LOCK:
+        index = _INDEXES.get(key)
+        if index is None:
+            index = _INDEXES[key] = DedupIndex(storage, capacity_from_env())
+        return index
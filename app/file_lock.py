@@ -0,0 +1,128 @@
+"""Advisory cross-process locks for the runtime JSON stores.
+
+``locked(path)`` serializes read-modify-write cycles on ``path`` between the
+threads of this process and, through ``fcntl.flock`` on ``<path>.lock``,
+between worker processes (e.g. several gunicorn workers). Locks are
+reentrant per thread, so helpers that lock internally can be called while
+the lock is already held. Where ``fcntl`` is unavailable only the in-process
+lock is taken.
+
+Time spent waiting is recorded per lock name and reported by ``metrics()``
+(per process).
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None  # type: ignore[assignment]
+
+
+class _PathLock:
+    def __init__(self, lock_path: str) -> None:
+        self.lock_path = lock_path
+        self.rlock = threading.RLock()
+        # 以下は rlock を持つスレッドだけが触る。
+        self.depth = 0
+        self.fd: Optional[int] = None
+
+
+class _WaitStats:
+    def __init__(self) -> None:
+        self.acquired = 0
+        self.contended = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+
+_LOCKS: Dict[str, _PathLock] = {}
+_STATS: Dict[str, _WaitStats] = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def _path_lock(path: str) -> _PathLock:
+    key = os.path.abspath(path)
+    with _REGISTRY_LOCK:
+        entry = _LOCKS.get(key)
+        if entry is None:
+            entry = _LOCKS[key] = _PathLock(f"{key}.lock")
+        return entry
+
+
+def _record(name: str, waited: float, contended: bool) -> None:
+    with _REGISTRY_LOCK:
+        stats = _STATS.get(name)
+        if stats is None:
+            stats = _STATS[name] = _WaitStats()
+        stats.acquired += 1
+        if contended:
+            stats.contended += 1
+        stats.wait_seconds += waited
+        stats.max_wait_seconds = max(stats.max_wait_seconds, waited)
+
+
+def _flock(fd: int) -> bool:
+    """Take the exclusive lock on ``fd``; returns ``True`` if it had to wait."""
+
+    if fcntl is None:
+        return False
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return False
+    except BlockingIOError:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return True
+
+
+@contextmanager
+def locked(path: str, name: Optional[str] = None) -> Iterator[None]:
+    """Hold the exclusive lock for ``path`` (metrics key ``name``)."""
+
+    entry = _path_lock(path)
+    started = time.monotonic()
+    contended = not entry.rlock.acquire(blocking=False)
+    if contended:
+        entry.rlock.acquire()
+    try:
+        if entry.depth == 0:
+            os.makedirs(os.path.dirname(entry.lock_path), exist_ok=True)
+            fd = os.open(entry.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                contended |= _flock(fd)
+            except BaseException:
+                os.close(fd)
+                raise
+            entry.fd = fd
+            waited = time.monotonic() - started
+            _record(name or os.path.basename(path), waited, contended)
+        entry.depth += 1
+        try:
+            yield
+        finally:
+            entry.depth -= 1
+            if entry.depth == 0 and entry.fd is not None:
+                # ファイルを閉じればロックも外れる。
+                os.close(entry.fd)
+                entry.fd = None
+    finally:
+        entry.rlock.release()
+
+
+def metrics() -> Dict[str, Dict[str, Any]]:
+    with _REGISTRY_LOCK:
+        return {
+            name: {
+                "acquired": stats.acquired,
+                "contended": stats.contended,
+                "waitSeconds": round(stats.wait_seconds, 6),
+                "maxWaitSeconds": round(stats.max_wait_seconds, 6),
+            }
+            for name, stats in sorted(_STATS.items())
+        }
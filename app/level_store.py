@@ -4,8 +4,9 @@ from __future__ import annotations
 
 import json
 import os
-from typing import Dict, Optional
+from typing import Dict, Optional, Tuple
 
+from . import file_lock
 from .stage_tracker import _normalize_qid
 
 
@@ -13,6 +14,16 @@ def _levels_file_path(runtime_dir: str) -> str:
     return os.path.join(runtime_dir, "levels.json")
 
 
+def levels_version(runtime_dir: str) -> Optional[Tuple[int, int, int]]:
+    """Return a token that changes whenever levels.json is rewritten or removed."""
+
+    try:
+        st = os.stat(_levels_file_path(runtime_dir))
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
 def load_levels(runtime_dir: str) -> Dict[str, str]:
     path = _levels_file_path(runtime_dir)
     if not os.path.exists(path):
@@ -58,20 +69,21 @@ def set_level(runtime_dir: str, qid: str, level: Optional[str]) -> bool:
     if normalized_qid is None:
         return False
 
-    overrides = load_levels(runtime_dir)
-
-    changed = False
-    if level is None or level == "":
-        if normalized_qid in overrides:
-            overrides.pop(normalized_qid, None)
-            changed = True
-    else:
-        if overrides.get(normalized_qid) != level:
-            overrides[normalized_qid] = level
-            changed = True
-
-    if changed:
-        _save_levels(runtime_dir, overrides)
+    with file_lock.locked(_levels_file_path(runtime_dir)):
+        overrides = load_levels(runtime_dir)
+
+        changed = False
+        if level is None or level == "":
+            if normalized_qid in overrides:
+                overrides.pop(normalized_qid, None)
+                changed = True
+        else:
+            if overrides.get(normalized_qid) != level:
+                overrides[normalized_qid] = level
+                changed = True
+
+        if changed:
+            _save_levels(runtime_dir, overrides)
 
     return changed
 
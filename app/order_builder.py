@@ -52,8 +52,49 @@ def normalize_level(value: Any) -> str:
     return DEFAULT_LEVEL
 
 
+@dataclass(frozen=True, slots=True)
+class Question:
+    """Immutable deck entry normalized once when the question bank loads.
+
+    ``get``/``[]`` mirror the dict entries the builder used to receive so that
+    plain mappings and ``Question`` objects can be mixed in a deck.
+    """
+
+    id: Optional[str]
+    type: str
+    level: str
+    level_index: int
+    unit: str
+    en: Any = None
+    jp: Any = None
+    prompt: Any = None
+    difficulty: Optional[str] = None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in Question.__slots__:
+            return getattr(self, key)
+        return default
+
+    def __getitem__(self, key: str) -> Any:
+        if key in Question.__slots__:
+            return getattr(self, key)
+        raise KeyError(key)
+
+
+def _level_index(question: Mapping[str, Any]) -> int:
+    if isinstance(question, Question):
+        return question.level_index
+    return LEVEL_ORDER.index(normalize_level(question.get("level")))
+
+
+def _question_unit(question: Mapping[str, Any]) -> str:
+    if isinstance(question, Question):
+        return question.unit
+    return normalize_unit(question.get("unit"))
+
+
 def question_key(question: Mapping[str, Any]) -> str:
-    if not isinstance(question, Mapping):
+    if not isinstance(question, (Mapping, Question)):
         return ""
     qid = question.get("id")
     if qid not in (None, ""):
@@ -186,19 +227,19 @@ def _is_mastered_stage(stage: Any) -> bool:
 def _determine_unlocked_level_idx(
     entries: Sequence[Tuple[int, Mapping[str, Any], Dict[str, Any]]],
 ) -> int:
+    totals = [0] * len(LEVEL_ORDER)
+    mastered_counts = [0] * len(LEVEL_ORDER)
+    for _, q, stat in entries:
+        level_idx = _level_index(q)
+        totals[level_idx] += 1
+        if _is_mastered_stage(stat.get("stage")):
+            mastered_counts[level_idx] += 1
+
     unlocked_idx = 0
-    for idx, level in enumerate(LEVEL_ORDER[:-1]):
-        level_entries = [
-            (q, stat)
-            for _, q, stat in entries
-            if normalize_level(q.get("level")) == level
-        ]
-        if not level_entries:
+    for idx in range(len(LEVEL_ORDER) - 1):
+        if not totals[idx]:
             break
-        mastered = sum(
-            1 for _, stat in level_entries if _is_mastered_stage(stat.get("stage"))
-        )
-        mastery_rate = mastered / len(level_entries)
+        mastery_rate = mastered_counts[idx] / totals[idx]
         if mastery_rate >= LEVEL_UNLOCK_MASTERY_THRESHOLD:
             unlocked_idx = idx + 1
         else:
@@ -215,11 +256,7 @@ def _filter_deck(
     if mode == "review":
         base = list(deck)
     else:
-        base = [
-            q
-            for q in deck
-            if not unit_filter or normalize_unit(q.get("unit")) == unit_filter
-        ]
+        base = [q for q in deck if not unit_filter or _question_unit(q) == unit_filter]
     return base
 
 
@@ -261,7 +298,7 @@ def build_order(
     entries = [
         (idx, q, stat)
         for idx, q, stat in entries
-        if LEVEL_ORDER.index(normalize_level(q.get("level"))) <= unlocked_level_idx
+        if _level_index(q) <= unlocked_level_idx
     ]
 
     # 5. 昇格優先（期限到来かつA/F以外）とそれ以外に振り分ける。
@@ -0,0 +1,82 @@
+"""Pre-serialized response bodies with strong validators.
+
+Large read-mostly payloads (the merged question bank, the big static pages)
+are encoded and compressed once per content version and reused across
+requests. The ETag is derived from the body bytes so identical content always
+yields the same validator.
+"""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+try:
+    import brotli  # type: ignore[import-not-found]
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+# 同じ品質値なら先に並んでいる方を優先する。
+SUPPORTED_ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body)
+    return gzip.compress(body, compresslevel=9, mtime=0)
+
+
+@dataclass(frozen=True)
+class SerializedPayload:
+    body: bytes
+    etag: str
+    variants: Dict[str, bytes] = field(default_factory=dict)
+
+    @classmethod
+    def from_bytes(cls, body: bytes) -> SerializedPayload:
+        variants = {
+            encoding: _compress(body, encoding) for encoding in SUPPORTED_ENCODINGS
+        }
+        # 圧縮しても小さくならない表現は配信しない。
+        variants = {k: v for k, v in variants.items() if len(v) < len(body)}
+        etag = hashlib.sha256(body).hexdigest()[:32]
+        return cls(body=body, etag=etag, variants=variants)
+
+    @classmethod
+    def from_text(cls, text: str) -> SerializedPayload:
+        return cls.from_bytes(text.encode("utf-8"))
+
+    def select(self, accept_encoding: Optional[str]) -> Optional[str]:
+        """Return the best stored encoding allowed by ``accept_encoding``."""
+
+        qualities = parse_accept_encoding(accept_encoding)
+        best: Optional[str] = None
+        best_q = 0.0
+        for encoding in SUPPORTED_ENCODINGS:
+            if encoding not in self.variants:
+                continue
+            q = qualities.get(encoding, qualities.get("*", 0.0))
+            if q > best_q:
+                best, best_q = encoding, q
+        return best
+
+
+def parse_accept_encoding(value: Optional[str]) -> Dict[str, float]:
+    qualities: Dict[str, float] = {}
+    for part in (value or "").split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, raw = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(raw)
+                except ValueError:
+                    q = 0.0
+        qualities[token] = q
+    return qualities
@@ -0,0 +1,314 @@
+"""Process-resident stage store with write-behind persistence.
+
+With ``STAGE_STORE_MODE=resident`` the file backend loads ``stages.json`` once
+per subject and serves every read from memory. Updates are applied in place
+and a background thread writes the whole store back (atomic replace) once
+``STAGE_FLUSH_AFTER`` changes are pending or ``STAGE_FLUSH_INTERVAL`` seconds
+have passed since the first unsaved change, and again at exit. With
+``STAGE_STORE_LAYOUT=sharded`` only the shards of changed users are written;
+with ``journal`` only the changed states are appended to the journal.
+States are held as compact ``StageState`` records (epoch-microsecond
+timestamps); readers get plain-dict copies, so the returned states can be
+used freely.
+
+The store is owned by this process: tools that rewrite ``stages.json``
+directly (e.g. ``scripts/rebuild_stage_store.py``) should run while the app
+is stopped. The default ``disk`` mode reads and writes the file per request.
+"""
+
+from __future__ import annotations
+
+import atexit
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from . import stage_tracker
+from .stage_tracker import StageState, _normalize_qid, _normalize_user
+
+MODES = ("disk", "resident")
+DEFAULT_FLUSH_INTERVAL = 2.0
+DEFAULT_FLUSH_AFTER = 100
+
+logger = logging.getLogger(__name__)
+
+
+def mode_from_env() -> str:
+    value = (os.environ.get("STAGE_STORE_MODE") or "disk").strip().lower()
+    return value if value in MODES else "disk"
+
+
+def _flush_limits_from_env() -> Tuple[float, int]:
+    try:
+        interval = float(
+            os.environ.get("STAGE_FLUSH_INTERVAL") or DEFAULT_FLUSH_INTERVAL
+        )
+    except ValueError:
+        interval = DEFAULT_FLUSH_INTERVAL
+    try:
+        after = int(os.environ.get("STAGE_FLUSH_AFTER") or DEFAULT_FLUSH_AFTER)
+    except ValueError:
+        after = DEFAULT_FLUSH_AFTER
+    return max(0.0, interval), max(1, after)
+
+
+def _iso(epoch: Optional[float]) -> Optional[str]:
+    if epoch is None:
+        return None
+    dt = datetime.fromtimestamp(epoch, tz=timezone.utc)
+    return dt.isoformat().replace("+00:00", "Z")
+
+
+class ResidentStageStore:
+    """In-memory ``stages.json`` of one subject plus its flusher thread."""
+
+    def __init__(
+        self,
+        runtime_dir: str,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        flush_after: int = DEFAULT_FLUSH_AFTER,
+    ) -> None:
+        self.runtime_dir = runtime_dir
+        self.flush_interval = flush_interval
+        self.flush_after = max(1, flush_after)
+        self._lock = threading.Condition()
+        self._store: Dict[str, Dict[str, StageState]] = stage_tracker.compact_store(
+            stage_tracker.load_store(runtime_dir)
+        )
+        self._dirty = 0
+        self._dirty_since: Optional[float] = None
+        # 変更のあった (user, qid)。None なら全体を書き出す。
+        self._dirty_keys: Optional[Set[Tuple[str, str]]] = set()
+        # 書き出しは1本ずつ（古いスナップショットで上書きしないように）。
+        self._write_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.flushes = 0
+        self.last_flush_at: Optional[float] = None
+
+    # --- reads -----------------------------------------------------------
+    def snapshot(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        with self._lock:
+            return stage_tracker.expand_store(self._store)
+
+    def user_states(self, user: str) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            bucket = self._store.get(_normalize_user(user))
+            if not isinstance(bucket, dict):
+                return {}
+            return {qid: state.to_dict() for qid, state in bucket.items()}
+
+    def get_question_states(
+        self, user: str, qids: Iterable[Any]
+    ) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return stage_tracker.get_question_states(self._store, user, qids)
+
+    def get_order_stats(
+        self, user: str, qids: Iterable[Any]
+    ) -> Dict[str, Dict[str, Any]]:
+        """Ordering fields read straight from the compact states.
+
+        ``nextDueAt`` is a ``datetime``, so neither side formats or parses
+        ISO strings.
+        """
+
+        with self._lock:
+            bucket = self._store.get(_normalize_user(user))
+            if not isinstance(bucket, dict):
+                return {}
+            stats: Dict[str, Dict[str, Any]] = {}
+            for raw_qid in qids:
+                qid = _normalize_qid(raw_qid)
+                state = bucket.get(qid) if qid is not None else None
+                if state is not None:
+                    stats[qid] = {
+                        "stage": state.stage_name,
+                        "streak": state.streak,
+                        "nextDueAt": state.next_due_datetime(),
+                    }
+            return stats
+
+    # --- writes ----------------------------------------------------------
+    def _mark_dirty_locked(self, keys: Optional[List[Tuple[str, str]]]) -> None:
+        """Record changed ``(user, qid)`` keys; ``None`` means the whole store."""
+
+        if keys is not None and not keys:
+            return
+        self._dirty += len(keys) if keys is not None else 1
+        if keys is None:
+            self._dirty_keys = None
+        elif self._dirty_keys is not None:
+            self._dirty_keys.update(keys)
+        if self._dirty_since is None:
+            self._dirty_since = time.monotonic()
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run,
+                name=f"stage-flush:{os.path.basename(self.runtime_dir)}",
+                daemon=True,
+            )
+            self._thread.start()
+        self._lock.notify_all()
+
+    def apply(self, records: Iterable[Dict[str, Any]]) -> bool:
+        changes: List[Tuple[str, str]] = []
+        with self._lock:
+            for record in records:
+                stage_tracker.apply_session(self._store, record, changes)
+            self._mark_dirty_locked(changes)
+        return bool(changes)
+
+    def remove(self, user: str, qid: Any) -> bool:
+        qid_key = _normalize_qid(qid)
+        if qid_key is None:
+            return False
+        with self._lock:
+            removed = stage_tracker.remove_question_state(self._store, user, qid)
+            if removed:
+                self._mark_dirty_locked([(_normalize_user(user), qid_key)])
+        return removed
+
+    def replace(self, store: Dict[str, Any]) -> None:
+        with self._lock:
+            self._store = stage_tracker.compact_store(store)
+            self._mark_dirty_locked(None)
+        # 再構築は件数に関係なくすぐ書き出す。
+        self.flush()
+
+    # --- persistence -----------------------------------------------------
+    def _due_locked(self) -> bool:
+        if not self._dirty:
+            return False
+        if self._dirty >= self.flush_after:
+            return True
+        assert self._dirty_since is not None
+        return time.monotonic() - self._dirty_since >= self.flush_interval
+
+    def _prepare_write_locked(
+        self, keys: Optional[Set[Tuple[str, str]]]
+    ) -> Callable[[], None]:
+        """Serialize what has to be written and return the write itself."""
+
+        runtime_dir = self.runtime_dir
+        layout = stage_tracker.layout_from_env()
+        if layout == "sharded":
+            shards = None if keys is None else {k[0] for k in keys}
+            texts = self._dump_shards_locked(shards)
+            return lambda: stage_tracker.write_shard_texts(
+                runtime_dir, texts, prune=keys is None
+            )
+        if layout == "journal" and keys is not None:
+            entries = stage_tracker.journal_entries(self._store, keys)
+            return lambda: stage_tracker.append_journal(runtime_dir, entries)
+        text = stage_tracker.dump_store(self._store)
+        if layout == "journal":
+            return lambda: stage_tracker.write_snapshot_text(runtime_dir, text)
+        return lambda: stage_tracker.write_store_text(runtime_dir, text)
+
+    def flush(self) -> bool:
+        """Write pending changes now; return ``True`` if anything was written."""
+
+        with self._write_lock:
+            with self._lock:
+                if not self._dirty:
+                    return False
+                # シリアライズだけロック内で行い、ファイル書き込みは外で行う。
+                keys = self._dirty_keys
+                write = self._prepare_write_locked(keys)
+                self._dirty = 0
+                self._dirty_since = None
+                self._dirty_keys = set()
+            try:
+                write()
+            except Exception:
+                with self._lock:
+                    self._dirty = max(self._dirty, 1)
+                    if self._dirty_since is None:
+                        self._dirty_since = time.monotonic()
+                    if keys is None or self._dirty_keys is None:
+                        self._dirty_keys = None
+                    else:
+                        self._dirty_keys.update(keys)
+                raise
+            with self._lock:
+                self.flushes += 1
+                self.last_flush_at = time.time()
+        return True
+
+    def _dump_shards_locked(
+        self, users: Optional[Set[str]]
+    ) -> Dict[str, Optional[str]]:
+        if users is None:
+            return {
+                shard: stage_tracker.dump_store(content)
+                for shard, content in stage_tracker.split_shards(self._store).items()
+            }
+        contents: Dict[str, Dict[str, Any]] = {
+            stage_tracker.shard_for_user(user): {} for user in users
+        }
+        for user, bucket in self._store.items():
+            shard = stage_tracker.shard_for_user(user)
+            if shard in contents:
+                contents[shard][user] = bucket
+        # 空になったシャードは削除する。
+        return {
+            shard: stage_tracker.dump_store(content) if content else None
+            for shard, content in contents.items()
+        }
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                while not self._due_locked():
+                    if self._dirty and self._dirty_since is not None:
+                        wait = self.flush_interval - (
+                            time.monotonic() - self._dirty_since
+                        )
+                        self._lock.wait(max(wait, 0.01))
+                    else:
+                        self._lock.wait()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("failed to flush stage store in %s", self.runtime_dir)
+                time.sleep(min(max(self.flush_interval, 0.1), 5.0))
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "users": len(self._store),
+                "dirty": self._dirty,
+                "flushes": self.flushes,
+                "lastFlushAt": _iso(self.last_flush_at),
+            }
+
+
+_STORES: Dict[str, ResidentStageStore] = {}
+_STORES_LOCK = threading.Lock()
+
+
+def get_store(runtime_dir: str) -> ResidentStageStore:
+    key = os.path.abspath(runtime_dir)
+    with _STORES_LOCK:
+        store = _STORES.get(key)
+        if store is None:
+            interval, after = _flush_limits_from_env()
+            store = _STORES[key] = ResidentStageStore(runtime_dir, interval, after)
+        return store
+
+
+def flush_all() -> None:
+    with _STORES_LOCK:
+        stores = list(_STORES.values())
+    for store in stores:
+        try:
+            store.flush()
+        except Exception:
+            logger.exception("failed to flush stage store in %s", store.runtime_dir)
+
+
+# 終了時に未保存の変更を書き出す（stage_pipeline の flush_all より後に動く）。
+atexit.register(flush_all)
@@ -0,0 +1,823 @@
+"""Append-only writer for per-subject ``results.ndjson`` files.
+
+Each file gets one long-lived :class:`ResultsAppender`. Concurrent callers
+queue their lines and whichever thread finds the writer idle becomes the
+leader: it writes every queued line in a single ``write`` call, applies the
+configured durability step and wakes the followers. ``append`` returns only
+after the caller's line is part of a committed batch.
+
+Durability (``RESULTS_DURABILITY``):
+
+* ``flush``    - hand the batch to the OS (default; survives a process crash)
+* ``fsync``    - fsync after every batch
+* ``interval`` - fsync at most every ``RESULTS_FSYNC_INTERVAL`` seconds; a
+  background thread syncs data left over after a burst, so nothing stays
+  unsynced for longer than the interval
+
+Once the active file exceeds ``RESULTS_SEGMENT_MAX_BYTES`` or its first record
+is older than ``RESULTS_SEGMENT_MAX_AGE`` seconds it is sealed into
+``results.d/seg-NNNNNN.ndjson`` next to a small ``.idx.json`` sidecar
+(count, min/max ``endedAt``, users, modes). Readers use the sidecars to skip
+segments that cannot match a filter; ``results.ndjson`` itself is always
+scanned, so the old single-file layout stays readable.
+"""
+
+from __future__ import annotations
+
+import atexit
+import contextlib
+import io
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Collection,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+from . import file_lock
+from .stage_tracker import _normalize_user, _parse_iso
+
+DURABILITY_MODES = ("flush", "fsync", "interval")
+DEFAULT_FSYNC_INTERVAL = 1.0
+
+SEGMENT_DIR_NAME = "results.d"
+SEGMENT_INDEX_FORMAT = 2
+DEFAULT_SEGMENT_MAX_BYTES = 8 * 1024 * 1024
+DEFAULT_SEGMENT_MAX_AGE = 0.0  # 秒。0 なら時間では区切らない
+
+logger = logging.getLogger(__name__)
+
+
+def _durability_from_env() -> Tuple[str, float]:
+    mode = (os.environ.get("RESULTS_DURABILITY") or "flush").strip().lower()
+    if mode not in DURABILITY_MODES:
+        mode = "flush"
+    try:
+        interval = float(
+            os.environ.get("RESULTS_FSYNC_INTERVAL") or DEFAULT_FSYNC_INTERVAL
+        )
+    except ValueError:
+        interval = DEFAULT_FSYNC_INTERVAL
+    return mode, max(0.0, interval)
+
+
+def _segment_limits_from_env() -> Tuple[int, float]:
+    try:
+        max_bytes = int(
+            os.environ.get("RESULTS_SEGMENT_MAX_BYTES") or DEFAULT_SEGMENT_MAX_BYTES
+        )
+    except ValueError:
+        max_bytes = DEFAULT_SEGMENT_MAX_BYTES
+    try:
+        max_age = float(
+            os.environ.get("RESULTS_SEGMENT_MAX_AGE") or DEFAULT_SEGMENT_MAX_AGE
+        )
+    except ValueError:
+        max_age = DEFAULT_SEGMENT_MAX_AGE
+    return max(0, max_bytes), max(0.0, max_age)
+
+
+# ===== セグメント =====
+def _record_time(record: Dict[str, Any]) -> Optional[datetime]:
+    return _parse_iso(record.get("endedAt") or record.get("receivedAt"))
+
+
+def _record_mode(record: Dict[str, Any]) -> str:
+    return str(record.get("mode") or "normal").lower()
+
+
+def _record_user(record: Dict[str, Any]) -> str:
+    user = record.get("user")
+    return _normalize_user(user if isinstance(user, str) else str(user or ""))
+
+
+def _decode_line(line: Any) -> Optional[Dict[str, Any]]:
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        record = json.loads(line)
+    except Exception:
+        return None
+    return record if isinstance(record, dict) else None
+
+
+def _iter_lines(
+    fp: IO[str], accept: Optional[Callable[[str], bool]] = None
+) -> Iterator[Dict[str, Any]]:
+    for line in fp:
+        if accept is not None and not accept(line):
+            continue
+        record = _decode_line(line)
+        if record is not None:
+            yield record
+
+
+def _iter_file_records(
+    path: str, accept: Optional[Callable[[str], bool]] = None
+) -> Iterator[Dict[str, Any]]:
+    try:
+        with open(path, encoding="utf-8") as fp:
+            yield from _iter_lines(fp, accept)
+    except FileNotFoundError:
+        return
+
+
+def _iter_offset_records(fp: IO[bytes]) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """Yield ``(byte offset, record)`` for every complete line of ``fp``."""
+
+    offset = fp.tell()
+    for line in fp:
+        start = offset
+        offset += len(line)
+        record = _decode_line(line)
+        if record is not None:
+            yield start, record
+
+
+def _read_at_offsets(path: str, offsets: Iterable[int]) -> Iterator[Dict[str, Any]]:
+    try:
+        with open(path, "rb") as fp:
+            for offset in offsets:
+                fp.seek(offset)
+                record = _decode_line(fp.readline())
+                if record is not None:
+                    yield record
+    except FileNotFoundError:
+        return
+
+
+def _json_needles(values: Collection[str]) -> Tuple[str, ...]:
+    """Encoded forms a value can take inside a stored line (escaped or not)."""
+
+    needles = set()
+    for value in values:
+        needles.add(json.dumps(value, ensure_ascii=False)[1:-1])
+        needles.add(json.dumps(value)[1:-1])
+    return tuple(needles)
+
+
+def _line_prefilter(
+    user_set: Optional[Collection[str]], mode_set: Optional[Collection[str]]
+) -> Optional[Callable[[str], bool]]:
+    """Build a substring test that rejects lines before ``json.loads``.
+
+    It only ever rejects lines that cannot contain a wanted user or mode; the
+    exact comparison still runs on the decoded record. ``guest``/``normal``
+    also match records without the key, so they disable the respective test.
+    """
+
+    user_needles = None
+    if user_set is not None and "guest" not in user_set:
+        user_needles = _json_needles(user_set)
+    mode_needles = None
+    if mode_set is not None and "normal" not in mode_set:
+        mode_needles = _json_needles(mode_set)
+    if user_needles is None and mode_needles is None:
+        return None
+
+    def accept(line: str) -> bool:
+        if user_needles is not None and not any(n in line for n in user_needles):
+            return False
+        if mode_needles is not None:
+            lowered = line.lower()
+            if not any(n in lowered for n in mode_needles):
+                return False
+        return True
+
+    return accept
+
+
+def segment_dir(runtime_dir: str) -> str:
+    return os.path.join(runtime_dir, SEGMENT_DIR_NAME)
+
+
+def _segment_index_path(segment_path: str) -> str:
+    return segment_path[: -len(".ndjson")] + ".idx.json"
+
+
+def list_segments(runtime_dir: str) -> List[str]:
+    """Sealed segment paths, oldest first."""
+
+    try:
+        names = os.listdir(segment_dir(runtime_dir))
+    except FileNotFoundError:
+        return []
+    names = sorted(n for n in names if n.startswith("seg-") and n.endswith(".ndjson"))
+    return [os.path.join(segment_dir(runtime_dir), n) for n in names]
+
+
+def build_segment_index(segment_path: str) -> Dict[str, Any]:
+    """Scan ``segment_path`` once and write its sidecar index."""
+
+    count = 0
+    offsets: Dict[str, List[int]] = {}
+    modes = set()
+    lo: Optional[datetime] = None
+    hi: Optional[datetime] = None
+    lo_raw = hi_raw = None
+    with open(segment_path, "rb") as fp:
+        for offset, record in _iter_offset_records(fp):
+            count += 1
+            offsets.setdefault(_record_user(record), []).append(offset)
+            modes.add(_record_mode(record))
+            dt = _record_time(record)
+            if dt is None:
+                continue
+            if lo is None or dt < lo:
+                lo, lo_raw = dt, record.get("endedAt") or record.get("receivedAt")
+            if hi is None or dt > hi:
+                hi, hi_raw = dt, record.get("endedAt") or record.get("receivedAt")
+        size = fp.tell()
+    index = {
+        "format": SEGMENT_INDEX_FORMAT,
+        "bytes": size,
+        "count": count,
+        "minEndedAt": lo_raw,
+        "maxEndedAt": hi_raw,
+        "users": sorted(offsets),
+        "modes": sorted(modes),
+        # ユーザー -> 行の先頭バイト位置（ユーザー指定の読み込みで直接 seek する）
+        "offsets": offsets,
+    }
+    path = _segment_index_path(segment_path)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fp:
+        json.dump(index, fp, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, path)
+    return index
+
+
+def load_segment_index(segment_path: str) -> Dict[str, Any]:
+    """Return the sidecar index, rebuilding it when missing or stale."""
+
+    try:
+        with open(_segment_index_path(segment_path), encoding="utf-8") as fp:
+            index = json.load(fp)
+        if (
+            isinstance(index, dict)
+            and index.get("format") == SEGMENT_INDEX_FORMAT
+            and index.get("bytes") == os.path.getsize(segment_path)
+        ):
+            return index
+    except (OSError, ValueError):
+        pass
+    return build_segment_index(segment_path)
+
+
+def seal_segment(
+    active_path: str, expected_id: Optional[Tuple[int, int]] = None
+) -> Optional[str]:
+    """Move the active log into the next sealed segment and index it.
+
+    ``expected_id`` is the ``(st_dev, st_ino)`` the caller decided to seal;
+    if another worker already sealed that file nothing is done.
+    """
+
+    runtime_dir = os.path.dirname(active_path)
+    # 複数ワーカーが同時に封印しても、同じ番号を奪い合わないようにする。
+    with file_lock.locked(active_path, "results.seal"):
+        try:
+            st = os.stat(active_path)
+        except FileNotFoundError:
+            return None
+        if st.st_size == 0:
+            return None
+        if expected_id is not None and (st.st_dev, st.st_ino) != expected_id:
+            return None
+        os.makedirs(segment_dir(runtime_dir), exist_ok=True)
+        existing = list_segments(runtime_dir)
+        seq = 1
+        if existing:
+            seq = int(os.path.basename(existing[-1])[4:-7]) + 1
+        while True:
+            segment_path = os.path.join(
+                segment_dir(runtime_dir), f"seg-{seq:06d}.ndjson"
+            )
+            # rename と違い link は既存のセグメントを上書きしない。
+            try:
+                os.link(active_path, segment_path)
+            except FileExistsError:
+                seq += 1
+                continue
+            break
+        os.unlink(active_path)
+    build_segment_index(segment_path)
+    return segment_path
+
+
+def _first_record_epoch(path: str) -> Optional[float]:
+    for record in _iter_file_records(path):
+        dt = _parse_iso(record.get("receivedAt") or record.get("endedAt"))
+        if dt is not None:
+            return dt.timestamp()
+        break
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+class _Pending:
+    __slots__ = ("data", "done", "error")
+
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+        self.done = False
+        self.error: Optional[BaseException] = None
+
+
+class ResultsAppender:
+    """Group-commit appender bound to one file path."""
+
+    def __init__(
+        self,
+        path: str,
+        durability: str = "flush",
+        fsync_interval: float = DEFAULT_FSYNC_INTERVAL,
+        max_segment_bytes: int = 0,
+        max_segment_age: float = 0.0,
+    ) -> None:
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"unknown durability mode: {durability}")
+        self.path = path
+        self.durability = durability
+        self.fsync_interval = fsync_interval
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segment_age = max_segment_age
+        self._cond = threading.Condition()
+        self._queue: List[_Pending] = []
+        self._leader_active = False
+        self._fd: Optional[int] = None
+        self._fd_id: Optional[Tuple[int, int]] = None
+        self._last_sync = 0.0
+        # interval モードで fsync されていない最初の書き込みの時刻
+        self._unsynced_since: Optional[float] = None
+        self._syncer: Optional[threading.Thread] = None
+        self._segment_started: Optional[float] = None
+        self.batches = 0
+
+    # --- file handle -------------------------------------------------
+    def _ensure_open(self) -> int:
+        """Return an fd for ``path``, reopening if the file was replaced or removed."""
+
+        if self._fd is not None:
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                st = None
+            if st is not None and (st.st_dev, st.st_ino) == self._fd_id:
+                return self._fd
+            self._close_fd()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        st = os.fstat(fd)
+        self._fd = fd
+        self._fd_id = (st.st_dev, st.st_ino)
+        self._segment_started = _first_record_epoch(self.path) if st.st_size else None
+        return fd
+
+    def _close_fd(self) -> None:
+        if self._fd is None:
+            return
+        try:
+            os.close(self._fd)
+        except OSError:
+            pass
+        self._fd = None
+        self._fd_id = None
+        self._segment_started = None
+
+    # --- commit ------------------------------------------------------
+    def _commit(self, batch: List[_Pending]) -> None:
+        fd = self._ensure_open()
+        view = memoryview(b"".join(item.data for item in batch))
+        while view:
+            written = os.write(fd, view)
+            view = view[written:]
+        if self.durability == "fsync":
+            os.fsync(fd)
+        elif self.durability == "interval":
+            now = time.monotonic()
+            if now - self._last_sync >= self.fsync_interval:
+                os.fsync(fd)
+                with self._cond:
+                    self._last_sync = now
+                    self._unsynced_since = None
+            else:
+                self._mark_unsynced(now)
+        self.batches += 1
+        if self._segment_started is None:
+            self._segment_started = time.time()
+        try:
+            self._maybe_seal(fd)
+        except Exception:
+            # バッチは書き込み済みなので、封印の失敗は呼び出し元へ返さない。
+            logger.exception("failed to seal %s", self.path)
+
+    def _maybe_seal(self, fd: int) -> None:
+        due = False
+        if self.max_segment_bytes:
+            due = os.fstat(fd).st_size >= self.max_segment_bytes
+        if not due and self.max_segment_age and self._segment_started is not None:
+            due = time.time() - self._segment_started >= self.max_segment_age
+        if not due:
+            return
+        if self.durability != "flush":
+            os.fsync(fd)
+            with self._cond:
+                self._unsynced_since = None
+        fd_id = self._fd_id
+        self._close_fd()
+        seal_segment(self.path, fd_id)
+
+    # --- interval fsync ----------------------------------------------
+    def _mark_unsynced(self, now: float) -> None:
+        with self._cond:
+            if self._unsynced_since is None:
+                self._unsynced_since = now
+            if self._syncer is None or not self._syncer.is_alive():
+                self._syncer = threading.Thread(
+                    target=self._run_syncer,
+                    name=f"results-fsync:{os.path.basename(self.path)}",
+                    daemon=True,
+                )
+                self._syncer.start()
+            self._cond.notify_all()
+
+    def _sync_locked(self) -> None:
+        if self._fd is not None:
+            os.fsync(self._fd)
+        self._last_sync = time.monotonic()
+        self._unsynced_since = None
+
+    def _run_syncer(self) -> None:
+        """Fsync data that no later batch synced within ``fsync_interval``."""
+
+        while True:
+            with self._cond:
+                while True:
+                    if self._unsynced_since is None:
+                        self._cond.wait()
+                        continue
+                    remaining = (
+                        self._unsynced_since + self.fsync_interval - time.monotonic()
+                    )
+                    if remaining > 0:
+                        self._cond.wait(remaining)
+                        continue
+                    # 書き込み中のリーダーとは fd を取り合わない（終わると通知される）。
+                    if self._leader_active:
+                        self._cond.wait()
+                        continue
+                    break
+                try:
+                    self._sync_locked()
+                except OSError:
+                    logger.exception("failed to fsync %s", self.path)
+                    self._unsynced_since = time.monotonic()
+
+    def append(self, line: str) -> None:
+        """Append ``line`` (newline added if missing) and wait for its commit."""
+
+        self.append_lines([line])
+
+    def append_lines(self, lines: Iterable[str]) -> None:
+        """Append several lines as one contiguous write and wait for its commit."""
+
+        data = "".join(line if line.endswith("\n") else line + "\n" for line in lines)
+        if not data:
+            return
+        pending = _Pending(data.encode("utf-8"))
+        with self._cond:
+            self._queue.append(pending)
+            while not pending.done and self._leader_active:
+                self._cond.wait()
+            if pending.done:
+                if pending.error is not None:
+                    raise pending.error
+                return
+            self._leader_active = True
+
+        # リーダーとして、溜まっている行がなくなるまでまとめて書き込む。
+        try:
+            while True:
+                with self._cond:
+                    batch, self._queue = self._queue, []
+                    if not batch:
+                        break
+                error: Optional[BaseException] = None
+                try:
+                    self._commit(batch)
+                except BaseException as exc:
+                    # 失敗はバッチ内の全呼び出し元へ伝える。
+                    error = exc
+                    self._close_fd()
+                with self._cond:
+                    for item in batch:
+                        item.error = error
+                        item.done = True
+                    self._cond.notify_all()
+        finally:
+            with self._cond:
+                self._leader_active = False
+                self._cond.notify_all()
+
+        if pending.error is not None:
+            raise pending.error
+
+    def sync(self) -> None:
+        """Force buffered data to stable storage (used by ``interval`` mode)."""
+
+        with self._cond:
+            self._sync_locked()
+
+    def close(self) -> None:
+        with self._cond:
+            while self._leader_active:
+                self._cond.wait()
+            if self._fd is not None and self.durability != "flush":
+                try:
+                    os.fsync(self._fd)
+                except OSError:
+                    pass
+            self._unsynced_since = None
+            self._close_fd()
+
+
+_APPENDERS: Dict[str, ResultsAppender] = {}
+_APPENDERS_LOCK = threading.Lock()
+
+
+def results_path(runtime_dir: str) -> str:
+    return os.path.join(runtime_dir, "results.ndjson")
+
+
+def get_appender(runtime_dir: str) -> ResultsAppender:
+    path = os.path.abspath(results_path(runtime_dir))
+    with _APPENDERS_LOCK:
+        appender = _APPENDERS.get(path)
+        if appender is None:
+            mode, interval = _durability_from_env()
+            max_bytes, max_age = _segment_limits_from_env()
+            appender = ResultsAppender(path, mode, interval, max_bytes, max_age)
+            _APPENDERS[path] = appender
+        return appender
+
+
+def append_record(runtime_dir: str, record: Dict[str, Any]) -> None:
+    """Serialize ``record`` as one NDJSON line and append it durably."""
+
+    get_appender(runtime_dir).append(json.dumps(record, ensure_ascii=False))
+
+
+def append_records(runtime_dir: str, records: Iterable[Dict[str, Any]]) -> None:
+    """Append ``records`` in order with a single write."""
+
+    get_appender(runtime_dir).append_lines(
+        json.dumps(record, ensure_ascii=False) for record in records
+    )
+
+
+def tail_records(runtime_dir: str, limit: int) -> List[Dict[str, Any]]:
+    """Return the last ``limit`` stored records, oldest first."""
+
+    if limit <= 0:
+        return []
+    chunks: List[Iterable[Dict[str, Any]]] = []
+    have = 0
+    seen = set()
+    # アクティブファイルから新しい順に、必要な件数が揃うまでだけ読む。
+    for path in [results_path(runtime_dir)] + list_segments(runtime_dir)[::-1]:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        if (st.st_dev, st.st_ino) in seen:
+            continue
+        seen.add((st.st_dev, st.st_ino))
+        chunk = deque(_iter_file_records(path), maxlen=limit - have)
+        chunks.append(chunk)
+        have += len(chunk)
+        if have >= limit:
+            break
+    return [record for chunk in reversed(chunks) for record in chunk]
+
+
+def _segment_may_match(
+    index: Dict[str, Any],
+    users: Optional[Collection[str]],
+    modes: Optional[Collection[str]],
+    since: Optional[datetime],
+    until: Optional[datetime],
+) -> bool:
+    if users is not None and not users & set(index.get("users") or ()):
+        return False
+    if modes is not None and not modes & set(index.get("modes") or ()):
+        return False
+    if since is not None or until is not None:
+        lo = _parse_iso(index.get("minEndedAt"))
+        hi = _parse_iso(index.get("maxEndedAt"))
+        if lo is None or hi is None:
+            return False
+        if since is not None and hi < since:
+            return False
+        if until is not None and lo > until:
+            return False
+    return True
+
+
+# ===== 末尾キャッシュ =====
+# アクティブファイルの解析済み記録と読み終えたバイト位置を保持し、次回は追記分だけ読む。
+# 同じ inode で縮んだ・書き換えられた（境界直前のバイトが変わった）場合は作り直す。
+_TAIL_GUARD_BYTES = 64
+
+
+class _TailCache:
+    __slots__ = ("by_user", "file_id", "guard", "lock", "offset", "records")
+
+    def __init__(self) -> None:
+        self.file_id: Optional[Tuple[int, int]] = None
+        self.offset = 0
+        self.guard = b""
+        self.records: List[Dict[str, Any]] = []
+        # ユーザー -> records 内の位置（追記順）
+        self.by_user: Dict[str, List[int]] = {}
+        self.lock = threading.Lock()
+
+    def reset(self, file_id: Tuple[int, int]) -> None:
+        self.file_id = file_id
+        self.offset = 0
+        self.guard = b""
+        # 読み出し中の呼び出し元が持つ古いリストには触らない。
+        self.records = []
+        self.by_user = {}
+
+
+class _TailSnapshot(NamedTuple):
+    records: List[Dict[str, Any]]
+    by_user: Dict[str, List[int]]
+    count: int
+
+    def positions(self, users: Optional[Collection[str]]) -> Iterable[int]:
+        if users is None:
+            return range(self.count)
+        merged: List[int] = []
+        for user in users:
+            merged.extend(self.by_user.get(user, ()))
+        return sorted(pos for pos in merged if pos < self.count)
+
+
+_TAIL_CACHES: Dict[str, _TailCache] = {}
+_TAIL_CACHES_LOCK = threading.Lock()
+
+
+def tail_cache_enabled() -> bool:
+    value = (os.environ.get("RESULTS_CACHE") or "1").strip().lower()
+    return value not in ("0", "false", "off", "no")
+
+
+def _read_cached_tail(path: str, fp: IO[bytes]) -> _TailSnapshot:
+    """Bring the cache for ``path`` up to date from ``fp`` and return a snapshot.
+
+    The snapshot shares the cache's lists (records must be treated as
+    read-only); only positions below ``count`` belong to it.
+    """
+
+    key = os.path.abspath(path)
+    with _TAIL_CACHES_LOCK:
+        cache = _TAIL_CACHES.get(key)
+        if cache is None:
+            cache = _TAIL_CACHES[key] = _TailCache()
+
+    with cache.lock:
+        st = os.fstat(fp.fileno())
+        file_id = (st.st_dev, st.st_ino)
+        if cache.file_id != file_id or st.st_size < cache.offset:
+            cache.reset(file_id)
+        elif cache.guard:
+            fp.seek(cache.offset - len(cache.guard))
+            if fp.read(len(cache.guard)) != cache.guard:
+                cache.reset(file_id)
+
+        fp.seek(cache.offset)
+        records, by_user = cache.records, cache.by_user
+        start = cache.offset
+        for line in fp:
+            if not line.endswith(b"\n"):
+                break  # 書きかけの最終行は次回に回す
+            cache.offset += len(line)
+            record = _decode_line(line)
+            if record is None:
+                continue
+            by_user.setdefault(_record_user(record), []).append(len(records))
+            records.append(record)
+        if cache.offset > start:
+            fp.seek(max(0, cache.offset - _TAIL_GUARD_BYTES))
+            cache.guard = fp.read(cache.offset - fp.tell())
+        return _TailSnapshot(records, by_user, len(records))
+
+
+def iter_records(
+    runtime_dir: str,
+    users: Optional[Collection[str]] = None,
+    modes: Optional[Collection[str]] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Yield stored records in append order, restricted to the given filters.
+
+    ``users`` compare after ``_normalize_user``, ``modes`` case-insensitively
+    (a missing mode counts as ``normal``) and ``since``/``until`` against
+    ``endedAt`` (falling back to ``receivedAt``); records without a parseable
+    time never match a time filter. Sealed segments are decoded one line at
+    a time, skipping lines that cannot match the user/mode filters undecoded;
+    the active file is served from the tail cache unless ``RESULTS_CACHE=0``.
+    Yielded records may be shared with the cache and must not be mutated.
+    """
+
+    user_set = {_normalize_user(u) for u in users} if users is not None else None
+    mode_set = {str(m).lower() for m in modes} if modes is not None else None
+    accept = _line_prefilter(user_set, mode_set)
+
+    def matches(record: Dict[str, Any]) -> bool:
+        if user_set is not None and _record_user(record) not in user_set:
+            return False
+        if mode_set is not None and _record_mode(record) not in mode_set:
+            return False
+        if since is None and until is None:
+            return True
+        dt = _record_time(record)
+        if dt is None:
+            return False
+        return (since is None or dt >= since) and (until is None or dt <= until)
+
+    # 先にアクティブファイルを開いておき、その後の封印で同じ inode が
+    # セグメント側に現れても二重に読まないようにする。
+    active_path = results_path(runtime_dir)
+    with contextlib.ExitStack() as stack:
+        try:
+            active: Optional[IO[bytes]] = stack.enter_context(open(active_path, "rb"))
+        except FileNotFoundError:
+            active = None
+        active_id = None
+        if active is not None:
+            st = os.fstat(active.fileno())
+            active_id = (st.st_dev, st.st_ino)
+        for path in list_segments(runtime_dir):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if (st.st_dev, st.st_ino) == active_id:
+                continue
+            index = load_segment_index(path)
+            if not _segment_may_match(index, user_set, mode_set, since, until):
+                continue
+            if user_set is not None:
+                # ユーザー指定なら索引の位置へ直接 seek し、その人の行だけ読む。
+                offsets = index.get("offsets") or {}
+                wanted = sorted(o for u in user_set for o in offsets.get(u, ()))
+                records: Iterable[Dict[str, Any]] = _read_at_offsets(path, wanted)
+            else:
+                records = _iter_file_records(path, accept)
+            for record in records:
+                if matches(record):
+                    yield record
+        if active is not None:
+            if tail_cache_enabled():
+                snapshot = _read_cached_tail(active_path, active)
+                for pos in snapshot.positions(user_set):
+                    if matches(snapshot.records[pos]):
+                        yield snapshot.records[pos]
+            else:
+                text = io.TextIOWrapper(active, encoding="utf-8")
+                for record in _iter_lines(text, accept):
+                    if matches(record):
+                        yield record
+
+
+def close_all() -> None:
+    with _APPENDERS_LOCK:
+        appenders = list(_APPENDERS.values())
+        _APPENDERS.clear()
+    for appender in appenders:
+        appender.close()
+
+
+# interval モードで未 fsync のまま残ったデータを終了時に確定させる。
+atexit.register(close_all)
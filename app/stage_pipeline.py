@@ -0,0 +1,155 @@
+"""Background application of stage updates for ``POST /api/results``.
+
+With ``STAGE_UPDATE_MODE=async`` the request only waits for the result
+record to be stored; the session is queued here and a per-subject worker
+thread applies queued sessions in batches through
+``Storage.update_stages_batch`` (one load/save of the stage store per batch
+on the file backend). The default ``sync`` mode keeps updating inside the
+request.
+"""
+
+from __future__ import annotations
+
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from .storage import Storage
+
+MODES = ("sync", "async")
+DEFAULT_MAX_BATCH = 256
+
+logger = logging.getLogger(__name__)
+
+
+def mode_from_env() -> str:
+    value = (os.environ.get("STAGE_UPDATE_MODE") or "sync").strip().lower()
+    return value if value in MODES else "sync"
+
+
+def _iso(epoch: Optional[float]) -> Optional[str]:
+    if epoch is None:
+        return None
+    dt = datetime.fromtimestamp(epoch, tz=timezone.utc)
+    return dt.isoformat().replace("+00:00", "Z")
+
+
+class StagePipeline:
+    """FIFO queue of sessions plus the worker that drains it."""
+
+    def __init__(self, storage: Storage, max_batch: int = DEFAULT_MAX_BATCH) -> None:
+        self.storage = storage
+        self.max_batch = max(1, max_batch)
+        self._cond = threading.Condition()
+        self._queue: Deque[Tuple[float, Dict[str, Any]]] = deque()
+        # 適用中のバッチの投入時刻。キュー深さと遅延に含める。
+        self._inflight: List[float] = []
+        self._thread: Optional[threading.Thread] = None
+        self.applied = 0
+        self.batches = 0
+        self.failures = 0
+        self.last_batch_size = 0
+        self.last_applied_at: Optional[float] = None
+
+    def submit(self, record: Dict[str, Any]) -> None:
+        with self._cond:
+            self._queue.append((time.time(), record))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name=f"stage-pipeline:{os.path.basename(self.storage.runtime_dir)}",
+                    daemon=True,
+                )
+                self._thread.start()
+            self._cond.notify_all()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                batch = []
+                while self._queue and len(batch) < self.max_batch:
+                    batch.append(self._queue.popleft())
+                self._inflight = [enqueued for enqueued, _ in batch]
+            ok = True
+            try:
+                self.storage.update_stages_batch([record for _, record in batch])
+            except Exception:
+                # 同期モードと同じく、結果ログは残っているので再構築で回復できる。
+                logger.exception(
+                    "failed to apply %d stage updates in %s",
+                    len(batch),
+                    self.storage.runtime_dir,
+                )
+                ok = False
+            with self._cond:
+                self._inflight = []
+                if ok:
+                    self.applied += len(batch)
+                else:
+                    self.failures += len(batch)
+                self.batches += 1
+                self.last_batch_size = len(batch)
+                self.last_applied_at = time.time()
+                self._cond.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every submitted session has been applied."""
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._queue or self._inflight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._cond:
+            pending = list(self._inflight)
+            if self._queue:
+                pending.append(self._queue[0][0])
+            depth = len(self._queue) + len(self._inflight)
+            oldest = min(pending) if pending else None
+            return {
+                "queueDepth": depth,
+                "lagSeconds": round(time.time() - oldest, 3) if oldest else 0.0,
+                "applied": self.applied,
+                "batches": self.batches,
+                "failures": self.failures,
+                "lastBatchSize": self.last_batch_size,
+                "lastAppliedAt": _iso(self.last_applied_at),
+            }
+
+
+_PIPELINES: Dict[Tuple[str, str], StagePipeline] = {}
+_PIPELINES_LOCK = threading.Lock()
+
+
+def _key(storage: Storage) -> Tuple[str, str]:
+    return (storage.name, os.path.abspath(storage.runtime_dir))
+
+
+def get_pipeline(storage: Storage) -> StagePipeline:
+    with _PIPELINES_LOCK:
+        pipeline = _PIPELINES.get(_key(storage))
+        if pipeline is None:
+            pipeline = _PIPELINES[_key(storage)] = StagePipeline(storage)
+        return pipeline
+
+
+def flush_all(timeout: Optional[float] = None) -> bool:
+    with _PIPELINES_LOCK:
+        pipelines = list(_PIPELINES.values())
+    return all(pipeline.flush(timeout) for pipeline in pipelines)
+
+
+# 終了時にキューに残った更新を適用してから抜ける。
+atexit.register(flush_all, 10.0)
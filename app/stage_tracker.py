@@ -1,8 +1,12 @@
+import hashlib
 import json
 import os
+import shutil
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
-from typing import Any, Dict, Iterable, List, Optional, Tuple
+from typing import Any, ContextManager, Dict, Iterable, List, Optional, Tuple
+
+from . import file_lock
 
 
 @dataclass(frozen=True)
@@ -74,20 +78,6 @@ def _config_from_record(record: Dict[str, Any]) -> StageConfig:
     return config
 
 
-def _default_question_state(config: StageConfig) -> Dict[str, Any]:
-    return {
-        "stage": config.default_stage,
-        "streak": 0,
-        "answered": 0,
-        "correct": 0,
-        "lastCorrectAt": None,
-        "lastWrongAt": None,
-        "lastAttemptAt": None,
-        "nextDueAt": None,
-        "updatedAt": None,
-    }
-
-
 def _normalize_user(user: str) -> str:
     value = (user or "").strip()
     return value or "guest"
@@ -117,34 +107,224 @@ def _to_iso(dt: Optional[datetime]) -> Optional[str]:
     return dt.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
 
 
+STAGE_CODES: Tuple[str, ...] = ("F", "E", "D", "C", "B", "A")
+_STAGE_CODE_INDEX = {name: code for code, name in enumerate(STAGE_CODES)}
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_ONE_US = timedelta(microseconds=1)
+_US_PER_DAY = 86_400_000_000
+
+
+def _to_epoch_us(dt: datetime) -> int:
+    return (dt - _EPOCH) // _ONE_US
+
+
+def _epoch_us_to_iso(value: Optional[int]) -> Optional[str]:
+    if value is None:
+        return None
+    return _to_iso(_EPOCH + timedelta(microseconds=value))
+
+
+def _iso_to_epoch_us(value: Any) -> Optional[int]:
+    dt = _parse_iso(value) if isinstance(value, str) else None
+    return None if dt is None else _to_epoch_us(dt)
+
+
+def _to_int(value: Any) -> int:
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+# (保存形式のキー, スロット名)
+_TIME_FIELDS: Tuple[Tuple[str, str], ...] = (
+    ("lastCorrectAt", "last_correct"),
+    ("lastWrongAt", "last_wrong"),
+    ("lastAttemptAt", "last_attempt"),
+    ("nextDueAt", "next_due"),
+    ("updatedAt", "updated"),
+)
+_KNOWN_KEYS = frozenset(("stage", "streak", "answered", "correct")) | frozenset(
+    key for key, _ in _TIME_FIELDS
+)
+
+
+class StageState:
+    """Compact in-memory form of one question's stage state.
+
+    ``stage`` is an index into ``STAGE_CODES`` (``None`` when unset) and the
+    timestamps are integer microseconds since the Unix epoch (UTC), so
+    applying attempts needs no ISO parsing or formatting. ``to_dict`` gives
+    the stored/API form; unknown keys of that form are kept in ``extra``.
+    """
+
+    __slots__ = (
+        "answered",
+        "correct",
+        "extra",
+        "last_attempt",
+        "last_correct",
+        "last_wrong",
+        "next_due",
+        "stage",
+        "streak",
+        "updated",
+    )
+
+    def __init__(
+        self,
+        stage: Optional[int] = None,
+        streak: int = 0,
+        answered: int = 0,
+        correct: int = 0,
+        last_correct: Optional[int] = None,
+        last_wrong: Optional[int] = None,
+        last_attempt: Optional[int] = None,
+        next_due: Optional[int] = None,
+        updated: Optional[int] = None,
+        extra: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        self.stage = stage
+        self.streak = streak
+        self.answered = answered
+        self.correct = correct
+        self.last_correct = last_correct
+        self.last_wrong = last_wrong
+        self.last_attempt = last_attempt
+        self.next_due = next_due
+        self.updated = updated
+        self.extra = extra
+
+    @classmethod
+    def default(cls, config: StageConfig) -> "StageState":
+        return cls(stage=_STAGE_CODE_INDEX.get(config.default_stage))
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "StageState":
+        state = cls(
+            stage=_STAGE_CODE_INDEX.get(data.get("stage")),  # type: ignore[arg-type]
+            streak=_to_int(data.get("streak")),
+            answered=_to_int(data.get("answered")),
+            correct=_to_int(data.get("correct")),
+        )
+        for key, slot in _TIME_FIELDS:
+            setattr(state, slot, _iso_to_epoch_us(data.get(key)))
+        extra = {k: v for k, v in data.items() if k not in _KNOWN_KEYS}
+        if state.stage is None and data.get("stage") is not None:
+            # 未知のステージ名はそのまま書き戻す（次の適用で既定値になる）。
+            extra["stage"] = data["stage"]
+        state.extra = extra or None
+        return state
+
+    def to_dict(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {
+            "stage": self.stage_name,
+            "streak": self.streak,
+            "answered": self.answered,
+            "correct": self.correct,
+        }
+        for key, slot in _TIME_FIELDS:
+            out[key] = _epoch_us_to_iso(getattr(self, slot))
+        if self.extra:
+            out.update(self.extra)
+            if self.stage is not None:
+                out["stage"] = STAGE_CODES[self.stage]
+        return out
+
+    def copy(self) -> "StageState":
+        state = StageState.__new__(StageState)
+        for slot in StageState.__slots__:
+            setattr(state, slot, getattr(self, slot))
+        if self.extra:
+            state.extra = dict(self.extra)
+        return state
+
+    @property
+    def stage_name(self) -> Optional[str]:
+        return None if self.stage is None else STAGE_CODES[self.stage]
+
+    def next_due_datetime(self) -> Optional[datetime]:
+        if self.next_due is None:
+            return None
+        return _EPOCH + timedelta(microseconds=self.next_due)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, StageState):
+            return NotImplemented
+        return all(
+            getattr(self, slot) == getattr(other, slot) for slot in self.__slots__
+        )
+
+    def __repr__(self) -> str:
+        return f"StageState({self.to_dict()!r})"
+
+
+def state_to_dict(state: Any) -> Optional[Dict[str, Any]]:
+    """Stored/API form of a state held in a store (``StageState`` or dict)."""
+
+    if isinstance(state, StageState):
+        return state.to_dict()
+    return state if isinstance(state, dict) else None
+
+
+def compact_store(store: Dict[str, Any]) -> Dict[str, Dict[str, StageState]]:
+    """Copy of ``store`` with every state as a ``StageState``."""
+
+    out: Dict[str, Dict[str, StageState]] = {}
+    for user, bucket in store.items():
+        if not isinstance(bucket, dict):
+            continue
+        out[user] = {}
+        for qid, state in bucket.items():
+            if isinstance(state, StageState):
+                out[user][qid] = state.copy()
+            elif isinstance(state, dict):
+                out[user][qid] = StageState.from_dict(state)
+    return out
+
+
+def expand_store(store: Dict[str, Any]) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """Copy of ``store`` in the stored form (ISO timestamp dicts)."""
+
+    out: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    for user, bucket in store.items():
+        if not isinstance(bucket, dict):
+            continue
+        out[user] = {}
+        for qid, state in bucket.items():
+            value = state_to_dict(state)
+            if value is not None:
+                out[user][qid] = dict(value)
+    return out
+
+
 def _compute_next_due(
-    stage: str, reference: Optional[datetime], config: StageConfig
-) -> Optional[str]:
+    stage: str, reference: Optional[int], config: StageConfig
+) -> Optional[int]:
     rules = config.rules.get(stage, {})
     gap_days = rules.get("gap_days")
-    if not reference or gap_days in (None, 0):
+    if reference is None or gap_days in (None, 0):
         return None
     try:
-        delta = timedelta(days=float(gap_days))
+        delta = round(float(gap_days) * _US_PER_DAY)
     except Exception:
         return None
-    return _to_iso(reference + delta)
+    return reference + delta
 
 
-def _apply_correct(
-    state: Dict[str, Any], attempt_dt: datetime, config: StageConfig
-) -> None:
-    prev_last_correct = _parse_iso(state.get("lastCorrectAt"))
-    state["streak"] = int(state.get("streak") or 0) + 1
+def _apply_correct(state: StageState, attempt_us: int, config: StageConfig) -> None:
+    prev_last_correct = state.last_correct
+    state.streak += 1
 
-    stage = state.get("stage") or config.default_stage
+    stage = state.stage_name or config.default_stage
     if stage == "F" and config is not DEFAULT_STAGE_CONFIG:
         stage = config.default_stage
     stage_rules = config.rules.get(stage, {})
 
     if stage == "F" and config is DEFAULT_STAGE_CONFIG:
         min_streak = stage_rules.get("min_streak") or 0
-        if state["streak"] >= min_streak and min_streak > 0:
+        if state.streak >= min_streak and min_streak > 0:
             stage = stage_rules.get("next", stage)
     else:
         gap_days_req = stage_rules.get("gap_days")
@@ -159,7 +339,7 @@ def _apply_correct(
                 except Exception:
                     pass
             else:
-                gap = (attempt_dt - prev_last_correct).total_seconds() / 86400.0
+                gap = (attempt_us - prev_last_correct) / 1_000_000 / 86400.0
                 try:
                     if gap >= float(gap_days_req):
                         stage = next_stage
@@ -169,48 +349,89 @@ def _apply_correct(
     if stage not in config.sequence and stage != "F":
         stage = config.default_stage
 
-    state["stage"] = stage
-    state["lastCorrectAt"] = _to_iso(attempt_dt)
-    state["nextDueAt"] = _compute_next_due(state["stage"], attempt_dt, config)
+    state.stage = _STAGE_CODE_INDEX[stage]
+    state.last_correct = attempt_us
+    state.next_due = _compute_next_due(stage, attempt_us, config)
 
 
-def _apply_wrong(
-    state: Dict[str, Any], attempt_dt: datetime, config: StageConfig
-) -> None:
-    state["stage"] = config.reset_stage
-    state["streak"] = 0
-    state["lastWrongAt"] = _to_iso(attempt_dt)
-    state["nextDueAt"] = None
+def _apply_wrong(state: StageState, attempt_us: int, config: StageConfig) -> None:
+    state.stage = _STAGE_CODE_INDEX[config.reset_stage]
+    state.streak = 0
+    state.last_wrong = attempt_us
+    state.next_due = None
 
 
 def _apply_attempt(
-    state: Dict[str, Any],
+    state: StageState,
     attempt_dt: Optional[datetime],
     is_correct: bool,
     config: StageConfig,
 ) -> bool:
     if not attempt_dt:
         return False
-    before = state.copy()
+    attempt_us = _to_epoch_us(attempt_dt)
 
-    state["answered"] = int(state.get("answered") or 0) + 1
+    # answered が必ず増えるので、適用した試行は常に変更になる。
+    state.answered += 1
     if is_correct:
-        state["correct"] = int(state.get("correct") or 0) + 1
-        _apply_correct(state, attempt_dt, config)
+        state.correct += 1
+        _apply_correct(state, attempt_us, config)
     else:
-        _apply_wrong(state, attempt_dt, config)
-    state["lastAttemptAt"] = _to_iso(attempt_dt)
-    state["updatedAt"] = state["lastAttemptAt"]
+        _apply_wrong(state, attempt_us, config)
+    state.last_attempt = attempt_us
+    state.updated = attempt_us
+    return True
 
-    return state != before
+
+STAGE_LAYOUTS = ("single", "sharded", "journal")
+SHARD_DIR_NAME = "stages.d"
+JOURNAL_FILE_NAME = "stages.journal.ndjson"
+DEFAULT_JOURNAL_MAX_BYTES = 4 * 1024 * 1024
+
+
+def layout_from_env() -> str:
+    """``STAGE_STORE_LAYOUT``: ``single`` (stages.json), ``sharded`` or ``journal``."""
+
+    value = (os.environ.get("STAGE_STORE_LAYOUT") or "single").strip().lower()
+    return value if value in STAGE_LAYOUTS else "single"
 
 
 def _stage_file_path(runtime_dir: str) -> str:
     return os.path.join(runtime_dir, "stages.json")
 
 
-def load_store(runtime_dir: str) -> Dict[str, Dict[str, Dict[str, Any]]]:
-    path = _stage_file_path(runtime_dir)
+def _store_lock(runtime_dir: str) -> ContextManager[None]:
+    """Cross-process lock for ``stages.json`` (and its journal)."""
+
+    return file_lock.locked(_stage_file_path(runtime_dir))
+
+
+def _user_lock(runtime_dir: str, user: Any) -> ContextManager[None]:
+    """Lock guarding the part of the store that holds ``user``."""
+
+    if layout_from_env() == "sharded":
+        _ensure_sharded(runtime_dir)
+        shard_path = _shard_path(runtime_dir, shard_for_user(user))
+        return file_lock.locked(shard_path, name=SHARD_DIR_NAME)
+    return _store_lock(runtime_dir)
+
+
+def _shard_dir(runtime_dir: str) -> str:
+    return os.path.join(runtime_dir, SHARD_DIR_NAME)
+
+
+def shard_for_user(user: Any) -> str:
+    """Name of the shard (one of 256 hash buckets) that holds ``user``."""
+
+    key = _normalize_user(user if isinstance(user, str) else str(user or ""))
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=1).hexdigest()
+
+
+def _shard_path(runtime_dir: str, shard: str) -> str:
+    return os.path.join(_shard_dir(runtime_dir), f"{shard}.json")
+
+
+def _read_store_file(path: str) -> Dict[str, Dict[str, Dict[str, Any]]]:
     if not os.path.exists(path):
         return {}
     try:
@@ -223,27 +444,356 @@ def load_store(runtime_dir: str) -> Dict[str, Dict[str, Dict[str, Any]]]:
     return data
 
 
-def save_store(runtime_dir: str, store: Dict[str, Dict[str, Dict[str, Any]]]) -> None:
-    path = _stage_file_path(runtime_dir)
-    os.makedirs(runtime_dir, exist_ok=True)
+def _replace_file(path: str, text: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
     tmp_path = f"{path}.tmp"
     with open(tmp_path, "w", encoding="utf-8") as fp:
-        json.dump(store, fp, ensure_ascii=False, separators=(",", ":"))
+        fp.write(text)
     os.replace(tmp_path, path)
 
 
+def _json_default(value: Any) -> Any:
+    if isinstance(value, StageState):
+        return value.to_dict()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dump_store(store: Dict[str, Dict[str, Any]]) -> str:
+    return json.dumps(
+        store, ensure_ascii=False, separators=(",", ":"), default=_json_default
+    )
+
+
+def write_store_text(runtime_dir: str, text: str) -> None:
+    """Atomically replace ``stages.json`` with already serialized ``text``."""
+
+    _replace_file(_stage_file_path(runtime_dir), text)
+
+
+def write_shard_text(runtime_dir: str, shard: str, text: Optional[str]) -> None:
+    """Atomically replace one shard; ``None`` removes it."""
+
+    if text is None:
+        try:
+            os.remove(_shard_path(runtime_dir, shard))
+        except FileNotFoundError:
+            pass
+        return
+    _replace_file(_shard_path(runtime_dir, shard), text)
+
+
+def split_shards(store: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    shards: Dict[str, Dict[str, Any]] = {}
+    for user, bucket in store.items():
+        shards.setdefault(shard_for_user(user), {})[user] = bucket
+    return shards
+
+
+def _list_shards(runtime_dir: str) -> List[str]:
+    try:
+        names = os.listdir(_shard_dir(runtime_dir))
+    except FileNotFoundError:
+        return []
+    return sorted(name[:-5] for name in names if name.endswith(".json"))
+
+
+def _ensure_sharded(runtime_dir: str) -> None:
+    """Split an existing ``stages.json`` into shards the first time."""
+
+    if os.path.isdir(_shard_dir(runtime_dir)):
+        return
+    with _store_lock(runtime_dir):
+        if os.path.isdir(_shard_dir(runtime_dir)):
+            return
+        migrate_to_shards(runtime_dir)
+
+
+def migrate_to_shards(runtime_dir: str) -> int:
+    """Write ``stages.json`` as shards and set the single file aside.
+
+    The original is renamed to ``stages.json.migrated``; returns the number
+    of shards written."""
+
+    single_path = _stage_file_path(runtime_dir)
+    store = _read_store_file(single_path)
+    tmp_dir = f"{_shard_dir(runtime_dir)}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    shards = split_shards(store)
+    for shard, content in shards.items():
+        _replace_file(os.path.join(tmp_dir, f"{shard}.json"), dump_store(content))
+    # ディレクトリごと置き換えるので、途中で落ちても半端な移行は残らない。
+    os.replace(tmp_dir, _shard_dir(runtime_dir))
+    if os.path.exists(single_path):
+        os.replace(single_path, f"{single_path}.migrated")
+    return len(shards)
+
+
+def load_shard(runtime_dir: str, shard: str) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    _ensure_sharded(runtime_dir)
+    return _read_store_file(_shard_path(runtime_dir, shard))
+
+
+def load_user_store(runtime_dir: str, user: Any) -> Dict[str, Any]:
+    """Load only the part of the store that holds ``user``.
+
+    With the single layout this is the whole store; with shards it is the
+    user's shard. Either way it can be passed to ``apply_session`` and saved
+    back with ``save_user_store``."""
+
+    if layout_from_env() == "sharded":
+        return load_shard(runtime_dir, shard_for_user(user))
+    return load_store(runtime_dir)
+
+
+def save_user_store(runtime_dir: str, user: Any, store: Dict[str, Any]) -> None:
+    if layout_from_env() == "sharded":
+        shard = shard_for_user(user)
+        write_shard_text(runtime_dir, shard, dump_store(store) if store else None)
+        return
+    save_store(runtime_dir, store)
+
+
+def _journal_path(runtime_dir: str) -> str:
+    return os.path.join(runtime_dir, JOURNAL_FILE_NAME)
+
+
+def _journal_max_bytes() -> int:
+    try:
+        value = int(
+            os.environ.get("STAGE_JOURNAL_MAX_BYTES") or DEFAULT_JOURNAL_MAX_BYTES
+        )
+    except ValueError:
+        value = DEFAULT_JOURNAL_MAX_BYTES
+    return max(0, value)
+
+
+def journal_entries(
+    store: Dict[str, Any], keys: Iterable[Tuple[str, str]]
+) -> List[Dict[str, Any]]:
+    """After-images of ``keys`` (``None`` for removed states), deduplicated."""
+
+    entries: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for user, qid in keys:
+        bucket = store.get(user)
+        state = bucket.get(qid) if isinstance(bucket, dict) else None
+        entries[(user, qid)] = {"u": user, "q": qid, "s": state_to_dict(state)}
+    return list(entries.values())
+
+
+def _replay_journal(
+    runtime_dir: str, store: Dict[str, Any], offset: int = 0
+) -> Tuple[int, int]:
+    """Apply journal entries from byte ``offset`` on top of ``store``.
+
+    Returns the entry count and the offset just past the last complete line
+    (where a later call can resume)."""
+
+    try:
+        with open(_journal_path(runtime_dir), "rb") as fp:
+            fp.seek(offset)
+            data = fp.read()
+    except FileNotFoundError:
+        return 0, 0
+    count = 0
+    for line in data.splitlines():
+        try:
+            entry = json.loads(line)
+            user, qid, state = entry["u"], entry["q"], entry["s"]
+        except Exception:
+            # 書きかけの最終行などは読み飛ばす。
+            continue
+        if isinstance(state, dict):
+            store.setdefault(user, {})[qid] = state
+        else:
+            remove_question_state(store, user, qid)
+        count += 1
+    return count, offset + data.rfind(b"\n") + 1
+
+
+class _JournalView:
+    """Snapshot plus replayed journal, kept by one process between writes."""
+
+    __slots__ = ("journal", "offset", "snapshot", "store")
+
+    def __init__(self, snapshot: Any, journal: Any, store: Dict[str, Any]) -> None:
+        self.snapshot = snapshot
+        self.journal = journal
+        self.offset = 0
+        self.store = store
+
+
+# runtime_dir（絶対パス）ごとの再生済みビュー。ストアのロック下でだけ触る。
+_journal_views: Dict[str, _JournalView] = {}
+
+
+def _file_key(path: str) -> Optional[Tuple[int, int, int]]:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def _journal_view(runtime_dir: str) -> Dict[str, Any]:
+    """The journal layout's current store, for writers holding the store lock.
+
+    The view replayed by the previous write is reused and only the journal
+    lines appended since are read; it is rebuilt when the snapshot changes
+    (compaction, rebuild) or the journal was replaced or truncated. Callers
+    mutate the returned store and must drop it with ``_drop_journal_view``
+    if the change is not written to the journal."""
+
+    key = os.path.abspath(runtime_dir)
+    snapshot = _file_key(_stage_file_path(runtime_dir))
+    journal = _file_key(_journal_path(runtime_dir))
+    journal_ino, journal_size = journal[:2] if journal else (None, 0)
+    view = _journal_views.get(key)
+    if (
+        view is None
+        or view.snapshot != snapshot
+        or view.journal != journal_ino
+        or journal_size < view.offset
+    ):
+        store = _read_store_file(_stage_file_path(runtime_dir))
+        view = _journal_views[key] = _JournalView(snapshot, journal_ino, store)
+    if journal_size > view.offset:
+        _, view.offset = _replay_journal(runtime_dir, view.store, view.offset)
+    return view.store
+
+
+def _drop_journal_view(runtime_dir: str) -> None:
+    _journal_views.pop(os.path.abspath(runtime_dir), None)
+
+
+def append_journal(runtime_dir: str, entries: List[Dict[str, Any]]) -> None:
+    """Append ``entries`` with one write; compact once the journal is large."""
+
+    if not entries:
+        return
+    data = "".join(
+        json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n"
+        for entry in entries
+    ).encode("utf-8")
+    os.makedirs(runtime_dir, exist_ok=True)
+    with _store_lock(runtime_dir):
+        fd = os.open(
+            _journal_path(runtime_dir), os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644
+        )
+        try:
+            # 落ちて書きかけの行が残っていたら、その行を閉じてから追記する
+            # （続けて書くと次の行まで壊れて読み飛ばされる）。
+            size = os.fstat(fd).st_size
+            if size and os.pread(fd, 1, size - 1) != b"\n":
+                data = b"\n" + data
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view) :]
+            size = os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+        limit = _journal_max_bytes()
+        if limit and size >= limit:
+            _compact_locked(runtime_dir)
+
+
+def _compact_locked(runtime_dir: str) -> int:
+    store = _read_store_file(_stage_file_path(runtime_dir))
+    count, _ = _replay_journal(runtime_dir, store)
+    write_store_text(runtime_dir, dump_store(store))
+    # スナップショットを置き換えてから切り詰める。間で落ちても再生し直せば同じ結果。
+    try:
+        os.truncate(_journal_path(runtime_dir), 0)
+    except FileNotFoundError:
+        pass
+    return count
+
+
+def write_snapshot_text(runtime_dir: str, text: str) -> None:
+    """Replace the snapshot with ``text`` and empty the journal."""
+
+    with _store_lock(runtime_dir):
+        write_store_text(runtime_dir, text)
+        try:
+            os.truncate(_journal_path(runtime_dir), 0)
+        except FileNotFoundError:
+            pass
+
+
+def compact_journal(runtime_dir: str) -> int:
+    """Fold the journal into ``stages.json``; returns the entries folded in."""
+
+    with _store_lock(runtime_dir):
+        return _compact_locked(runtime_dir)
+
+
+def load_store(runtime_dir: str) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    layout = layout_from_env()
+    if layout == "journal":
+        with _store_lock(runtime_dir):
+            store = _read_store_file(_stage_file_path(runtime_dir))
+            _replay_journal(runtime_dir, store)
+        return store
+    if layout != "sharded":
+        return _read_store_file(_stage_file_path(runtime_dir))
+    _ensure_sharded(runtime_dir)
+    store: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    for shard in _list_shards(runtime_dir):
+        store.update(_read_store_file(_shard_path(runtime_dir, shard)))
+    return store
+
+
+def write_shard_texts(
+    runtime_dir: str, texts: Dict[str, Optional[str]], prune: bool = False
+) -> None:
+    """Write several shards; ``prune`` removes shards missing from ``texts``."""
+
+    _ensure_sharded(runtime_dir)
+    for shard, text in texts.items():
+        with file_lock.locked(_shard_path(runtime_dir, shard), name=SHARD_DIR_NAME):
+            write_shard_text(runtime_dir, shard, text)
+    if prune:
+        for shard in _list_shards(runtime_dir):
+            if shard not in texts:
+                with file_lock.locked(
+                    _shard_path(runtime_dir, shard), name=SHARD_DIR_NAME
+                ):
+                    write_shard_text(runtime_dir, shard, None)
+
+
+def save_store(runtime_dir: str, store: Dict[str, Dict[str, Dict[str, Any]]]) -> None:
+    layout = layout_from_env()
+    if layout == "journal":
+        write_snapshot_text(runtime_dir, dump_store(store))
+        return
+    if layout != "sharded":
+        text = dump_store(store)
+        with _store_lock(runtime_dir):
+            write_store_text(runtime_dir, text)
+        return
+    texts = {
+        shard: dump_store(content) for shard, content in split_shards(store).items()
+    }
+    write_shard_texts(runtime_dir, texts, prune=True)
+
+
 def _ensure_state(
     store: Dict[str, Any], user: str, qid: str, config: StageConfig
-) -> Dict[str, Any]:
+) -> StageState:
     user_key = _normalize_user(user)
     qid_key = _normalize_qid(qid)
     if qid_key is None:
         raise ValueError("question id is required")
     user_bucket = store.setdefault(user_key, {})
     state = user_bucket.get(qid_key)
-    if not isinstance(state, dict):
-        state = _default_question_state(config)
-        user_bucket[qid_key] = state
+    if isinstance(state, StageState):
+        return state
+    # 読み込んだ dict は最初に触れたときにコンパクト形式へ置き換える。
+    if isinstance(state, dict):
+        state = StageState.from_dict(state)
+    else:
+        state = StageState.default(config)
+    user_bucket[qid_key] = state
     return state
 
 
@@ -277,7 +827,13 @@ def _iter_session_attempts(
     return attempts
 
 
-def apply_session(store: Dict[str, Any], record: Dict[str, Any]) -> bool:
+def apply_session(
+    store: Dict[str, Any],
+    record: Dict[str, Any],
+    changes: Optional[List[Tuple[str, str]]] = None,
+) -> bool:
+    """Apply one session; ``changes`` collects the ``(user, qid)`` it modified."""
+
     user = _normalize_user(record.get("user"))
     changed = False
     config = _config_from_record(record)
@@ -290,20 +846,64 @@ def apply_session(store: Dict[str, Any], record: Dict[str, Any]) -> bool:
         except ValueError:
             continue
         ok = bool(payload.get("correct"))
-        changed |= _apply_attempt(state, attempt_dt, ok, config)
+        if _apply_attempt(state, attempt_dt, ok, config):
+            changed = True
+            if changes is not None:
+                changes.append((user, qid))
     return changed
 
 
 def update_store_from_session(runtime_dir: str, record: Dict[str, Any]) -> None:
-    store = load_store(runtime_dir)
-    changed = apply_session(store, record)
-    if changed:
-        save_store(runtime_dir, store)
+    update_store_from_sessions(runtime_dir, [record])
 
 
-def rebuild_store(
+def update_store_from_sessions(
     runtime_dir: str, records: Iterable[Dict[str, Any]]
-) -> Dict[str, Any]:
+) -> bool:
+    """Apply ``records`` in order, loading and saving each touched part once."""
+
+    layout = layout_from_env()
+    groups: Dict[str, Tuple[Any, List[Dict[str, Any]]]] = {}
+    for record in records:
+        user = record.get("user")
+        key = shard_for_user(user) if layout == "sharded" else ""
+        groups.setdefault(key, (user, []))[1].append(record)
+
+    changed_any = False
+    for user, batch in groups.values():
+        # 読み込みから保存までをロックし、他のワーカーの更新を失わないようにする。
+        with _user_lock(runtime_dir, user):
+            if layout == "journal":
+                changed = _append_sessions(runtime_dir, batch)
+            else:
+                store = load_user_store(runtime_dir, user)
+                changed = False
+                for record in batch:
+                    changed |= apply_session(store, record)
+                if changed:
+                    save_user_store(runtime_dir, user, store)
+        changed_any |= changed
+    return changed_any
+
+
+def _append_sessions(runtime_dir: str, records: List[Dict[str, Any]]) -> bool:
+    # ジャーナル形式はスナップショットを読み直さず、再生済みビューに適用して
+    # 変わった状態だけを追記する。
+    store = _journal_view(runtime_dir)
+    changes: List[Tuple[str, str]] = []
+    try:
+        for record in records:
+            apply_session(store, record, changes)
+        append_journal(runtime_dir, journal_entries(store, changes))
+    except BaseException:
+        _drop_journal_view(runtime_dir)
+        raise
+    return bool(changes)
+
+
+def build_store(records: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Replay ``records`` in time order into a fresh in-memory store."""
+
     ordered: List[Tuple[datetime, Dict[str, Any]]] = []
     for rec in records:
         fallback = rec.get("endedAt") or rec.get("receivedAt")
@@ -316,6 +916,13 @@ def rebuild_store(
     store: Dict[str, Any] = {}
     for _, rec in ordered:
         apply_session(store, rec)
+    return expand_store(store)
+
+
+def rebuild_store(
+    runtime_dir: str, records: Iterable[Dict[str, Any]]
+) -> Dict[str, Any]:
+    store = build_store(records)
     save_store(runtime_dir, store)
     return store
 
@@ -330,10 +937,7 @@ def get_question_state(
     user_bucket = store.get(user_key)
     if not isinstance(user_bucket, dict):
         return None
-    state = user_bucket.get(qid_key)
-    if not isinstance(state, dict):
-        return None
-    return state
+    return state_to_dict(user_bucket.get(qid_key))
 
 
 def get_question_states(
@@ -351,8 +955,8 @@ def get_question_states(
         qid_key = _normalize_qid(raw_qid)
         if qid_key is None:
             continue
-        state = user_bucket.get(qid_key)
-        if isinstance(state, dict):
+        state = state_to_dict(user_bucket.get(qid_key))
+        if state is not None:
             states[qid_key] = state
     return states
 
@@ -381,8 +985,22 @@ def remove_question_state(store: Dict[str, Any], user: str, qid: Any) -> bool:
 def delete_question_state(runtime_dir: str, user: str, qid: Any) -> bool:
     """Remove a stored question state and persist the change to disk."""
 
-    store = load_store(runtime_dir)
-    removed = remove_question_state(store, user, qid)
-    if removed:
-        save_store(runtime_dir, store)
-    return removed
+    journal = layout_from_env() == "journal"
+    with _user_lock(runtime_dir, user):
+        if journal:
+            store = _journal_view(runtime_dir)
+        else:
+            store = load_user_store(runtime_dir, user)
+        removed = remove_question_state(store, user, qid)
+        if not removed:
+            return False
+        if not journal:
+            save_user_store(runtime_dir, user, store)
+            return True
+        key = (_normalize_user(user), str(_normalize_qid(qid)))
+        try:
+            append_journal(runtime_dir, journal_entries(store, [key]))
+        except BaseException:
+            _drop_journal_view(runtime_dir)
+            raise
+    return True
@@ -0,0 +1,671 @@
+"""Pluggable persistence for per-subject runtime data.
+
+``STORAGE_BACKEND`` selects how results, stage states, history and level
+overrides are stored under a subject's runtime directory:
+
+* ``file`` (default) - the JSON/NDJSON files handled by ``results_log``,
+  ``stage_tracker``, ``user_state`` and ``level_store``
+* ``sqlite``         - one ``study.sqlite3`` database in WAL mode with
+  indexed tables; existing files are imported once on first use (they are
+  left in place, so switching back keeps working up to that point)
+
+With the file backend, ``STAGE_STORE_MODE=resident`` keeps ``stages.json`` in
+memory and writes it back in the background (see ``resident_stages``).
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Collection, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from . import level_store, resident_stages, results_log, stage_tracker, user_state
+from .stage_tracker import _normalize_qid, _normalize_user
+
+BACKENDS = ("file", "sqlite")
+SQLITE_FILENAME = "study.sqlite3"
+HISTORY_LIMIT = 100
+
+
+def backend_from_env() -> str:
+    value = (os.environ.get("STORAGE_BACKEND") or "file").strip().lower()
+    return value if value in BACKENDS else "file"
+
+
+def _session_attempts(record: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Per-question attempts as the ``/api/stats`` fallback counts them."""
+
+    answered = record.get("answered") or []
+    if not isinstance(answered, list):
+        return
+    fallback_at = record.get("endedAt") or record.get("receivedAt") or ""
+    for item in answered:
+        if not isinstance(item, dict):
+            continue
+        if (item.get("mode") or record.get("mode") or "normal") == "review":
+            continue
+        yield {
+            "qid": str(item.get("id") or ""),
+            "correct": bool(item.get("correct")),
+            "at": item.get("at") or fallback_at,
+        }
+
+
+class Storage(ABC):
+    """Interface shared by the storage backends (one instance per subject).
+
+    Backends must implement every abstract method; a backend that misses one
+    fails when it is constructed rather than in the middle of a request.
+    """
+
+    name = ""
+
+    def __init__(self, runtime_dir: str) -> None:
+        self.runtime_dir = runtime_dir
+
+    # --- results ---------------------------------------------------------
+    @abstractmethod
+    def append_result(self, record: Dict[str, Any]) -> None: ...
+
+    def append_results(self, records: List[Dict[str, Any]]) -> None:
+        """Store several records at once (one write / one transaction)."""
+        for record in records:
+            self.append_result(record)
+
+    @abstractmethod
+    def iter_results(
+        self,
+        users: Optional[Collection[str]] = None,
+        modes: Optional[Collection[str]] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> Iterator[Dict[str, Any]]: ...
+
+    def recent_results(self, limit: int) -> List[Dict[str, Any]]:
+        """The last ``limit`` stored records, oldest first."""
+        if limit <= 0:
+            return []
+        return list(deque(self.iter_results(), maxlen=limit))
+
+    @abstractmethod
+    def question_attempts(self, user: str, qid: str) -> List[Dict[str, Any]]:
+        """Non-review attempts of ``qid`` by exactly ``user``, in log order."""
+
+    # --- stages ----------------------------------------------------------
+    @abstractmethod
+    def load_stages(self) -> Dict[str, Dict[str, Dict[str, Any]]]: ...
+
+    @abstractmethod
+    def load_user_stages(self, user: str) -> Dict[str, Dict[str, Any]]: ...
+
+    @abstractmethod
+    def get_question_states(
+        self, user: str, qids: Iterable[Any]
+    ) -> Dict[str, Dict[str, Any]]: ...
+
+    def get_order_stats(
+        self, user: str, qids: Iterable[Any]
+    ) -> Dict[str, Dict[str, Any]]:
+        """``stage``/``streak``/``nextDueAt`` of the stored states, for ordering.
+
+        The stored dicts are passed through as they are, so ``order_builder``
+        parses only ``nextDueAt``.
+        """
+
+        return self.get_question_states(user, qids)
+
+    def get_question_state(self, user: str, qid: Any) -> Optional[Dict[str, Any]]:
+        qid_key = _normalize_qid(qid)
+        if qid_key is None:
+            return None
+        return self.get_question_states(user, [qid_key]).get(qid_key)
+
+    @abstractmethod
+    def update_stages(self, record: Dict[str, Any]) -> None: ...
+
+    def update_stages_batch(self, records: Iterable[Dict[str, Any]]) -> None:
+        """Apply several sessions in order with a single save where possible."""
+        for record in records:
+            self.update_stages(record)
+
+    @abstractmethod
+    def remove_stage(self, user: str, qid: Any) -> bool: ...
+
+    @abstractmethod
+    def replace_stages(self, store: Dict[str, Dict[str, Dict[str, Any]]]) -> None: ...
+
+    def rebuild_stages(
+        self, records: Iterable[Dict[str, Any]]
+    ) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        store = stage_tracker.build_store(records)
+        self.replace_stages(store)
+        return store
+
+    # --- history ---------------------------------------------------------
+    @abstractmethod
+    def get_history(self, user: str) -> List[Dict[str, Any]]: ...
+
+    @abstractmethod
+    def append_history(
+        self, user: str, session: Dict[str, Any], limit: int = HISTORY_LIMIT
+    ) -> None: ...
+
+    # --- levels ----------------------------------------------------------
+    @abstractmethod
+    def load_levels(self) -> Dict[str, str]: ...
+
+    @abstractmethod
+    def levels_version(self) -> Any: ...
+
+    @abstractmethod
+    def set_level(self, qid: str, level: Optional[str]) -> bool: ...
+
+
+class FileStorage(Storage):
+    name = "file"
+
+    def append_result(self, record: Dict[str, Any]) -> None:
+        results_log.append_record(self.runtime_dir, record)
+
+    def append_results(self, records: List[Dict[str, Any]]) -> None:
+        results_log.append_records(self.runtime_dir, records)
+
+    def iter_results(self, users=None, modes=None, since=None, until=None):
+        return results_log.iter_records(
+            self.runtime_dir, users=users, modes=modes, since=since, until=until
+        )
+
+    def recent_results(self, limit: int) -> List[Dict[str, Any]]:
+        return results_log.tail_records(self.runtime_dir, limit)
+
+    def question_attempts(self, user: str, qid: str) -> List[Dict[str, Any]]:
+        out = []
+        for record in self.iter_results(users={user}):
+            if record.get("user") != user:
+                continue
+            for attempt in _session_attempts(record):
+                if attempt["qid"] == qid:
+                    out.append({"correct": attempt["correct"], "at": attempt["at"]})
+        return out
+
+    def _resident(self) -> Optional[resident_stages.ResidentStageStore]:
+        if resident_stages.mode_from_env() != "resident":
+            return None
+        return resident_stages.get_store(self.runtime_dir)
+
+    def load_stages(self):
+        resident = self._resident()
+        if resident is not None:
+            return resident.snapshot()
+        return stage_tracker.load_store(self.runtime_dir)
+
+    def load_user_stages(self, user: str) -> Dict[str, Dict[str, Any]]:
+        resident = self._resident()
+        if resident is not None:
+            return resident.user_states(user)
+        store = stage_tracker.load_user_store(self.runtime_dir, user)
+        bucket = store.get(_normalize_user(user))
+        return bucket if isinstance(bucket, dict) else {}
+
+    def get_question_states(self, user, qids):
+        resident = self._resident()
+        if resident is not None:
+            return resident.get_question_states(user, qids)
+        store = stage_tracker.load_user_store(self.runtime_dir, user)
+        return stage_tracker.get_question_states(store, user, qids)
+
+    def get_order_stats(self, user, qids):
+        resident = self._resident()
+        if resident is not None:
+            return resident.get_order_stats(user, qids)
+        return super().get_order_stats(user, qids)
+
+    def update_stages(self, record: Dict[str, Any]) -> None:
+        resident = self._resident()
+        if resident is not None:
+            resident.apply([record])
+            return
+        stage_tracker.update_store_from_session(self.runtime_dir, record)
+
+    def update_stages_batch(self, records: Iterable[Dict[str, Any]]) -> None:
+        resident = self._resident()
+        if resident is not None:
+            resident.apply(records)
+            return
+        stage_tracker.update_store_from_sessions(self.runtime_dir, records)
+
+    def remove_stage(self, user: str, qid: Any) -> bool:
+        resident = self._resident()
+        if resident is not None:
+            return resident.remove(user, qid)
+        return stage_tracker.delete_question_state(self.runtime_dir, user, qid)
+
+    def replace_stages(self, store) -> None:
+        resident = self._resident()
+        if resident is not None:
+            resident.replace(store)
+            return
+        stage_tracker.save_store(self.runtime_dir, store)
+
+    def get_history(self, user: str) -> List[Dict[str, Any]]:
+        return user_state.get_history(self.runtime_dir, user)
+
+    def append_history(self, user, session, limit=HISTORY_LIMIT) -> None:
+        user_state.append_history(self.runtime_dir, user, session, limit)
+
+    def load_levels(self) -> Dict[str, str]:
+        return level_store.load_levels(self.runtime_dir)
+
+    def levels_version(self):
+        return level_store.levels_version(self.runtime_dir)
+
+    def set_level(self, qid: str, level: Optional[str]) -> bool:
+        return level_store.set_level(self.runtime_dir, qid, level)
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    ended_ts REAL,
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_user ON sessions (user, id);
+CREATE INDEX IF NOT EXISTS sessions_mode ON sessions (mode, id);
+CREATE INDEX IF NOT EXISTS sessions_ended ON sessions (ended_ts);
+CREATE TABLE IF NOT EXISTS attempts (
+    session_id INTEGER NOT NULL REFERENCES sessions (id),
+    user TEXT,
+    qid TEXT NOT NULL,
+    correct INTEGER NOT NULL,
+    at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS attempts_user_qid ON attempts (user, qid);
+CREATE TABLE IF NOT EXISTS stage_states (
+    user TEXT NOT NULL,
+    qid TEXT NOT NULL,
+    state TEXT NOT NULL,
+    PRIMARY KEY (user, qid)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user TEXT NOT NULL,
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS history_user ON history (user, id);
+CREATE TABLE IF NOT EXISTS level_overrides (
+    qid TEXT PRIMARY KEY,
+    level TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+class SqliteStorage(Storage):
+    name = "sqlite"
+
+    def __init__(self, runtime_dir: str) -> None:
+        super().__init__(runtime_dir)
+        self.path = os.path.join(runtime_dir, SQLITE_FILENAME)
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+        self._imported_on_open = False
+
+    # --- connection ------------------------------------------------------
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(self.runtime_dir, exist_ok=True)
+            # 自動コミットにして、書き込みは _write() の BEGIN IMMEDIATE で囲む。
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    conn.executescript(_SCHEMA)
+                    self._imported_on_open = self._migrate_files(conn)
+                    self._initialized = True
+        return conn
+
+    @contextmanager
+    def _write(self) -> Iterator[sqlite3.Connection]:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # --- migration -------------------------------------------------------
+    def _migrate_files(self, conn: sqlite3.Connection, force: bool = False) -> bool:
+        """Import the file backend's data once (or again with ``force``)."""
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            done = conn.execute(
+                "SELECT value FROM meta WHERE key = 'migratedAt'"
+            ).fetchone()
+            if done is not None and not force:
+                conn.execute("ROLLBACK")
+                return False
+            if force:
+                for table in (
+                    "attempts",
+                    "sessions",
+                    "stage_states",
+                    "history",
+                    "level_overrides",
+                ):
+                    conn.execute(f"DELETE FROM {table}")
+            for record in results_log.iter_records(self.runtime_dir):
+                self._insert_session(conn, record)
+            store = stage_tracker.load_store(self.runtime_dir)
+            self._insert_stages(conn, store)
+            state = user_state._load_state(self.runtime_dir)
+            for user, bucket in state.items():
+                history = bucket.get("history") if isinstance(bucket, dict) else None
+                if isinstance(history, list):
+                    # ファイルは新しい順なので、古い方から挿入する。
+                    conn.executemany(
+                        "INSERT INTO history (user, body) VALUES (?, ?)",
+                        [(user, _dumps(item)) for item in reversed(history)],
+                    )
+            conn.executemany(
+                "INSERT OR REPLACE INTO level_overrides (qid, level) VALUES (?, ?)",
+                level_store.load_levels(self.runtime_dir).items(),
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('migratedAt', ?)",
+                (datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),),
+            )
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return True
+
+    def migrate(self, force: bool = False) -> bool:
+        """Make sure the files were imported; ``True`` if this instance did it."""
+
+        conn = self._conn()
+        if force:
+            return self._migrate_files(conn, force=True)
+        return self._imported_on_open
+
+    # --- results ---------------------------------------------------------
+    @staticmethod
+    def _insert_session(conn: sqlite3.Connection, record: Dict[str, Any]) -> None:
+        dt = results_log._record_time(record)
+        cur = conn.execute(
+            "INSERT INTO sessions (user, mode, ended_ts, body) VALUES (?, ?, ?, ?)",
+            (
+                results_log._record_user(record),
+                results_log._record_mode(record),
+                dt.timestamp() if dt else None,
+                _dumps(record),
+            ),
+        )
+        raw_user = record.get("user")
+        raw_user = raw_user if isinstance(raw_user, str) else None
+        conn.executemany(
+            "INSERT INTO attempts (session_id, user, qid, correct, at)"
+            " VALUES (?, ?, ?, ?, ?)",
+            [
+                (cur.lastrowid, raw_user, a["qid"], int(a["correct"]), a["at"])
+                for a in _session_attempts(record)
+            ],
+        )
+
+    def append_result(self, record: Dict[str, Any]) -> None:
+        with self._write() as conn:
+            self._insert_session(conn, record)
+
+    def append_results(self, records: List[Dict[str, Any]]) -> None:
+        with self._write() as conn:
+            for record in records:
+                self._insert_session(conn, record)
+
+    def iter_results(self, users=None, modes=None, since=None, until=None):
+        clauses: List[str] = []
+        params: List[Any] = []
+        if users is not None:
+            values = sorted({_normalize_user(u) for u in users})
+            clauses.append(f"user IN ({','.join('?' * len(values))})")
+            params.extend(values)
+        if modes is not None:
+            values = sorted({str(m).lower() for m in modes})
+            clauses.append(f"mode IN ({','.join('?' * len(values))})")
+            params.extend(values)
+        if since is not None:
+            clauses.append("ended_ts >= ?")
+            params.append(since.timestamp())
+        if until is not None:
+            clauses.append("ended_ts <= ?")
+            params.append(until.timestamp())
+        sql = "SELECT body FROM sessions"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY id"
+        for (body,) in self._conn().execute(sql, params):
+            yield json.loads(body)
+
+    def recent_results(self, limit: int) -> List[Dict[str, Any]]:
+        if limit <= 0:
+            return []
+        rows = self._conn().execute(
+            "SELECT body FROM sessions ORDER BY id DESC LIMIT ?", (limit,)
+        )
+        return [json.loads(body) for (body,) in rows][::-1]
+
+    def question_attempts(self, user: str, qid: str) -> List[Dict[str, Any]]:
+        rows = self._conn().execute(
+            "SELECT correct, at FROM attempts WHERE user = ? AND qid = ?"
+            " ORDER BY session_id, rowid",
+            (user, qid),
+        )
+        return [{"correct": bool(correct), "at": at} for correct, at in rows]
+
+    # --- stages ----------------------------------------------------------
+    @staticmethod
+    def _insert_stages(conn: sqlite3.Connection, store: Dict[str, Any]) -> None:
+        conn.executemany(
+            "INSERT OR REPLACE INTO stage_states (user, qid, state) VALUES (?, ?, ?)",
+            [
+                (user, qid, _dumps(state))
+                for user, bucket in store.items()
+                if isinstance(bucket, dict)
+                for qid, state in bucket.items()
+                if isinstance(state, dict)
+            ],
+        )
+
+    def load_stages(self):
+        store: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        rows = self._conn().execute("SELECT user, qid, state FROM stage_states")
+        for user, qid, state in rows:
+            store.setdefault(user, {})[qid] = json.loads(state)
+        return store
+
+    def load_user_stages(self, user: str) -> Dict[str, Dict[str, Any]]:
+        rows = self._conn().execute(
+            "SELECT qid, state FROM stage_states WHERE user = ?",
+            (_normalize_user(user),),
+        )
+        return {qid: json.loads(state) for qid, state in rows}
+
+    def get_question_states(self, user, qids):
+        wanted = [q for q in (_normalize_qid(raw) for raw in qids) if q is not None]
+        if not wanted:
+            return {}
+        user_key = _normalize_user(user)
+        states: Dict[str, Dict[str, Any]] = {}
+        conn = self._conn()
+        # SQLite の変数上限を超えないよう分割して引く。
+        for start in range(0, len(wanted), 500):
+            chunk = wanted[start : start + 500]
+            rows = conn.execute(
+                "SELECT qid, state FROM stage_states WHERE user = ? AND qid IN"
+                f" ({','.join('?' * len(chunk))})",
+                [user_key, *chunk],
+            )
+            for qid, state in rows:
+                states[qid] = json.loads(state)
+        return states
+
+    @staticmethod
+    def _apply_stage_update(conn: sqlite3.Connection, record: Dict[str, Any]) -> None:
+        user_key = _normalize_user(record.get("user"))
+        qids = {
+            qid
+            for _, item in stage_tracker._iter_session_attempts(record)
+            if (qid := _normalize_qid(item.get("id"))) is not None
+        }
+        if not qids:
+            return
+        bucket: Dict[str, Dict[str, Any]] = {}
+        for qid in qids:
+            row = conn.execute(
+                "SELECT state FROM stage_states WHERE user = ? AND qid = ?",
+                (user_key, qid),
+            ).fetchone()
+            if row is not None:
+                bucket[qid] = json.loads(row[0])
+        store = {user_key: bucket}
+        changes: List[Tuple[str, str]] = []
+        if not stage_tracker.apply_session(store, record, changes):
+            return
+        conn.executemany(
+            "INSERT OR REPLACE INTO stage_states (user, qid, state) VALUES (?, ?, ?)",
+            [
+                (user_key, qid, _dumps(stage_tracker.state_to_dict(bucket[qid])))
+                for qid in dict.fromkeys(qid for _, qid in changes)
+            ],
+        )
+
+    def update_stages(self, record: Dict[str, Any]) -> None:
+        with self._write() as conn:
+            self._apply_stage_update(conn, record)
+
+    def update_stages_batch(self, records: Iterable[Dict[str, Any]]) -> None:
+        with self._write() as conn:
+            for record in records:
+                self._apply_stage_update(conn, record)
+
+    def remove_stage(self, user: str, qid: Any) -> bool:
+        qid_key = _normalize_qid(qid)
+        if qid_key is None:
+            return False
+        with self._write() as conn:
+            cur = conn.execute(
+                "DELETE FROM stage_states WHERE user = ? AND qid = ?",
+                (_normalize_user(user), qid_key),
+            )
+        return cur.rowcount > 0
+
+    def replace_stages(self, store) -> None:
+        with self._write() as conn:
+            conn.execute("DELETE FROM stage_states")
+            self._insert_stages(conn, store)
+
+    # --- history ---------------------------------------------------------
+    def get_history(self, user: str) -> List[Dict[str, Any]]:
+        rows = self._conn().execute(
+            "SELECT body FROM history WHERE user = ? ORDER BY id DESC LIMIT ?",
+            (_normalize_user(user), HISTORY_LIMIT),
+        )
+        return [json.loads(body) for (body,) in rows]
+
+    def append_history(self, user, session, limit=HISTORY_LIMIT) -> None:
+        user_key = _normalize_user(user)
+        with self._write() as conn:
+            conn.execute(
+                "INSERT INTO history (user, body) VALUES (?, ?)",
+                (user_key, _dumps(session)),
+            )
+            if limit > 0:
+                conn.execute(
+                    "DELETE FROM history WHERE user = ? AND id NOT IN"
+                    " (SELECT id FROM history WHERE user = ? ORDER BY id DESC"
+                    " LIMIT ?)",
+                    (user_key, user_key, limit),
+                )
+
+    # --- levels ----------------------------------------------------------
+    def load_levels(self) -> Dict[str, str]:
+        rows = self._conn().execute("SELECT qid, level FROM level_overrides")
+        return dict(rows.fetchall())
+
+    def levels_version(self):
+        row = (
+            self._conn()
+            .execute("SELECT value FROM meta WHERE key = 'levelsVersion'")
+            .fetchone()
+        )
+        return ("sqlite", int(row[0]) if row else 0)
+
+    def set_level(self, qid: str, level: Optional[str]) -> bool:
+        qid_key = _normalize_qid(qid)
+        if qid_key is None:
+            return False
+        with self._write() as conn:
+            if level is None or level == "":
+                cur = conn.execute(
+                    "DELETE FROM level_overrides WHERE qid = ?", (qid_key,)
+                )
+            else:
+                cur = conn.execute(
+                    "INSERT INTO level_overrides (qid, level) VALUES (?, ?)"
+                    " ON CONFLICT (qid) DO UPDATE SET level = excluded.level"
+                    " WHERE level != excluded.level",
+                    (qid_key, level),
+                )
+            changed = cur.rowcount > 0
+            if changed:
+                # 問題バンクのキャッシュキーに使う版数を進める。
+                conn.execute(
+                    "INSERT INTO meta (key, value) VALUES ('levelsVersion', 1)"
+                    " ON CONFLICT (key) DO UPDATE SET value = value + 1"
+                )
+        return changed
+
+
+_STORAGES: Dict[tuple, Storage] = {}
+_STORAGES_LOCK = threading.Lock()
+
+
+def get_storage(runtime_dir: str, backend: Optional[str] = None) -> Storage:
+    """Return the (cached) storage for ``runtime_dir``."""
+
+    name = backend or backend_from_env()
+    key = (name, os.path.abspath(runtime_dir))
+    with _STORAGES_LOCK:
+        storage = _STORAGES.get(key)
+        if storage is None:
+            cls = SqliteStorage if name == "sqlite" else FileStorage
+            storage = _STORAGES[key] = cls(runtime_dir)
+        return storage
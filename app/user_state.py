@@ -2,6 +2,7 @@ import json
 import os
 from typing import Any, Dict, List
 
+from . import file_lock
 from .stage_tracker import _normalize_user as normalize_user  # type: ignore
 
 
@@ -53,13 +54,14 @@ def get_history(runtime_dir: str, user: str) -> List[Dict[str, Any]]:
 def append_history(
     runtime_dir: str, user: str, session: Dict[str, Any], limit: int = 100
 ) -> None:
-    state = _load_state(runtime_dir)
-    bucket = _ensure_user_bucket(state, user)
-    history = bucket.get("history")
-    if not isinstance(history, list):
-        history = []
-    history.insert(0, session)
-    if limit > 0:
-        del history[limit:]
-    bucket["history"] = history
-    _save_state(runtime_dir, state)
+    with file_lock.locked(_state_file_path(runtime_dir)):
+        state = _load_state(runtime_dir)
+        bucket = _ensure_user_bucket(state, user)
+        history = bucket.get("history")
+        if not isinstance(history, list):
+            history = []
+        history.insert(0, session)
+        if limit > 0:
+            del history[limit:]
+        bucket["history"] = history
+        _save_state(runtime_dir, state)
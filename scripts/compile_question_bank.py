@@ -0,0 +1,66 @@
+"""Compile question directories into a single pre-merged artifact per subject."""
+
+import argparse
+import os
+from typing import Any, Dict, List
+
+from app.app import STATIC_DATA_DIR, normalize_subject, write_compiled_questions
+
+
+def compile_subject(subject: str) -> Dict[str, Any]:
+    """Write questions.compiled.json for ``subject`` and return the artifact."""
+    normalized = normalize_subject(subject)
+    artifact = write_compiled_questions(normalized)
+    if artifact is None:
+        raise SystemExit(
+            f"No question directory found for subject '{normalized}' "
+            "(subjects with a legacy questions.json are not compiled)."
+        )
+    return artifact
+
+
+def _discover_subjects() -> List[str]:
+    if not os.path.isdir(STATIC_DATA_DIR):
+        return []
+    return sorted(
+        name
+        for name in os.listdir(STATIC_DATA_DIR)
+        if os.path.isdir(os.path.join(STATIC_DATA_DIR, name, "questions"))
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Compile static/data/<subject>/questions/ into questions.compiled.json."
+        )
+    )
+    parser.add_argument(
+        "subjects",
+        nargs="*",
+        help="Subjects to compile (defaults to every subject with a questions/ dir).",
+    )
+
+    args = parser.parse_args()
+    subjects = args.subjects or _discover_subjects()
+    if not subjects:
+        raise SystemExit("No subjects with a questions/ directory were found.")
+
+    for subject in subjects:
+        artifact = compile_subject(subject)
+        record_count = sum(
+            len(value) for value in artifact["data"].values() if isinstance(value, list)
+        )
+        print(
+            "Compiled question bank for subject '{subject}' "
+            "(sources={sources}, records={records}, hash={digest}).".format(
+                subject=normalize_subject(subject),
+                sources=len(artifact["sources"]),
+                records=record_count,
+                digest=artifact["contentHash"][:12],
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
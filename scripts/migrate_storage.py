@@ -0,0 +1,69 @@
+"""Import the JSON/NDJSON runtime files of each subject into SQLite storage."""
+
+import argparse
+import os
+from typing import List
+
+from app.app import RUNTIME_DATA_DIR, normalize_subject, subject_runtime_dir
+from app.storage import get_storage
+
+
+def _discover_subjects() -> List[str]:
+    if not os.path.isdir(RUNTIME_DATA_DIR):
+        return []
+    return sorted(
+        name
+        for name in os.listdir(RUNTIME_DATA_DIR)
+        if os.path.isdir(os.path.join(RUNTIME_DATA_DIR, name))
+    )
+
+
+def migrate_subject(subject: str, force: bool = False) -> bool:
+    """Migrate ``subject`` and return ``True`` when data was imported."""
+    store = get_storage(subject_runtime_dir(normalize_subject(subject)), "sqlite")
+    return store.migrate(force=force)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Migrate results.ndjson, stages.json, user_state.json and levels.json"
+            " into study.sqlite3 (STORAGE_BACKEND=sqlite)."
+        )
+    )
+    parser.add_argument(
+        "subjects",
+        nargs="*",
+        help="Subjects to migrate (defaults to every directory under data/).",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Discard the SQLite contents and import the files again.",
+    )
+
+    args = parser.parse_args()
+    subjects = args.subjects or _discover_subjects()
+    if not subjects:
+        raise SystemExit("No subjects were found under the runtime data directory.")
+
+    for subject in subjects:
+        if not migrate_subject(subject, force=args.force):
+            print(f"Subject '{normalize_subject(subject)}' was already migrated.")
+            continue
+        store = get_storage(subject_runtime_dir(normalize_subject(subject)), "sqlite")
+        sessions = sum(1 for _ in store.iter_results())
+        stages = sum(len(bucket) for bucket in store.load_stages().values())
+        print(
+            "Migrated subject '{subject}' to {path} (sessions={sessions}, "
+            "stages={stages}).".format(
+                subject=normalize_subject(subject),
+                path=store.path,
+                sessions=sessions,
+                stages=stages,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,41 +1,38 @@
 #!/usr/bin/env python3
-"""Utility to rebuild the stage cache from stored result logs."""
+"""Utility to rebuild the stage cache from stored result logs or compact it."""
 
 import argparse
-from typing import Dict, Any
+import os
+import sys
+from typing import Dict, Any, List, Optional
 
-from app.app import iter_results, normalize_subject, subject_runtime_dir
-import app.stage_tracker as stage_tracker
+from app.app import (
+    iter_results,
+    normalize_subject,
+    subject_runtime_dir,
+    subject_storage,
+)
+from app.stage_tracker import STAGE_LAYOUTS, compact_journal
 
 
 def rebuild(subject: str) -> Dict[str, Any]:
     """Rebuild the stage store for the provided subject and return it."""
     normalized = normalize_subject(subject)
-    runtime_dir = subject_runtime_dir(normalized)
     records = iter_results(normalized)
     if not records:
         raise SystemExit(f"No results found for subject '{normalized}'.")
 
-    store = stage_tracker.rebuild_store(runtime_dir, records)
+    store = subject_storage(normalized).rebuild_stages(records)
     return store
 
 
-def main() -> None:
-    parser = argparse.ArgumentParser(
-        description=(
-            "Rebuild the cached stage store (stages.json) from results.ndjson for a subject."
-        )
-    )
-    parser.add_argument(
-        "subject",
-        help=(
-            "Subject identifier to rebuild (matches the directory name under data/)."
-        ),
-    )
+def compact(subject: str) -> int:
+    """Fold the stage journal of ``subject`` into its snapshot."""
+    normalized = normalize_subject(subject)
+    return compact_journal(subject_runtime_dir(normalized))
 
-    args = parser.parse_args()
-    store = rebuild(args.subject)
 
+def _print_rebuilt(subject: str, store: Dict[str, Any]) -> None:
     user_count = 0
     state_count = 0
     if isinstance(store, dict):
@@ -46,12 +43,66 @@ def main() -> None:
 
     print(
         "Rebuilt stage store for subject '{subject}' (users={users}, states={states}).".format(
-            subject=normalize_subject(args.subject),
+            subject=normalize_subject(subject),
             users=user_count,
             states=state_count,
         )
     )
 
 
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Rebuild the cached stage store from the stored results for a subject,"
+            " or compact its stage journal."
+        )
+    )
+    commands = parser.add_subparsers(dest="command")
+
+    rebuild_parser = commands.add_parser(
+        "rebuild", help="Rebuild the stage store from the results log (default)."
+    )
+    rebuild_parser.add_argument(
+        "subject",
+        help=(
+            "Subject identifier to rebuild (matches the directory name under data/)."
+        ),
+    )
+    rebuild_parser.add_argument(
+        "--layout",
+        choices=STAGE_LAYOUTS,
+        help=(
+            "File layout to write (defaults to STAGE_STORE_LAYOUT); 'sharded'"
+            " writes one file per user hash bucket under stages.d/."
+        ),
+    )
+
+    compact_parser = commands.add_parser(
+        "compact",
+        help="Fold stages.journal.ndjson into stages.json (journal layout).",
+    )
+    compact_parser.add_argument("subject", help="Subject identifier to compact.")
+
+    argv = list(sys.argv[1:] if argv is None else argv)
+    # 従来どおり `rebuild_stage_store.py english` でも再構築する。
+    if argv and argv[0] not in ("rebuild", "compact", "-h", "--help"):
+        argv.insert(0, "rebuild")
+    args = parser.parse_args(argv)
+
+    if args.command == "compact":
+        folded = compact(args.subject)
+        print(
+            f"Compacted stage journal for subject '{normalize_subject(args.subject)}'"
+            f" (entries={folded})."
+        )
+        return
+    if args.command != "rebuild":
+        parser.error("a subject is required")
+
+    if args.layout:
+        os.environ["STAGE_STORE_LAYOUT"] = args.layout
+    _print_rebuilt(args.subject, rebuild(args.subject))
+
+
 if __name__ == "__main__":
     main()
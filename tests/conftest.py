@@ -1,6 +1,75 @@
+import importlib
+import json
 import os
 import sys
 
+import pytest
+
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 if ROOT not in sys.path:
     sys.path.insert(0, ROOT)
+
+# 実行環境の設定がテストに漏れないよう、読み込みのたびに既定へ戻す変数。
+_APP_ENV = (
+    "STORAGE_BACKEND",
+    "STAGE_UPDATE_MODE",
+    "STAGE_STORE_MODE",
+    "STAGE_STORE_LAYOUT",
+)
+
+
+def make_session(user, qid, at, correct=True, **fields):
+    """One result session answering ``qid`` at ``at`` (extra keys via ``fields``)."""
+
+    session = {
+        "user": user,
+        "subject": "english",
+        "endedAt": at,
+        "answered": [{"id": qid, "correct": correct, "at": at}],
+    }
+    session.update(fields)
+    return session
+
+
+def write_bank(root, payload):
+    """Write ``payload`` as the english ``questions.json`` under ``root/static``."""
+
+    subject_dir = root / "static" / "data" / "english"
+    subject_dir.mkdir(parents=True, exist_ok=True)
+    with open(subject_dir / "questions.json", "w", encoding="utf-8") as fp:
+        json.dump(payload, fp, ensure_ascii=False)
+
+
+@pytest.fixture
+def load_app(request, tmp_path, monkeypatch):
+    """Factory importing a fresh ``app.app`` whose data lives under ``tmp_path``.
+
+    ``load_app(root=None, static=False, **env)`` sets ``DATA_DIR`` to
+    ``root/runtime`` (``root`` defaults to ``tmp_path``), resets the backend
+    selection variables and applies ``env`` (``None`` unsets a variable).
+    With ``static=True`` the static directories point at ``root/static``.
+    Parametrize the fixture indirectly with a dict to set default ``env``
+    values. The module is dropped again when the test finishes.
+    """
+
+    defaults = dict(getattr(request, "param", None) or {})
+
+    def load(root=None, static=False, **env):
+        root = root or tmp_path
+        monkeypatch.setenv("DATA_DIR", str(root / "runtime"))
+        for key in _APP_ENV:
+            monkeypatch.delenv(key, raising=False)
+        for key, value in {**defaults, **env}.items():
+            if value is None:
+                monkeypatch.delenv(key, raising=False)
+            else:
+                monkeypatch.setenv(key, str(value))
+        sys.modules.pop("app.app", None)
+        app_module = importlib.import_module("app.app")
+        if static:
+            app_module.STATIC_DIR = str(root / "static")
+            app_module.STATIC_DATA_DIR = str(root / "static" / "data")
+        return app_module
+
+    yield load
+    sys.modules.pop("app.app", None)
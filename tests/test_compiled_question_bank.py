@@ -0,0 +1,60 @@
+import importlib
+import json
+import os
+import sys
+
+
+def _load(load_app):
+    app_module = load_app(static=True)
+    sys.modules.pop("scripts.compile_question_bank", None)
+    compile_mod = importlib.import_module("scripts.compile_question_bank")
+    return app_module, compile_mod
+
+
+def _write(path, payload):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as fp:
+        json.dump(payload, fp, ensure_ascii=False)
+
+
+def test_compiled_artifact_is_preferred_while_fresh(tmp_path, monkeypatch, load_app):
+    app_module, compile_mod = _load(load_app)
+    questions_dir = tmp_path / "static" / "data" / "english" / "questions"
+    _write(questions_dir / "meta.json", {"title": "t"})
+    _write(questions_dir / "reorder" / "a.json", [{"id": "q1"}])
+    _write(questions_dir / "rewrite" / "b.json", [{"id": "w1"}])
+
+    artifact = compile_mod.compile_subject("english")
+    assert artifact["sources"] == ["meta.json", "reorder/a.json", "rewrite/b.json"]
+    assert len(artifact["contentHash"]) == 64
+    compiled_path = questions_dir.parent / "questions.compiled.json"
+    assert compiled_path.exists()
+
+    def fail(subject, *args):
+        raise AssertionError("directory should not be re-read")
+
+    monkeypatch.setattr(app_module, "_load_questions_from_directory", fail)
+    data = app_module._load_questions_file("english")
+    assert [q["id"] for q in data["questions"]] == ["q1"]
+    assert data["meta"] == {"title": "t"}
+    monkeypatch.undo()
+
+    # A source newer than the artifact makes the loader fall back.
+    source = questions_dir / "rewrite" / "b.json"
+    _write(source, [{"id": "w1"}, {"id": "w2"}])
+    stamp = os.stat(compiled_path).st_mtime_ns + 1_000_000_000
+    os.utime(source, ns=(stamp, stamp))
+    data = app_module._load_questions_file("english")
+    assert [q["id"] for q in data["rewrite"]] == ["w1", "w2"]
+
+
+def test_compiled_artifact_ignored_when_source_set_changes(tmp_path, load_app):
+    app_module, compile_mod = _load(load_app)
+    questions_dir = tmp_path / "static" / "data" / "english" / "questions"
+    _write(questions_dir / "reorder" / "a.json", [{"id": "q1"}])
+    _write(questions_dir / "reorder" / "b.json", [{"id": "q2"}])
+    compile_mod.compile_subject("english")
+
+    os.remove(questions_dir / "reorder" / "b.json")
+    data = app_module._load_questions_file("english")
+    assert [q["id"] for q in data["questions"]] == ["q1"]
@@ -0,0 +1,70 @@
+import multiprocessing
+import threading
+
+from app import file_lock, level_store, stage_tracker, user_state
+from conftest import make_session
+
+_AT = "2024-01-01T00:00:00Z"
+
+
+def _worker(runtime_dir, worker, count):
+    for n in range(count):
+        qid = f"w{worker}-q{n}"
+        stage_tracker.update_store_from_session(
+            runtime_dir, make_session("alice", qid, _AT)
+        )
+        user_state.append_history(runtime_dir, "alice", {"qid": qid}, limit=0)
+        level_store.set_level(runtime_dir, qid, "Lv2")
+
+
+def test_concurrent_workers_do_not_lose_updates(tmp_path, monkeypatch):
+    monkeypatch.delenv("STAGE_STORE_LAYOUT", raising=False)
+    runtime_dir = str(tmp_path / "english")
+    ctx = multiprocessing.get_context("fork")
+    workers = [ctx.Process(target=_worker, args=(runtime_dir, w, 15)) for w in range(4)]
+    for proc in workers:
+        proc.start()
+    for proc in workers:
+        proc.join(timeout=30)
+        assert proc.exitcode == 0
+
+    expected = {f"w{w}-q{n}" for w in range(4) for n in range(15)}
+    assert set(stage_tracker.load_store(runtime_dir)["alice"]) == expected
+    history = user_state.get_history(runtime_dir, "alice")
+    assert {entry["qid"] for entry in history} == expected
+    assert set(level_store.load_levels(runtime_dir)) == expected
+
+
+def test_lock_is_reentrant_and_reports_waits(tmp_path, load_app):
+    path = str(tmp_path / "data.json")
+    entered = threading.Event()
+    release = threading.Event()
+
+    def holder():
+        # 同じスレッドからの再取得は待たない。
+        with (
+            file_lock.locked(path, name="test-data"),
+            file_lock.locked(path, name="test-data"),
+        ):
+            entered.set()
+            release.wait(timeout=5)
+
+    thread = threading.Thread(target=holder)
+    thread.start()
+    assert entered.wait(timeout=5)
+    threading.Timer(0.05, release.set).start()
+    with file_lock.locked(path, name="test-data"):
+        pass
+    thread.join(timeout=5)
+
+    stats = file_lock.metrics()["test-data"]
+    assert stats["acquired"] == 2
+    assert stats["contended"] == 1
+    assert stats["maxWaitSeconds"] >= 0.03
+
+    app_module = load_app()
+    client = app_module.app.test_client()
+    client.post("/api/results", json=make_session("bob", "q1", _AT))
+    locks = client.get("/api/admin/metrics").get_json()["locks"]
+    assert locks["stages.json"]["acquired"] >= 1
+    assert "waitSeconds" in locks["stages.json"]
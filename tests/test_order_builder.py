@@ -432,3 +432,38 @@ def test_level_unlock_releases_next_level_after_mastery_threshold():
 
     ids = [entry.id for entry in result.order]
     assert "l2-a" in ids
+
+
+def test_question_objects_match_dict_entries():
+    raw = [
+        {"id": "a", "type": "reorder", "level": "Lv1", "unit": " U1 ", "en": "a"},
+        {"id": "b", "type": "reorder", "level": "Lv2", "unit": "U1", "en": "b"},
+        {"id": "c", "type": "reorder", "level": "Lv1", "unit": "U2", "en": "c"},
+        {"id": None, "type": "reorder", "level": "Lv1", "unit": "U1", "en": "d"},
+    ]
+    questions = [
+        order_builder.Question(
+            id=item["id"],
+            type=item["type"],
+            level=item["level"],
+            level_index=order_builder.LEVEL_ORDER.index(item["level"]),
+            unit=order_builder.normalize_unit(item["unit"]),
+            en=item["en"],
+        )
+        for item in raw
+    ]
+    assert questions[0].get("unit") == "U1"
+    assert questions[0]["level"] == "Lv1"
+    assert questions[0].get("missing", "x") == "x"
+    assert order_builder.question_key(questions[3]) == "reorder:d__"
+
+    stats = _build_stats({"a": {"stage": "D", "nextDueAt": "2000-01-01T00:00:00Z"}})
+    now = dt.datetime(2024, 1, 1)
+    from_dicts = order_builder.build_order(
+        raw, stats, total_per_set=5, unit_filter="U1", now=now
+    )
+    from_questions = order_builder.build_order(
+        questions, stats, total_per_set=5, unit_filter="U1", now=now
+    )
+    assert from_questions == from_dicts
+    assert [entry.key for entry in from_questions.order] == ["id:a", "reorder:d__"]
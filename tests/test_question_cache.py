@@ -0,0 +1,113 @@
+import json
+import os
+
+
+def _load(load_app, tmp_path):
+    app_module = load_app(static=True)
+    return app_module, tmp_path / "static" / "data" / "english" / "questions"
+
+
+def _write(path, payload):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as fp:
+        json.dump(payload, fp, ensure_ascii=False)
+
+
+def test_question_bank_is_cached_until_sources_change(tmp_path, monkeypatch, load_app):
+    app_module, questions_dir = _load(load_app, tmp_path)
+    _write(questions_dir / "reorder" / "a.json", [{"id": "q1", "level": "Lv1"}])
+
+    calls = []
+    original = app_module._load_questions_from_directory
+
+    def counting(subject, *args):
+        calls.append(subject)
+        return original(subject, *args)
+
+    monkeypatch.setattr(app_module, "_load_questions_from_directory", counting)
+
+    first = app_module._load_questions_file("english")
+    second = app_module._load_questions_file("english")
+    assert first is second
+    assert len(calls) == 1
+    assert [q["id"] for q in first["questions"]] == ["q1"]
+
+    # Size change invalidates the cache.
+    _write(
+        questions_dir / "reorder" / "a.json",
+        [{"id": "q1", "level": "Lv1"}, {"id": "q2", "level": "Lv2"}],
+    )
+    third = app_module._load_questions_file("english")
+    assert len(calls) == 2
+    assert [q["id"] for q in third["questions"]] == ["q1", "q2"]
+
+    # An added file invalidates the cache.
+    _write(questions_dir / "rewrite" / "b.json", [{"id": "w1"}])
+    fourth = app_module._load_questions_file("english")
+    assert len(calls) == 3
+    assert [q["id"] for q in fourth["rewrite"]] == ["w1"]
+
+    # A removed file invalidates the cache.
+    os.remove(questions_dir / "rewrite" / "b.json")
+    fifth = app_module._load_questions_file("english")
+    assert len(calls) == 4
+    assert fifth["rewrite"] == []
+
+
+def test_level_overrides_do_not_leak_into_cached_bank(tmp_path, load_app):
+    app_module, questions_dir = _load(load_app, tmp_path)
+    _write(questions_dir / "reorder" / "a.json", [{"id": "q1", "level": "Lv1"}])
+    client = app_module.app.test_client()
+
+    res = client.post("/api/admin/question-level", json={"id": "q1", "level": "Lv4"})
+    assert res.status_code == 200
+    payload = client.get("/data/english/questions.json").get_json()
+    assert payload["questions"][0]["level"] == "Lv4"
+
+    cached = app_module._load_questions_file("english")
+    assert cached["questions"][0]["level"] == "Lv1"
+
+
+def test_decks_are_built_lazily_and_follow_level_overrides(tmp_path, load_app):
+    app_module, questions_dir = _load(load_app, tmp_path)
+    _write(questions_dir / "reorder" / "a.json", [{"id": "q1", "level": "2"}])
+    _write(questions_dir / "rewrite" / "b.json", [{"id": "w1", "level": "Lv1"}])
+
+    deck = app_module.load_question_deck("english", "reorder")
+    assert [q["level"] for q in deck] == ["Lv2"]
+    entry = app_module._BANK_CACHE["english"]
+    assert set(entry.decks) == {"reorder"}
+    assert app_module.load_question_deck("english", "reorder") is deck
+
+    app_module.subject_storage("english").set_level("q1", "Lv5")
+    updated = app_module.load_question_deck("english", "reorder")
+    assert updated is not deck
+    assert [q["level"] for q in updated] == ["Lv5"]
+
+    assert app_module.load_question_deck("english", "unknown") == []
+    assert app_module.load_question_deck("nosuchsubject", "reorder") is None
+
+
+def test_question_index_drives_lookup_and_overlay(tmp_path, load_app):
+    app_module, questions_dir = _load(load_app, tmp_path)
+    _write(
+        questions_dir / "reorder" / "a.json",
+        [{"id": "q1", "level": "Lv1"}, {"id": 2, "level": "Lv2"}],
+    )
+    _write(questions_dir / "rewrite" / "b.json", [{"id": "w1", "level": "Lv1"}])
+
+    entry = app_module._load_questions_entry("english")
+    assert entry.index["2"] == [("questions", 1)]
+
+    view = app_module.QuestionBankView(entry, {"w1": "Lv3", "unknown": "Lv9"})
+    assert view.find("2")["level"] == "Lv2"
+    assert view.find("missing") is None
+
+    record = view.find("w1")
+    assert view.level_of(record) == "Lv3"
+    assert record["level"] == "Lv1"
+
+    payload = json.loads(view.to_json())
+    assert payload["rewrite"][0]["level"] == "Lv3"
+    assert payload["questions"] == entry.data["questions"]
+    assert entry.data["rewrite"][0]["level"] == "Lv1"
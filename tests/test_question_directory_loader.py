@@ -48,3 +48,44 @@ def test_directory_layout_exists():
 
     meta = json.loads((base / "meta.json").read_text(encoding="utf-8"))
     assert isinstance(meta, dict)
+
+
+def test_parallel_directory_load_merges_in_sorted_path_order(
+    tmp_path, monkeypatch, load_app
+):
+    import random
+    import time
+
+    mod = load_app(static=True, QUESTION_LOAD_WORKERS="4")
+
+    questions_dir = tmp_path / "static" / "data" / "english" / "questions"
+    expected = []
+    for group in ("reorder", "rewrite"):
+        (questions_dir / group).mkdir(parents=True)
+        for idx in range(6):
+            qid = f"{group}-{idx:02d}"
+            (questions_dir / group / f"{idx:02d}.json").write_text(
+                json.dumps([{"id": qid}]), encoding="utf-8"
+            )
+            expected.append(qid)
+    (questions_dir / "rewrite" / "broken.json").write_text("{", encoding="utf-8")
+
+    original = mod._read_question_file
+
+    def jittered(path):
+        time.sleep(random.random() / 100)
+        return original(path)
+
+    monkeypatch.setattr(mod, "_read_question_file", jittered)
+    data = mod._load_questions_from_directory("english")
+
+    loaded = [q["id"] for q in data["questions"]] + [q["id"] for q in data["rewrite"]]
+    assert loaded == expected
+
+
+def test_directory_load_is_serial_by_default(monkeypatch):
+    mod = importlib.import_module("app.app")
+    monkeypatch.delenv("QUESTION_LOAD_WORKERS", raising=False)
+    assert mod._question_load_workers() == 1
+    monkeypatch.setenv("QUESTION_LOAD_WORKERS", "3")
+    assert mod._question_load_workers() == 3
@@ -0,0 +1,225 @@
+import gzip
+import json
+
+from conftest import write_bank
+
+
+def init_app(load_app, tmp_path, questions_payload):
+    write_bank(tmp_path, questions_payload)
+    return load_app(static=True)
+
+
+def test_questions_json_is_serialized_once_and_revalidated(
+    tmp_path, monkeypatch, load_app
+):
+    app_module = init_app(
+        load_app, tmp_path, {"questions": [{"id": "q1", "level": "Lv1"}]}
+    )
+    client = app_module.app.test_client()
+
+    calls = []
+    original = app_module.QuestionBankView.to_json
+
+    def counting(self):
+        calls.append(1)
+        return original(self)
+
+    monkeypatch.setattr(app_module.QuestionBankView, "to_json", counting)
+
+    first = client.get("/data/english/questions.json")
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    assert etag and not etag.startswith("W/")
+    assert first.get_json()["questions"][0]["id"] == "q1"
+
+    second = client.get("/data/english/questions.json")
+    assert second.headers["ETag"] == etag
+    assert len(calls) == 1
+
+    not_modified = client.get(
+        "/data/english/questions.json", headers={"If-None-Match": etag}
+    )
+    assert not_modified.status_code == 304
+    assert not_modified.data == b""
+
+    res = client.post("/api/admin/question-level", json={"id": "q1", "level": "Lv2"})
+    assert res.status_code == 200
+
+    changed = client.get(
+        "/data/english/questions.json", headers={"If-None-Match": etag}
+    )
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert changed.get_json()["questions"][0]["level"] == "Lv2"
+    assert len(calls) == 2
+
+
+def test_questions_json_serves_precompressed_gzip(tmp_path, load_app):
+    app_module = init_app(
+        load_app,
+        tmp_path,
+        {"questions": [{"id": f"q{i}", "level": "Lv1"} for i in range(50)]},
+    )
+    client = app_module.app.test_client()
+
+    plain = client.get("/data/english/questions.json")
+    assert "Content-Encoding" not in plain.headers
+    assert "Accept-Encoding" in plain.headers.get("Vary", "")
+
+    res = client.get(
+        "/data/english/questions.json", headers={"Accept-Encoding": "gzip"}
+    )
+    assert res.status_code == 200
+    assert res.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(res.data) == plain.data
+    assert res.headers["ETag"] != plain.headers["ETag"]
+
+    entry = app_module._BANK_CACHE["english"]
+    assert entry.payload.variants["gzip"] == res.data
+
+    not_modified = client.get(
+        "/data/english/questions.json",
+        headers={"Accept-Encoding": "gzip", "If-None-Match": res.headers["ETag"]},
+    )
+    assert not_modified.status_code == 304
+
+    refused = client.get(
+        "/data/english/questions.json", headers={"Accept-Encoding": "gzip;q=0"}
+    )
+    assert "Content-Encoding" not in refused.headers
+
+
+def test_static_pages_are_compressed_once_per_version(load_app):
+    app_module = load_app()
+    client = app_module.app.test_client()
+
+    for url, name in (("/", "index.html"), ("/math.html", "math.html")):
+        res = client.get(url, headers={"Accept-Encoding": "gzip, deflate"})
+        assert res.status_code == 200
+        assert res.headers["Content-Encoding"] == "gzip"
+        with open(f"app/static/{name}", "rb") as fp:
+            assert gzip.decompress(res.data) == fp.read()
+        payload = app_module._STATIC_PAGE_CACHE[name][1]
+        again = client.get(url, headers={"Accept-Encoding": "gzip"})
+        assert app_module._STATIC_PAGE_CACHE[name][1] is payload
+        assert again.data == res.data
+
+
+def test_question_slice_endpoint_filters_and_paginates(tmp_path, load_app):
+    questions = [
+        {"id": f"a{i}", "unit": "U1", "level": "Lv1", "en": f"a{i}"} for i in range(5)
+    ]
+    questions += [{"id": "b0", "unit": "U2", "level": "Lv2", "en": "b0"}]
+    questions += [{"id": "c0", "unit": "U1", "level": "2", "en": "c0"}]
+    app_module = init_app(
+        load_app,
+        tmp_path,
+        {"questions": questions, "rewrite": [{"id": "w0", "unit": "U1"}]},
+    )
+    client = app_module.app.test_client()
+
+    res = client.get(
+        "/api/questions", query_string={"qType": "reorder", "unit": "U1", "limit": 2}
+    )
+    assert res.status_code == 200
+    page = res.get_json()
+    assert page["total"] == 6
+    assert [q["id"] for q in page["items"]] == ["a0", "a1"]
+    assert page["nextCursor"] == f"{page['version']}:2"
+    assert res.headers["X-Question-Version"] == page["version"]
+
+    ids = [q["id"] for q in page["items"]]
+    cursor = page["nextCursor"]
+    while cursor:
+        page = client.get(
+            "/api/questions",
+            query_string={
+                "qType": "reorder",
+                "unit": "U1",
+                "limit": 2,
+                "cursor": cursor,
+            },
+        ).get_json()
+        ids.extend(q["id"] for q in page["items"])
+        cursor = page["nextCursor"]
+    assert ids == ["a0", "a1", "a2", "a3", "a4", "c0"]
+
+    by_level = client.get(
+        "/api/questions", query_string={"qType": "reorder", "level": "lv2"}
+    ).get_json()
+    assert by_level["level"] == "Lv2"
+    assert [q["id"] for q in by_level["items"]] == ["b0", "c0"]
+
+    stale_cursor = client.get(
+        "/api/questions", query_string={"qType": "reorder", "limit": 2}
+    ).get_json()["nextCursor"]
+    client.post("/api/admin/question-level", json={"id": "a0", "level": "Lv2"})
+    stale = client.get(
+        "/api/questions",
+        query_string={"qType": "reorder", "limit": 2, "cursor": stale_cursor},
+    )
+    assert stale.status_code == 409
+    assert stale.get_json()["version"] != stale_cursor.split(":")[0]
+    relevelled = client.get(
+        "/api/questions", query_string={"qType": "reorder", "unit": "U1", "level": "2"}
+    ).get_json()
+    assert [q["id"] for q in relevelled["items"]] == ["a0", "c0"]
+    assert relevelled["items"][0]["level"] == "Lv2"
+
+    rewrite = client.get("/api/questions", query_string={"qType": "rewrite"})
+    assert [q["id"] for q in rewrite.get_json()["items"]] == ["w0"]
+
+    assert client.get("/api/questions", query_string={"qType": "x"}).status_code == 400
+    assert (
+        client.get("/api/questions", query_string={"cursor": "abc"}).status_code == 400
+    )
+    for level in ("bogus", "999"):
+        res = client.get("/api/questions", query_string={"level": level})
+        assert res.status_code == 400
+
+
+def test_question_delta_reports_changes_since_version(tmp_path, load_app):
+    app_module = init_app(
+        load_app,
+        tmp_path,
+        {
+            "questions": [{"id": "q1", "level": "Lv1"}, {"id": "q2", "level": "Lv1"}],
+            "rewrite": [{"id": "w1", "level": "Lv1"}],
+        },
+    )
+    client = app_module.app.test_client()
+
+    first = client.get("/data/english/questions.json")
+    version = first.headers["X-Question-Version"]
+
+    same = client.get("/api/questions/delta", query_string={"since": version})
+    assert same.get_json()["full"] is False
+    assert same.get_json()["changed"] == {}
+
+    client.post("/api/admin/question-level", json={"id": "q1", "level": "Lv3"})
+    with open(
+        tmp_path / "static" / "data" / "english" / "questions.json",
+        "w",
+        encoding="utf-8",
+    ) as fp:
+        json.dump(
+            {
+                "questions": [{"id": "q1", "level": "Lv1"}, {"id": "q3"}],
+                "rewrite": [{"id": "w1", "level": "Lv1"}],
+            },
+            fp,
+        )
+
+    delta = client.get("/api/questions/delta", query_string={"since": version})
+    body = delta.get_json()
+    assert body["full"] is False
+    assert body["version"] != version
+    assert body["changed"] == {"questions": [{"id": "q1", "level": "Lv3"}]}
+    assert body["added"] == {"questions": [{"id": "q3"}]}
+    assert body["removed"] == {"questions": ["q2"]}
+
+    latest = client.get("/data/english/questions.json")
+    assert latest.headers["X-Question-Version"] == body["version"]
+
+    unknown = client.get("/api/questions/delta", query_string={"since": "stale.0"})
+    assert unknown.get_json()["full"] is True
@@ -0,0 +1,123 @@
+import json
+import time
+
+import pytest
+from conftest import make_session
+
+pytestmark = pytest.mark.parametrize(
+    "load_app", [{"STAGE_STORE_MODE": "resident"}], indirect=True
+)
+
+
+def _read_stages(tmp_path):
+    with open(tmp_path / "runtime" / "english" / "stages.json", encoding="utf-8") as fp:
+        return json.load(fp)
+
+
+def test_resident_store_serves_reads_and_flushes_after_n_changes(
+    tmp_path, monkeypatch, load_app
+):
+    app_module = load_app(STAGE_FLUSH_AFTER="3", STAGE_FLUSH_INTERVAL="60")
+    client = app_module.app.test_client()
+    tracker = app_module.stage_tracker
+
+    writes = []
+    original_write = tracker.write_store_text
+
+    def tracking_write(runtime_dir, text):
+        writes.append(len(text))
+        return original_write(runtime_dir, text)
+
+    monkeypatch.setattr(tracker, "write_store_text", tracking_write)
+
+    first = make_session("alice", "q1", "2024-01-01T00:00Z")
+    assert client.post("/api/results", json=first).status_code == 201
+
+    # 読み込みは常にメモリから（ここからはディスクを読ませない）。
+    def no_disk(*_args, **_kwargs):
+        raise AssertionError("stages.json must not be read")
+
+    monkeypatch.setattr(tracker, "load_store", no_disk)
+
+    stats = client.get(
+        "/api/stats", query_string={"user": "alice", "id": "q1"}
+    ).get_json()
+    assert stats["answered"] == 1
+    assert stats["streak"] == 1
+    assert writes == []
+
+    for day in (2, 3):
+        res = client.post(
+            "/api/results", json=make_session("alice", "q1", f"2024-01-0{day}T00:00Z")
+        )
+        assert res.status_code == 201
+
+    resident = app_module.resident_stages.get_store(
+        str(tmp_path / "runtime" / "english")
+    )
+    deadline = time.monotonic() + 5
+    while not writes and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(writes) == 1
+    assert _read_stages(tmp_path)["alice"]["q1"]["streak"] == 3
+
+    metrics = client.get("/api/admin/metrics").get_json()["stageStore"]
+    assert metrics["mode"] == "resident"
+    assert metrics["dirty"] == 0
+    assert metrics["flushes"] == 1
+
+    # 返された状態を書き換えても常駐ストアには影響しない。
+    states = app_module.subject_storage("english").load_user_stages("alice")
+    states["q1"]["streak"] = 99
+    assert resident.user_states("alice")["q1"]["streak"] == 3
+
+
+def test_resident_store_flushes_on_interval_and_exit(tmp_path, load_app):
+    app_module = load_app(STAGE_FLUSH_AFTER="1000", STAGE_FLUSH_INTERVAL="0.05")
+    client = app_module.app.test_client()
+    stages_path = tmp_path / "runtime" / "english" / "stages.json"
+
+    client.post("/api/results", json=make_session("bob", "q1", "2024-01-01T00:00Z"))
+    deadline = time.monotonic() + 5
+    while not stages_path.exists() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert _read_stages(tmp_path)["bob"]["q1"]["streak"] == 1
+
+    resident = app_module.resident_stages.get_store(str(stages_path.parent))
+    resident.flush_interval = 60
+    client.post("/api/results", json=make_session("bob", "q2", "2024-01-01T00:00Z"))
+    assert "q2" not in _read_stages(tmp_path)["bob"]
+
+    app_module.resident_stages.flush_all()
+    assert _read_stages(tmp_path)["bob"]["q2"]["streak"] == 1
+
+
+def test_resident_store_writes_only_dirty_shards(tmp_path, monkeypatch, load_app):
+    app_module = load_app(
+        STAGE_STORE_LAYOUT="sharded",
+        STAGE_FLUSH_AFTER="1000",
+        STAGE_FLUSH_INTERVAL="60",
+    )
+    client = app_module.app.test_client()
+    tracker = app_module.stage_tracker
+    resident = app_module.resident_stages.get_store(
+        str(tmp_path / "runtime" / "english")
+    )
+
+    for user in ("alice", "bob"):
+        client.post("/api/results", json=make_session(user, "q1", "2024-01-01T00:00Z"))
+    resident.flush()
+
+    written = []
+    original_write = tracker.write_shard_text
+
+    def tracking_write(runtime_dir, shard, text):
+        written.append(shard)
+        return original_write(runtime_dir, shard, text)
+
+    monkeypatch.setattr(tracker, "write_shard_text", tracking_write)
+
+    client.post("/api/results", json=make_session("bob", "q2", "2024-01-02T00:00Z"))
+    assert resident.flush()
+    assert written == [tracker.shard_for_user("bob")]
+    assert tracker.load_user_store(resident.runtime_dir, "bob")["bob"]["q2"]
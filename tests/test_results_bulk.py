@@ -0,0 +1,85 @@
+import json
+
+from conftest import make_session
+
+
+def test_bulk_results_single_write_and_ordered_stages(tmp_path, monkeypatch, load_app):
+    app_module = load_app()
+    client = app_module.app.test_client()
+    store = app_module.subject_storage("english")
+    appender = app_module.storage.results_log.get_appender(store.runtime_dir)
+
+    commits = []
+    original_commit = type(appender)._commit
+
+    def tracking_commit(self, batch):
+        commits.append(len(batch))
+        return original_commit(self, batch)
+
+    monkeypatch.setattr(type(appender), "_commit", tracking_commit)
+
+    saves = []
+    applied = []
+    tracker = app_module.stage_tracker
+    original_save = tracker.save_store
+    original_apply = tracker.apply_session
+
+    def tracking_save(*args, **kwargs):
+        saves.append(1)
+        return original_save(*args, **kwargs)
+
+    def tracking_apply(store_dict, record, *args, **kwargs):
+        applied.append(record["endedAt"])
+        return original_apply(store_dict, record, *args, **kwargs)
+
+    monkeypatch.setattr(tracker, "save_store", tracking_save)
+    monkeypatch.setattr(tracker, "apply_session", tracking_apply)
+
+    res = client.post(
+        "/api/results/bulk",
+        json={
+            "subject": "english",
+            "sessions": [
+                make_session("alice", "q1", "2024-01-03T00:00:00Z"),
+                "broken",
+                make_session("alice", "q1", "2024-01-01T00:00:00Z", correct=False),
+                make_session("alice", "q2", "2024-01-02T00:00:00Z"),
+            ],
+        },
+    )
+    assert res.status_code == 201
+    body = res.get_json()
+    assert body["stored"] == 3
+    assert [item["ok"] for item in body["results"]] == [True, False, True, True]
+    assert body["results"][1]["index"] == 1
+
+    # 3件が1回の書き込み・1回のステージ保存にまとまる。
+    assert commits == [1]
+    assert saves == [1]
+    assert applied == [
+        "2024-01-01T00:00:00Z",
+        "2024-01-02T00:00:00Z",
+        "2024-01-03T00:00:00Z",
+    ]
+
+    path = tmp_path / "runtime" / "english" / "results.ndjson"
+    with open(path, encoding="utf-8") as fp:
+        lines = [json.loads(line) for line in fp]
+    assert [line["endedAt"][:10] for line in lines] == [
+        "2024-01-03",
+        "2024-01-01",
+        "2024-01-02",
+    ]
+    assert all(line["subject"] == "english" and line["receivedAt"] for line in lines)
+
+
+def test_bulk_results_rejects_non_array(load_app):
+    app_module = load_app()
+    client = app_module.app.test_client()
+
+    res = client.post("/api/results/bulk", json={"sessions": "nope"})
+    assert res.status_code == 400
+
+    res = client.post("/api/results/bulk", json=[1, 2])
+    assert res.status_code == 400
+    assert res.get_json()["stored"] == 0
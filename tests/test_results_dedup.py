@@ -0,0 +1,105 @@
+import json
+import os
+
+from conftest import make_session
+
+
+def _session(user, qid, at, set_index=0):
+    # 重複判定のキーには setIndex（または sessionId）が要る。
+    return make_session(user, qid, at, setIndex=set_index)
+
+
+def _stored_lines(tmp_path):
+    path = tmp_path / "runtime" / "english" / "results.ndjson"
+    with open(path, encoding="utf-8") as fp:
+        return [json.loads(line) for line in fp]
+
+
+def test_retried_session_is_stored_once(tmp_path, load_app):
+    app_module = load_app()
+    client = app_module.app.test_client()
+    session = _session("alice", "q1", "2024-01-01T00:00:00Z")
+
+    first = client.post("/api/results", json=session)
+    assert first.status_code == 201
+    retry = client.post("/api/results", json=session)
+    assert retry.status_code == 200
+    assert retry.get_json() == {"ok": True, "duplicate": True}
+
+    # 前後の空白だけ違うユーザー名は同じ人として扱う。
+    padded = _session(" alice ", "q1", "2024-01-01T00:00:00Z")
+    assert client.post("/api/results", json=padded).status_code == 200
+
+    # 別のセットや別ユーザーは重複ではない。
+    other_set = _session("alice", "q1", "2024-01-01T00:00:00Z", set_index=1)
+    assert client.post("/api/results", json=other_set).status_code == 201
+    other_user = _session("bob", "q1", "2024-01-01T00:00:00Z")
+    assert client.post("/api/results", json=other_user).status_code == 201
+
+    assert len(_stored_lines(tmp_path)) == 3
+    stages = app_module.subject_storage("english").load_user_stages("alice")
+    assert stages["q1"]["streak"] == 2
+
+    bulk = client.post(
+        "/api/results/bulk",
+        json=[session, _session("carol", "q2", "2024-01-02T00:00:00Z")] * 2,
+    )
+    assert bulk.status_code == 201
+    body = bulk.get_json()
+    assert body["stored"] == 1
+    assert [bool(item.get("duplicate")) for item in body["results"]] == [
+        True,
+        False,
+        True,
+        True,
+    ]
+    assert len(_stored_lines(tmp_path)) == 4
+
+    metrics = client.get("/api/admin/metrics").get_json()["dedup"]
+    assert metrics["duplicates"] == 5
+    assert metrics["size"] == 4
+
+
+def test_dedup_index_is_rebuilt_from_log_tail(tmp_path, load_app):
+    app_module = load_app(RESULTS_DEDUP_CAPACITY="2")
+    client = app_module.app.test_client()
+    sessions = [
+        _session("alice", f"q{day}", f"2024-01-0{day}T00:00:00Z") for day in (1, 2, 3)
+    ]
+    for session in sessions:
+        assert client.post("/api/results", json=session).status_code == 201
+
+    # 再起動相当: 索引を捨て、dedup.keys も無い状態からログの末尾で作り直す。
+    app_module.dedup_index._INDEXES.clear()
+    (tmp_path / "runtime" / "english" / "dedup.keys").unlink()
+    assert client.post("/api/results", json=sessions[2]).status_code == 200
+    assert client.post("/api/results", json=sessions[1]).status_code == 200
+    # 容量を超えた古いキーは忘れる（上限付きのメモリ）。
+    assert client.post("/api/results", json=sessions[0]).status_code == 201
+    assert len(_stored_lines(tmp_path)) == 4
+
+    index = app_module.dedup_index.get_index(app_module.subject_storage("english"))
+    assert index.metrics()["size"] == 2
+
+
+def test_dedup_keys_are_shared_between_workers(load_app):
+    app_module = load_app(RESULTS_DEDUP_CAPACITY="2")
+    store = app_module.subject_storage("english")
+    # 別プロセスのワーカーと同じく、メモリ上の索引はそれぞれ別。
+    first = app_module.dedup_index.DedupIndex(store, 2)
+    second = app_module.dedup_index.DedupIndex(store, 2)
+
+    session = _session("alice", "q1", "2024-01-01T00:00:00Z")
+    assert first.reserve(session)
+    assert not second.reserve(session)
+    first.release(session)
+    assert second.reserve(session)
+    assert not first.reserve(session)
+
+    for day in range(2, 10):
+        assert first.reserve(_session("bob", "q1", f"2024-01-0{day}T00:00:00Z"))
+    # 容量の2倍を超えたら生きているキーだけに書き直す。
+    assert os.path.getsize(first.path) <= 2 * 2 * 9 + 9
+    latest = _session("bob", "q1", "2024-01-09T00:00:00Z")
+    assert not second.reserve(latest)
+    assert second.metrics()["size"] == 2
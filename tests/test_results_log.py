@@ -0,0 +1,382 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from app import results_log
+
+
+def _read_lines(path):
+    with open(path, encoding="utf-8") as fp:
+        return [json.loads(line) for line in fp if line.strip()]
+
+
+def test_concurrent_appends_are_group_committed(tmp_path, monkeypatch):
+    appender = results_log.ResultsAppender(str(tmp_path / "results.ndjson"))
+
+    commits = []
+    original = appender._commit
+    gate = threading.Event()
+
+    def slow_commit(batch):
+        commits.append(len(batch))
+        gate.wait(timeout=5)
+        original(batch)
+
+    monkeypatch.setattr(appender, "_commit", slow_commit)
+
+    threads = [
+        threading.Thread(target=appender.append, args=(json.dumps({"n": i}),))
+        for i in range(20)
+    ]
+    for thread in threads:
+        thread.start()
+    # 最初のバッチを書いている間に残りの19件がキューに溜まるのを待つ。
+    deadline = time.monotonic() + 5
+    while len(appender._queue) < 19 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    gate.set()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    rows = _read_lines(appender.path)
+    assert sorted(row["n"] for row in rows) == list(range(20))
+    assert commits == [1, 19]
+    appender.close()
+
+
+def test_appender_reopens_replaced_file(tmp_path):
+    path = tmp_path / "results.ndjson"
+    appender = results_log.ResultsAppender(str(path), durability="fsync")
+    appender.append('{"n": 1}')
+
+    os.remove(path)
+    appender.append('{"n": 2}')
+    assert _read_lines(path) == [{"n": 2}]
+
+    with open(path, "w", encoding="utf-8") as fp:
+        fp.write('{"n": 0}\n')
+    appender.append('{"n": 3}')
+    assert _read_lines(path) == [{"n": 0}, {"n": 3}]
+    appender.close()
+
+
+def test_durability_mode_comes_from_environment(tmp_path, monkeypatch):
+    monkeypatch.setenv("RESULTS_DURABILITY", "interval")
+    monkeypatch.setenv("RESULTS_FSYNC_INTERVAL", "0.5")
+    runtime_dir = str(tmp_path / "runtime")
+    appender = results_log.get_appender(runtime_dir)
+    assert appender.durability == "interval"
+    assert appender.fsync_interval == 0.5
+    assert results_log.get_appender(runtime_dir) is appender
+
+    results_log.append_record(runtime_dir, {"user": "太郎"})
+    assert _read_lines(results_log.results_path(runtime_dir)) == [{"user": "太郎"}]
+    results_log.close_all()
+
+
+def test_interval_durability_syncs_the_tail_of_a_burst(tmp_path, monkeypatch):
+    synced = []
+    original = os.fsync
+    monkeypatch.setattr(os, "fsync", lambda fd: (synced.append(fd), original(fd)))
+    appender = results_log.ResultsAppender(
+        str(tmp_path / "results.ndjson"), durability="interval", fsync_interval=0.1
+    )
+    appender.append('{"n": 1}')
+    appender.append('{"n": 2}')
+    assert len(synced) == 1
+
+    # 後続の書き込みが無くても、間隔内にバックグラウンドで fsync される。
+    # fsync の後に _unsynced_since が消えるので、ロック下でその条件を待つ。
+    deadline = time.monotonic() + 5
+    with appender._cond:
+        while appender._unsynced_since is not None:
+            if time.monotonic() >= deadline:
+                break
+            appender._cond.wait(0.01)
+        assert appender._unsynced_since is None
+    assert len(synced) == 2
+    appender.close()
+
+
+def _session(user, ended_at, mode="normal"):
+    return {"user": user, "mode": mode, "endedAt": ended_at, "answered": []}
+
+
+def test_log_is_sealed_into_indexed_segments(tmp_path):
+    runtime_dir = tmp_path / "runtime"
+    appender = results_log.ResultsAppender(
+        results_log.results_path(str(runtime_dir)), max_segment_bytes=150
+    )
+    appender.append(json.dumps(_session("alice", "2024-01-01T00:00:00Z")))
+    appender.append(json.dumps(_session("bob", "2024-01-02T00:00:00Z", "review")))
+    appender.append(json.dumps(_session("carol", "2024-03-01T00:00:00Z")))
+    appender.close()
+
+    segments = results_log.list_segments(str(runtime_dir))
+    assert [os.path.basename(p) for p in segments] == ["seg-000001.ndjson"]
+    index = results_log.load_segment_index(segments[0])
+    assert index["count"] == 2
+    assert index["users"] == ["alice", "bob"]
+    assert index["modes"] == ["normal", "review"]
+    assert index["minEndedAt"] == "2024-01-01T00:00:00Z"
+    assert index["maxEndedAt"] == "2024-01-02T00:00:00Z"
+
+    everything = list(results_log.iter_records(str(runtime_dir)))
+    assert [r["user"] for r in everything] == ["alice", "bob", "carol"]
+
+
+def test_seal_failure_does_not_fail_committed_appends(tmp_path, monkeypatch):
+    runtime_dir = tmp_path / "runtime"
+    active = results_log.results_path(str(runtime_dir))
+    appender = results_log.ResultsAppender(active, max_segment_bytes=10)
+
+    def broken_seal(*_args, **_kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(results_log, "seal_segment", broken_seal)
+    appender.append(json.dumps(_session("alice", "2024-01-01T00:00:00Z")))
+    assert [r["user"] for r in _read_lines(active)] == ["alice"]
+
+    # 次のバッチは開き直して追記し、封印もやり直す。
+    monkeypatch.undo()
+    appender.append(json.dumps(_session("bob", "2024-01-02T00:00:00Z")))
+    appender.close()
+    users = [r["user"] for r in results_log.iter_records(str(runtime_dir))]
+    assert users == ["alice", "bob"]
+
+
+def test_seal_never_replaces_an_existing_segment(tmp_path, monkeypatch):
+    runtime_dir = str(tmp_path / "runtime")
+    active = results_log.results_path(runtime_dir)
+    appender = results_log.ResultsAppender(active)
+    appender.append(json.dumps(_session("alice", "2024-01-01T00:00:00Z")))
+    first = results_log.seal_segment(active)
+    appender.append(json.dumps(_session("bob", "2024-01-02T00:00:00Z")))
+    appender.close()
+
+    # 別のワーカーが封印した直後の古い一覧を見ても、次の番号を取る。
+    monkeypatch.setattr(results_log, "list_segments", lambda _runtime_dir: [])
+    second = results_log.seal_segment(active)
+    monkeypatch.undo()
+    assert os.path.basename(first) == "seg-000001.ndjson"
+    assert os.path.basename(second) == "seg-000002.ndjson"
+    assert [r["user"] for r in _read_lines(first)] == ["alice"]
+    assert [r["user"] for r in _read_lines(second)] == ["bob"]
+    assert not os.path.exists(active)
+
+    # 封印しようとしたファイルが既に入れ替わっていれば何もしない。
+    with open(active, "w", encoding="utf-8") as fp:
+        fp.write(json.dumps(_session("carol", "2024-01-03T00:00:00Z")) + "\n")
+    assert results_log.seal_segment(active, (0, 0)) is None
+    assert len(results_log.list_segments(runtime_dir)) == 2
+
+
+def test_iter_records_skips_segments_that_cannot_match(tmp_path, monkeypatch):
+    runtime_dir = str(tmp_path / "runtime")
+    active = results_log.results_path(runtime_dir)
+    appender = results_log.ResultsAppender(active)
+    appender.append(json.dumps(_session("alice", "2024-01-01T00:00:00Z")))
+    appender.close()
+    results_log.seal_segment(active)
+    # 索引が無いセグメントは読み込み時に作り直される。
+    os.remove(
+        results_log.list_segments(runtime_dir)[0][: -len(".ndjson")] + ".idx.json"
+    )
+
+    appender = results_log.ResultsAppender(active)
+    appender.append(json.dumps(_session("bob", "2024-02-01T00:00:00Z")))
+    appender.close()
+    results_log.seal_segment(active)
+    # 旧来の単一ファイルにそのまま残っている記録も読める。
+    with open(active, "w", encoding="utf-8") as fp:
+        fp.write(json.dumps(_session("alice", "2024-03-01T00:00:00Z")) + "\n")
+
+    assert len(list(results_log.iter_records(runtime_dir))) == 3
+    assert all(
+        os.path.exists(p[: -len(".ndjson")] + ".idx.json")
+        for p in results_log.list_segments(runtime_dir)
+    )
+
+    opened = []
+
+    def tracking(name):
+        original = getattr(results_log, name)
+
+        def wrapper(path, *args):
+            opened.append(os.path.basename(path))
+            return original(path, *args)
+
+        monkeypatch.setattr(results_log, name, wrapper)
+
+    tracking("_iter_file_records")
+    tracking("_read_at_offsets")
+
+    rows = list(results_log.iter_records(runtime_dir, users={"alice"}))
+    assert [r["endedAt"] for r in rows] == [
+        "2024-01-01T00:00:00Z",
+        "2024-03-01T00:00:00Z",
+    ]
+    assert opened == ["seg-000001.ndjson"]
+
+    opened.clear()
+    since = datetime(2024, 1, 15, tzinfo=timezone.utc)
+    rows = list(results_log.iter_records(runtime_dir, since=since))
+    assert [r["user"] for r in rows] == ["bob", "alice"]
+    assert opened == ["seg-000002.ndjson"]
+
+    opened.clear()
+    assert list(results_log.iter_records(runtime_dir, modes={"review"})) == []
+    assert opened == []
+
+
+def test_segments_roll_by_age(tmp_path, monkeypatch):
+    active = results_log.results_path(str(tmp_path))
+    appender = results_log.ResultsAppender(active, max_segment_age=60)
+    clock = [1_000.0]
+    monkeypatch.setattr(results_log.time, "time", lambda: clock[0])
+
+    appender.append(json.dumps(_session("alice", "2024-01-01T00:00:00Z")))
+    assert results_log.list_segments(str(tmp_path)) == []
+    clock[0] += 61
+    appender.append(json.dumps(_session("bob", "2024-01-01T00:01:00Z")))
+    assert len(results_log.list_segments(str(tmp_path))) == 1
+    assert not os.path.exists(active)
+
+    appender.append(json.dumps(_session("carol", "2024-01-01T00:02:00Z")))
+    rows = list(results_log.iter_records(str(tmp_path)))
+    assert [r["user"] for r in rows] == ["alice", "bob", "carol"]
+    appender.close()
+
+
+def test_prefilter_skips_decoding_lines_that_cannot_match(tmp_path, monkeypatch):
+    # 末尾キャッシュはアクティブファイルを丸ごと解析するので、ここでは切っておく。
+    monkeypatch.setenv("RESULTS_CACHE", "0")
+    runtime_dir = str(tmp_path)
+    with open(results_log.results_path(runtime_dir), "w", encoding="utf-8") as fp:
+        fp.write(json.dumps(_session("alice", "2024-01-01T00:00:00Z")) + "\n")
+        fp.write(json.dumps(_session("ボブ", "2024-01-02T00:00:00Z")) + "\n")
+        fp.write(
+            json.dumps(_session(" ボブ ", "2024-01-03T00:00:00Z", "Math-Drill")) + "\n"
+        )
+        fp.write(json.dumps({"endedAt": "2024-01-04T00:00:00Z"}) + "\n")
+
+    decoded = []
+    original = json.loads
+
+    def counting(text, *args, **kwargs):
+        decoded.append(text)
+        return original(text, *args, **kwargs)
+
+    monkeypatch.setattr(results_log.json, "loads", counting)
+
+    stream = results_log.iter_records(runtime_dir, users={"ボブ"})
+    assert not isinstance(stream, list)
+    assert [r["endedAt"] for r in stream] == [
+        "2024-01-02T00:00:00Z",
+        "2024-01-03T00:00:00Z",
+    ]
+    assert len(decoded) == 2
+
+    decoded.clear()
+    rows = list(results_log.iter_records(runtime_dir, modes={"math-drill"}))
+    assert [r["user"] for r in rows] == [" ボブ "]
+    assert len(decoded) == 1
+
+    # guest は user 欄の無い記録にも一致するので行の事前判定には使わない。
+    decoded.clear()
+    rows = list(results_log.iter_records(runtime_dir, users={"guest"}))
+    assert [r["endedAt"] for r in rows] == ["2024-01-04T00:00:00Z"]
+    assert len(decoded) == 4
+
+
+def test_tail_cache_parses_only_appended_lines(tmp_path, monkeypatch):
+    runtime_dir = str(tmp_path)
+    path = results_log.results_path(runtime_dir)
+    appender = results_log.ResultsAppender(path)
+    appender.append(json.dumps(_session("alice", "2024-01-01T00:00:00Z")))
+    appender.append(json.dumps(_session("bob", "2024-01-02T00:00:00Z")))
+
+    decoded = []
+    original = json.loads
+
+    def counting(text, *args, **kwargs):
+        decoded.append(text)
+        return original(text, *args, **kwargs)
+
+    monkeypatch.setattr(results_log.json, "loads", counting)
+
+    assert len(list(results_log.iter_records(runtime_dir))) == 2
+    assert len(decoded) == 2
+
+    decoded.clear()
+    appender.append(json.dumps(_session("carol", "2024-01-03T00:00:00Z")))
+    with open(path, "a", encoding="utf-8") as fp:
+        fp.write('{"user": "dave"')  # 書きかけの行
+    rows = list(results_log.iter_records(runtime_dir, users={"carol"}))
+    assert [r["user"] for r in rows] == ["carol"]
+    assert len(decoded) == 1
+
+    decoded.clear()
+    with open(path, "a", encoding="utf-8") as fp:
+        fp.write(', "endedAt": "2024-01-04T00:00:00Z"}\n')
+    rows = list(results_log.iter_records(runtime_dir))
+    assert [r["user"] for r in rows] == ["alice", "bob", "carol", "dave"]
+    assert len(decoded) == 1
+
+    # 同じ inode のまま書き換えられたら作り直す。
+    decoded.clear()
+    with open(path, "w", encoding="utf-8") as fp:
+        fp.write(json.dumps(_session("erin", "2024-02-01T00:00:00Z")) + "\n")
+    assert [r["user"] for r in results_log.iter_records(runtime_dir)] == ["erin"]
+    assert len(decoded) == 1
+
+    # inode が変わっても作り直す。
+    os.remove(path)
+    appender.append(json.dumps(_session("frank", "2024-02-02T00:00:00Z")))
+    assert [r["user"] for r in results_log.iter_records(runtime_dir)] == ["frank"]
+    appender.close()
+
+
+def test_user_reads_seek_to_indexed_offsets(tmp_path, monkeypatch):
+    runtime_dir = str(tmp_path)
+    active = results_log.results_path(runtime_dir)
+    appender = results_log.ResultsAppender(active)
+    for i in range(6):
+        user = "alice" if i % 3 == 0 else f"user{i}"
+        appender.append(json.dumps(_session(user, f"2024-01-0{i + 1}T00:00:00Z")))
+    results_log.seal_segment(active)
+    appender.append(json.dumps(_session("bob", "2024-02-01T00:00:00Z")))
+    appender.append(json.dumps(_session("alice", "2024-02-02T00:00:00Z")))
+
+    segment = results_log.list_segments(runtime_dir)[0]
+    index = results_log.load_segment_index(segment)
+    with open(segment, "rb") as fp:
+        lines = fp.readlines()
+    assert index["offsets"]["alice"] == [0, sum(len(line) for line in lines[:3])]
+
+    decoded = []
+    original = json.loads
+
+    def counting(text, *args, **kwargs):
+        decoded.append(text)
+        return original(text, *args, **kwargs)
+
+    monkeypatch.setattr(results_log.json, "loads", counting)
+    # 末尾キャッシュを温めてから数える。
+    list(results_log.iter_records(runtime_dir, users={"bob"}))
+    decoded.clear()
+
+    rows = list(results_log.iter_records(runtime_dir, users={"alice"}))
+    assert [r["endedAt"] for r in rows] == [
+        "2024-01-01T00:00:00Z",
+        "2024-01-04T00:00:00Z",
+        "2024-02-02T00:00:00Z",
+    ]
+    # セグメントからはアリスの2行だけを読み、アクティブ側は索引から引く。
+    assert [line for line in decoded if isinstance(line, bytes)] == [
+        lines[0].strip(),
+        lines[3].strip(),
+    ]
+    appender.close()
@@ -0,0 +1,188 @@
+import importlib
+import json
+import sys
+
+import pytest
+from conftest import make_session
+
+pytestmark = pytest.mark.parametrize(
+    "load_app", [{"STAGE_STORE_LAYOUT": "journal"}], indirect=True
+)
+
+
+def _journal_lines(runtime_dir):
+    path = runtime_dir / "stages.journal.ndjson"
+    if not path.exists():
+        return []
+    with open(path, encoding="utf-8") as fp:
+        return [json.loads(line) for line in fp if line.strip()]
+
+
+def test_journal_appends_changes_and_compacts(tmp_path, monkeypatch, load_app):
+    app_module = load_app()
+    client = app_module.app.test_client()
+    tracker = app_module.stage_tracker
+    runtime_dir = tmp_path / "runtime" / "english"
+
+    snapshots = []
+    original_write = tracker.write_store_text
+
+    def tracking_write(path, text):
+        snapshots.append(text)
+        return original_write(path, text)
+
+    monkeypatch.setattr(tracker, "write_store_text", tracking_write)
+
+    for day, user in ((1, "alice"), (2, "alice"), (3, "bob")):
+        res = client.post(
+            "/api/results", json=make_session(user, "q1", f"2024-01-0{day}T00:00Z")
+        )
+        assert res.status_code == 201
+
+    # スナップショットは書き換えず、変わった状態だけを追記する。
+    assert snapshots == []
+    assert not (runtime_dir / "stages.json").exists()
+    entries = _journal_lines(runtime_dir)
+    assert [(e["u"], e["q"]) for e in entries] == [
+        ("alice", "q1"),
+        ("alice", "q1"),
+        ("bob", "q1"),
+    ]
+    assert entries[1]["s"]["streak"] == 2
+
+    res = client.post(
+        "/api/admin/reset-progress",
+        json={"subject": "english", "user": "bob", "qid": "q1"},
+    )
+    assert res.get_json()["stageRemoved"] is True
+    assert _journal_lines(runtime_dir)[-1] == {"u": "bob", "q": "q1", "s": None}
+
+    # 書きかけの最終行は再生時に無視される。
+    with open(runtime_dir / "stages.journal.ndjson", "a", encoding="utf-8") as fp:
+        fp.write('{"u": "alice", "q": "q2", "s": {"str')
+    store = app_module.subject_storage("english").load_stages()
+    assert set(store) == {"alice"}
+    assert store["alice"]["q1"]["streak"] == 2
+
+    sys.modules.pop("scripts.rebuild_stage_store", None)
+    script = importlib.import_module("scripts.rebuild_stage_store")
+    script.main(["compact", "english"])
+
+    assert _journal_lines(runtime_dir) == []
+    with open(runtime_dir / "stages.json", encoding="utf-8") as fp:
+        assert json.load(fp) == store
+    assert app_module.subject_storage("english").load_stages() == store
+
+
+def test_journal_compacts_automatically_when_large(tmp_path, load_app):
+    app_module = load_app(STAGE_JOURNAL_MAX_BYTES="600")
+    client = app_module.app.test_client()
+    runtime_dir = tmp_path / "runtime" / "english"
+
+    for day in range(1, 8):
+        client.post(
+            "/api/results",
+            json=make_session("alice", f"q{day}", f"2024-01-0{day}T00:00Z"),
+        )
+
+    assert (runtime_dir / "stages.json").exists()
+    assert (runtime_dir / "stages.journal.ndjson").stat().st_size < 600
+    store = app_module.subject_storage("english").load_stages()
+    assert sorted(store["alice"]) == [f"q{day}" for day in range(1, 8)]
+
+
+def test_resident_store_appends_to_journal(tmp_path, load_app):
+    app_module = load_app(
+        STAGE_STORE_MODE="resident",
+        STAGE_FLUSH_AFTER="1000",
+        STAGE_FLUSH_INTERVAL="60",
+    )
+    client = app_module.app.test_client()
+    runtime_dir = tmp_path / "runtime" / "english"
+    resident = app_module.resident_stages.get_store(str(runtime_dir))
+
+    client.post("/api/results", json=make_session("alice", "q1", "2024-01-01T00:00Z"))
+    client.post("/api/results", json=make_session("alice", "q1", "2024-01-02T00:00Z"))
+    assert resident.flush()
+
+    # 同じ状態への複数回の変更は1行にまとまる。
+    assert [e["s"]["streak"] for e in _journal_lines(runtime_dir)] == [2]
+    assert app_module.stage_tracker.load_store(str(runtime_dir)) == (
+        resident.snapshot()
+    )
+
+
+def test_append_after_a_torn_line_keeps_the_new_entry(tmp_path, load_app):
+    app_module = load_app()
+    client = app_module.app.test_client()
+    tracker = app_module.stage_tracker
+    runtime_dir = tmp_path / "runtime" / "english"
+
+    client.post("/api/results", json=make_session("alice", "q1", "2024-01-01T00:00Z"))
+    # 書き込み途中で落ちた状態（改行の無い最終行）を再現する。
+    with open(runtime_dir / "stages.journal.ndjson", "a", encoding="utf-8") as fp:
+        fp.write('{"u":"alice","q":"q9","s":{"sta')
+
+    res = client.post(
+        "/api/results", json=make_session("alice", "q2", "2024-01-02T00:00Z")
+    )
+    assert res.status_code == 201
+    store = tracker.load_store(str(runtime_dir))
+    assert sorted(store["alice"]) == ["q1", "q2"]
+
+
+def test_disk_writes_only_read_new_journal_lines(tmp_path, monkeypatch, load_app):
+    app_module = load_app()
+    client = app_module.app.test_client()
+    tracker = app_module.stage_tracker
+    runtime_dir = tmp_path / "runtime" / "english"
+
+    client.post("/api/results", json=make_session("alice", "q1", "2024-01-01T00:00Z"))
+    tracker.compact_journal(str(runtime_dir))
+    client.post("/api/results", json=make_session("alice", "q2", "2024-01-02T00:00Z"))
+    # 別のワーカーの追記を再現する。
+    tracker.append_journal(
+        str(runtime_dir),
+        [{"u": "bob", "q": "q1", "s": {"stage": "E", "streak": 1}}],
+    )
+
+    reads = []
+    replayed = []
+    original_read = tracker._read_store_file
+    original_replay = tracker._replay_journal
+
+    def tracking_read(path):
+        reads.append(path)
+        return original_read(path)
+
+    def tracking_replay(runtime, store, offset=0):
+        count, end = original_replay(runtime, store, offset)
+        replayed.append(count)
+        return count, end
+
+    monkeypatch.setattr(tracker, "_read_store_file", tracking_read)
+    monkeypatch.setattr(tracker, "_replay_journal", tracking_replay)
+
+    res = client.post(
+        "/api/results", json=make_session("alice", "q3", "2024-01-03T00:00Z")
+    )
+    assert res.status_code == 201
+    # スナップショットは読み直さず、前回の書き込み以降の2行だけを再生する。
+    assert reads == []
+    assert replayed == [2]
+
+    monkeypatch.setattr(tracker, "_read_store_file", original_read)
+    monkeypatch.setattr(tracker, "_replay_journal", original_replay)
+    store = tracker.load_store(str(runtime_dir))
+    assert sorted(store["alice"]) == ["q1", "q2", "q3"]
+    assert store["bob"]["q1"]["stage"] == "E"
+
+    # 畳み込み後はスナップショットから読み直す。
+    tracker.compact_journal(str(runtime_dir))
+    client.post(
+        "/api/admin/reset-progress",
+        json={"subject": "english", "user": "alice", "qid": "q1"},
+    )
+    store = tracker.load_store(str(runtime_dir))
+    assert sorted(store["alice"]) == ["q2", "q3"]
+    assert "bob" in store
@@ -0,0 +1,57 @@
+import json
+import threading
+
+from conftest import make_session
+
+
+def test_async_stage_updates_are_batched(tmp_path, monkeypatch, load_app):
+    app_module = load_app(STAGE_UPDATE_MODE="async")
+    client = app_module.app.test_client()
+    store = app_module.subject_storage("english")
+    pipeline = app_module.stage_pipeline.get_pipeline(store)
+
+    gate = threading.Event()
+    batches = []
+    original = type(store).update_stages_batch
+
+    def gated(self, records):
+        gate.wait(timeout=5)
+        batches.append(len(records))
+        return original(self, records)
+
+    monkeypatch.setattr(type(store), "update_stages_batch", gated)
+
+    for day in range(1, 6):
+        res = client.post(
+            "/api/results",
+            json=make_session("alice", f"q{day}", f"2024-01-0{day}T00:00Z"),
+        )
+        assert res.status_code == 201
+
+    # 結果ログは書かれているが、ステージはまだ適用されていない。
+    runtime_dir = tmp_path / "runtime" / "english"
+    with open(runtime_dir / "results.ndjson", encoding="utf-8") as fp:
+        assert len(fp.readlines()) == 5
+    assert not (runtime_dir / "stages.json").exists()
+
+    metrics = client.get("/api/admin/metrics").get_json()
+    assert metrics["stageUpdates"]["mode"] == "async"
+    assert metrics["stageUpdates"]["queueDepth"] == 5
+    assert metrics["stageUpdates"]["lagSeconds"] >= 0
+
+    gate.set()
+    assert pipeline.flush(timeout=5)
+    # 最初のバッチを適用中に溜まった残りは1回の保存にまとめられる。
+    assert sum(batches) == 5
+    assert len(batches) <= 2
+
+    with open(runtime_dir / "stages.json", encoding="utf-8") as fp:
+        stages = json.load(fp)
+    assert sorted(stages["alice"]) == ["q1", "q2", "q3", "q4", "q5"]
+
+    metrics = client.get("/api/admin/metrics").get_json()["stageUpdates"]
+    assert metrics["queueDepth"] == 0
+    assert metrics["lagSeconds"] == 0.0
+    assert metrics["applied"] == 5
+    assert metrics["batches"] == len(batches)
+    assert metrics["lastBatchSize"] == batches[-1]
@@ -0,0 +1,105 @@
+import json
+import os
+
+import pytest
+from conftest import make_session
+
+pytestmark = pytest.mark.parametrize(
+    "load_app", [{"STAGE_STORE_LAYOUT": "sharded"}], indirect=True
+)
+
+
+def _state(streak):
+    return {"stage": "F", "streak": streak, "answered": streak, "correct": streak}
+
+
+def _shard_files(runtime_dir):
+    # ロック用の *.json.lock は除く。
+    names = os.listdir(os.path.join(runtime_dir, "stages.d"))
+    return sorted(name for name in names if name.endswith(".json"))
+
+
+def test_sharded_layout_migrates_and_touches_one_shard(tmp_path, monkeypatch, load_app):
+    runtime_dir = tmp_path / "runtime" / "english"
+    runtime_dir.mkdir(parents=True)
+    with open(runtime_dir / "stages.json", "w", encoding="utf-8") as fp:
+        json.dump({"alice": {"q1": _state(1)}, "bob": {"q1": _state(2)}}, fp)
+
+    app_module = load_app()
+    client = app_module.app.test_client()
+    tracker = app_module.stage_tracker
+    alice_shard = tracker.shard_for_user("alice")
+    bob_shard = tracker.shard_for_user("bob")
+    assert alice_shard != bob_shard
+
+    read, written = [], []
+    original_read = tracker._read_store_file
+    original_write = tracker.write_shard_text
+
+    def tracking_read(path):
+        read.append(os.path.basename(path))
+        return original_read(path)
+
+    def tracking_write(runtime_dir, shard, text):
+        written.append(shard)
+        return original_write(runtime_dir, shard, text)
+
+    monkeypatch.setattr(tracker, "_read_store_file", tracking_read)
+    monkeypatch.setattr(tracker, "write_shard_text", tracking_write)
+
+    res = client.post(
+        "/api/results", json=make_session("alice", "q2", "2024-01-01T00:00Z")
+    )
+    assert res.status_code == 201
+
+    # 初回アクセスで単一ファイルがシャードへ分割される。
+    assert not (runtime_dir / "stages.json").exists()
+    assert (runtime_dir / "stages.json.migrated").exists()
+    assert written == [alice_shard]
+    assert read[-1] == f"{alice_shard}.json"
+
+    read.clear()
+    stats = client.post(
+        "/api/stats/bulk", json={"user": "bob", "ids": ["q1"], "subject": "english"}
+    )
+    assert stats.status_code == 200
+    assert read == [f"{bob_shard}.json"]
+
+    read.clear()
+    written.clear()
+    res = client.post(
+        "/api/admin/reset-progress",
+        json={"subject": "english", "user": "bob", "qid": "q1"},
+    )
+    assert res.get_json()["stageRemoved"] is True
+    assert read == [f"{bob_shard}.json"]
+    # bob の状態が無くなったのでシャードファイルも消える。
+    assert written == [bob_shard]
+    assert not (runtime_dir / "stages.d" / f"{bob_shard}.json").exists()
+
+    store = app_module.subject_storage("english").load_stages()
+    assert set(store) == {"alice"}
+    assert store["alice"]["q2"]["streak"] == 1
+    assert store["alice"]["q1"]["streak"] == 1
+
+
+def test_rebuild_store_writes_shards(tmp_path, load_app):
+    app_module = load_app()
+    tracker = app_module.stage_tracker
+    runtime_dir = str(tmp_path / "runtime" / "english")
+
+    tracker.save_store(runtime_dir, {"carol": {"q9": _state(1)}})
+    carol_shard = tracker.shard_for_user("carol")
+    assert _shard_files(runtime_dir) == [f"{carol_shard}.json"]
+
+    records = [
+        make_session("alice", "q1", "2024-01-01T00:00Z"),
+        make_session("bob", "q1", "2024-01-02T00:00Z"),
+    ]
+    store = tracker.rebuild_store(runtime_dir, records)
+    assert set(store) == {"alice", "bob"}
+    assert tracker.load_store(runtime_dir) == store
+    # 再構築に含まれないユーザーのシャードは残さない。
+    assert _shard_files(runtime_dir) == sorted(
+        f"{tracker.shard_for_user(user)}.json" for user in ("alice", "bob")
+    )
@@ -0,0 +1,117 @@
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+from app import stage_tracker
+from app.stage_tracker import StageState
+from conftest import make_session
+
+
+def test_stage_state_round_trips_stored_form():
+    stored = {
+        "stage": "C",
+        "streak": 4,
+        "answered": 7,
+        "correct": 5,
+        "lastCorrectAt": "2024-01-03T04:05:06.123456Z",
+        "lastWrongAt": None,
+        "lastAttemptAt": "2024-01-03T04:05:06.123456Z",
+        "nextDueAt": "2024-01-10T04:05:06.123456Z",
+        "updatedAt": "2024-01-03T04:05:06.123456Z",
+        "note": "kept",
+    }
+    state = StageState.from_dict(stored)
+
+    assert not hasattr(state, "__dict__")
+    assert state.stage_name == "C"
+    assert isinstance(state.next_due, int)
+    assert state.next_due_datetime() == datetime(
+        2024, 1, 10, 4, 5, 6, 123456, tzinfo=timezone.utc
+    )
+    assert state.to_dict() == stored
+    assert list(state.to_dict()) == list(stored)
+    assert state.copy() == state
+
+    legacy = StageState.from_dict({"stage": "X", "streak": "2"})
+    assert legacy.stage is None
+    assert legacy.to_dict()["stage"] == "X"
+    assert legacy.to_dict()["streak"] == 2
+
+
+def test_apply_session_uses_epoch_timestamps(monkeypatch):
+    store = {}
+    for at in ("2024-01-01T00:00Z", "2024-01-01T00:01Z", "2024-01-01T00:02Z"):
+        stage_tracker.apply_session(store, make_session("alice", "q1", at))
+
+    # 試行時刻の解析だけを数える（保存済み状態の ISO は読み直さない）。
+    calls = []
+    original = stage_tracker._parse_iso
+
+    def counting(value):
+        calls.append(value)
+        return original(value)
+
+    monkeypatch.setattr(stage_tracker, "_parse_iso", counting)
+    changes = []
+    stage_tracker.apply_session(
+        store, make_session("alice", "q1", "2024-01-02T00:02Z"), changes
+    )
+    assert changes == [("alice", "q1")]
+    assert calls == ["2024-01-02T00:02Z"]
+
+    state = store["alice"]["q1"]
+    assert isinstance(state, StageState)
+    assert stage_tracker.get_question_state(store, "alice", "q1") == {
+        "stage": "D",
+        "streak": 4,
+        "answered": 4,
+        "correct": 4,
+        "lastCorrectAt": "2024-01-02T00:02:00Z",
+        "lastWrongAt": None,
+        "lastAttemptAt": "2024-01-02T00:02:00Z",
+        "nextDueAt": "2024-01-04T00:02:00Z",
+        "updatedAt": "2024-01-02T00:02:00Z",
+    }
+    assert json.loads(stage_tracker.dump_store(store)) == stage_tracker.expand_store(
+        store
+    )
+
+
+@pytest.mark.parametrize("mode", ["disk", "resident"])
+def test_order_stats_skip_full_state_parsing(tmp_path, monkeypatch, load_app, mode):
+    app_module = load_app(static=True, STAGE_STORE_MODE=mode, STAGE_FLUSH_INTERVAL="60")
+    questions = tmp_path / "static" / "data" / "english" / "questions" / "reorder"
+    questions.mkdir(parents=True)
+    with open(questions / "a.json", "w", encoding="utf-8") as fp:
+        json.dump([{"id": "q1", "level": "Lv1"}, {"id": "q2", "level": "Lv1"}], fp)
+    client = app_module.app.test_client()
+
+    for at in ("2024-01-01T00:00Z", "2024-01-01T00:01Z", "2024-01-01T00:02Z"):
+        assert (
+            client.post("/api/results", json=make_session("bob", "q1", at)).status_code
+            == 201
+        )
+    stats = app_module.subject_storage("english").get_order_stats("bob", ["q1", "q2"])
+    assert list(stats) == ["q1"]
+    assert stats["q1"]["stage"] == "E"
+    if mode == "resident":
+        # 常駐ストアはコンパクト形式から datetime のまま渡す。
+        assert isinstance(stats["q1"]["nextDueAt"], datetime)
+        monkeypatch.setattr(stage_tracker, "_parse_iso", _fail)
+    else:
+        # ディスクから読んだ dict はそのまま渡し、nextDueAt 以外は解析しない。
+        assert stats["q1"]["nextDueAt"] == "2024-01-02T00:02:00Z"
+        monkeypatch.setattr(StageState, "from_dict", _fail)
+
+    response = client.post(
+        "/api/order",
+        json={"user": "bob", "subject": "english", "qType": "reorder", "total": 2},
+    )
+    assert response.status_code == 200
+    stages = {entry["id"]: entry["stage"] for entry in response.get_json()["order"]}
+    assert stages == {"q1": "E", "q2": "F"}
+
+
+def _fail(*_args, **_kwargs):
+    raise AssertionError("stored states must not be parsed in full")
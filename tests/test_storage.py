@@ -0,0 +1,142 @@
+import importlib
+import json
+import sqlite3
+from datetime import datetime, timezone
+
+import pytest
+from conftest import make_session, write_bank
+
+_BANK = {"questions": [{"id": "q1", "level": "Lv1"}, {"id": "q2"}]}
+
+
+def _load(load_app, root, backend):
+    write_bank(root, _BANK)
+    return load_app(root, static=True, STORAGE_BACKEND=backend)
+
+
+def _exercise(client):
+    """Drive every storage-backed endpoint and collect the responses."""
+
+    out = {}
+    client.post(
+        "/api/results", json=make_session("alice", "q1", "2024-05-01T00:00:00Z")
+    )
+    client.post(
+        "/api/results",
+        json=make_session("alice", "q1", "2024-05-02T00:00:00Z", correct=False),
+    )
+    client.post("/api/results", json=make_session("bob", "q2", "2024-05-03T00:00:00Z"))
+    client.post("/api/history", json={"user": "alice", "session": {"n": 1}})
+    client.post("/api/history", json={"user": "alice", "session": {"n": 2}})
+    out["history"] = client.get("/api/history?user=alice").get_json()
+    out["bulk"] = client.post(
+        "/api/stats/bulk", json={"user": "alice", "ids": ["q1", "q2"]}
+    ).get_json()
+    out["fallback"] = client.get("/api/stats?user=bob&id=q1").get_json()
+    client.post("/api/admin/question-level", json={"id": "q2", "level": "Lv3"})
+    bank = client.get("/data/english/questions.json").get_json()
+    out["levels"] = [q.get("level") for q in bank["questions"]]
+    out["reset"] = client.post(
+        "/api/admin/reset-progress", json={"user": "alice", "id": "q1"}
+    ).get_json()
+    out["after_reset"] = client.post(
+        "/api/stats/bulk", json={"user": "alice", "ids": ["q1"]}
+    ).get_json()
+    return out
+
+
+def test_sqlite_backend_matches_file_backend(tmp_path, load_app):
+    file_app = _load(load_app, tmp_path / "file", "file")
+    expected = _exercise(file_app.app.test_client())
+
+    sqlite_app = _load(load_app, tmp_path / "sqlite", "sqlite")
+    actual = _exercise(sqlite_app.app.test_client())
+
+    assert actual == expected
+    assert expected["levels"] == ["Lv1", "Lv3"]
+    assert expected["reset"]["stageRemoved"] is True
+
+    runtime_dir = tmp_path / "sqlite" / "runtime" / "english"
+    assert (runtime_dir / "study.sqlite3").exists()
+    assert not (runtime_dir / "results.ndjson").exists()
+    assert not (runtime_dir / "stages.json").exists()
+    with sqlite3.connect(runtime_dir / "study.sqlite3") as conn:
+        mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        attempts = conn.execute(
+            "SELECT user, qid, correct FROM attempts ORDER BY session_id"
+        ).fetchall()
+    assert mode == "wal"
+    assert attempts == [("alice", "q1", 1), ("alice", "q1", 0), ("bob", "q2", 1)]
+
+
+def test_sqlite_backend_imports_existing_files_once(tmp_path, load_app):
+    runtime_dir = tmp_path / "runtime" / "english"
+    runtime_dir.mkdir(parents=True)
+    with open(runtime_dir / "results.ndjson", "w", encoding="utf-8") as fp:
+        fp.write(json.dumps(make_session("alice", "q1", "2024-01-01T00:00:00Z")))
+        fp.write("\n")
+    with open(runtime_dir / "stages.json", "w", encoding="utf-8") as fp:
+        json.dump({"alice": {"q1": {"stage": "E", "answered": 1}}}, fp)
+    with open(runtime_dir / "user_state.json", "w", encoding="utf-8") as fp:
+        json.dump({"alice": {"history": [{"n": 2}, {"n": 1}]}}, fp)
+    with open(runtime_dir / "levels.json", "w", encoding="utf-8") as fp:
+        json.dump({"q1": "Lv4"}, fp)
+
+    app_module = _load(load_app, tmp_path, "sqlite")
+    client = app_module.app.test_client()
+    store = app_module.subject_storage("english")
+    assert store.name == "sqlite"
+
+    assert [r["user"] for r in app_module.iter_results("english")] == ["alice"]
+    assert store.get_question_state("alice", "q1")["stage"] == "E"
+    assert client.get("/api/history?user=alice").get_json() == {
+        "history": [{"n": 2}, {"n": 1}]
+    }
+    bank = client.get("/data/english/questions.json").get_json()
+    assert bank["questions"][0]["level"] == "Lv4"
+
+    # 取り込みは一度だけ。以後の書き込みは SQLite にだけ入る。
+    client.post("/api/results", json=make_session("bob", "q2", "2024-01-02T00:00:00Z"))
+    assert store.migrate() is True
+    assert len(app_module.iter_results("english")) == 2
+    with open(runtime_dir / "results.ndjson", encoding="utf-8") as fp:
+        assert len(fp.readlines()) == 1
+
+    migrate_mod = importlib.import_module("scripts.migrate_storage")
+    assert migrate_mod.migrate_subject("english", force=True) is True
+    assert [r["user"] for r in app_module.iter_results("english")] == ["alice"]
+
+
+@pytest.mark.parametrize("backend", ["file", "sqlite"])
+def test_result_filters_behave_the_same(tmp_path, backend, load_app):
+    app_module = _load(load_app, tmp_path, backend)
+    client = app_module.app.test_client()
+    client.post(
+        "/api/results", json=make_session("alice", "q1", "2024-01-01T00:00:00Z")
+    )
+    review = make_session(" bob ", "q1", "2024-02-01T00:00:00Z")
+    review["mode"] = "Review"
+    client.post("/api/results", json=review)
+    client.post("/api/results", json={"answered": []})
+
+    def users(**filters):
+        return [r.get("user") for r in app_module.stream_results("english", **filters)]
+
+    assert users(users={"bob"}) == [" bob "]
+    assert users(users={"guest"}) == [None]
+    assert users(modes={"review"}) == [" bob "]
+    # receivedAt（サーバー時刻）は endedAt が無いときの代わりになる。
+    assert users(since=datetime(2024, 1, 15, tzinfo=timezone.utc)) == [" bob ", None]
+    assert users(until=datetime(2024, 1, 15, tzinfo=timezone.utc)) == ["alice"]
+
+
+def test_backend_missing_a_method_fails_at_construction(tmp_path):
+    from app import storage
+
+    class NoLevels(storage.FileStorage):
+        set_level = storage.Storage.set_level
+
+    with pytest.raises(TypeError, match="set_level"):
+        NoLevels(str(tmp_path))
+    assert not storage.FileStorage.__abstractmethods__
+    assert not storage.SqliteStorage.__abstractmethods__